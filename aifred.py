@@ -1,17 +1,304 @@
 #!/usr/bin/env python3
 
+import hashlib
+import io
 import json
+import multiprocessing as mp
+import queue
+import re
 import sqlite3
 import sys
 import os
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from datetime import datetime
 from pathlib import Path
 from typing import Optional
 
-from store import Store
+from store import ARCHIVE_AFTER_DAYS, SHARD_BY_PROFILE, Store, shard_path
+from utils.config import get_defaults
+from utils.db import vacuum
+from utils.export import FORMATS as EXPORT_FORMATS, RENDERERS, export_threads
+from utils.fts import fts_query
+from utils.jsonstream import iter_array_items, iter_array_raw
+from utils.stats import report as usage_report
+
+
+def extract_chatgpt_text(mapping) -> str:
+    """Concatenate the text parts of every message node in a ChatGPT mapping."""
+    texts = []
+    for node in (mapping or {}).values():
+        message = (node or {}).get('message') or {}
+        parts = (message.get('content') or {}).get('parts') or []
+        for part in parts:
+            if isinstance(part, str) and part.strip():
+                texts.append(part)
+    return "\n".join(texts)
+
+
+def extract_claude_text(chat_messages) -> str:
+    """Concatenate message text from a Claude export's chat_messages list."""
+    texts = []
+    for message in chat_messages or []:
+        text = message.get('text')
+        if not text:
+            blocks = message.get('content') or []
+            text = "\n".join(b.get('text', '') for b in blocks if isinstance(b, dict) and b.get('type') == 'text')
+        if text and text.strip():
+            texts.append(text)
+    return "\n".join(texts)
+
+
+def _iso(value):
+    # ChatGPT uses epoch seconds, Claude ISO strings
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value).isoformat()
+    return value
+
+
+def flatten_chatgpt(mapping, current_node=None, branches=False):
+    """Flatten a ChatGPT mapping tree into imported_messages rows.
+
+    Returns (branch, position, node_id, parent_node_id, role, content,
+    created_at) tuples. Branch 0 is the canonical path from the root to
+    ``current_node`` (the branch the user last saw; without it, the last
+    child is followed from the root). With ``branches=True`` every other leaf
+    adds a side branch holding only the nodes after it diverges; its
+    positions continue from the fork point. Nodes without text (the empty
+    root, tool plumbing) are skipped.
+    """
+    mapping = mapping or {}
+
+    def children(node_id):
+        return [c for c in (mapping.get(node_id) or {}).get('children') or [] if c in mapping]
+
+    def path_up(node_id, stop=()):
+        path, seen = [], set()
+        while node_id in mapping and node_id not in seen and node_id not in stop:
+            seen.add(node_id)
+            path.append(node_id)
+            node_id = (mapping[node_id] or {}).get('parent')
+        path.reverse()
+        return path, node_id
+
+    leaf = current_node if current_node in mapping else None
+    if leaf is None:
+        roots = [k for k, n in mapping.items() if (n or {}).get('parent') not in mapping]
+        leaf = roots[0] if roots else None
+        while leaf is not None and children(leaf):
+            leaf = children(leaf)[-1]
+
+    rows = []
+    position_after = {}  # node id -> next free position after it on its branch
+
+    def emit(branch, node_ids, position):
+        for node_id in node_ids:
+            node = mapping[node_id] or {}
+            message = node.get('message') or {}
+            parts = (message.get('content') or {}).get('parts') or []
+            text = "\n".join(p for p in parts if isinstance(p, str) and p.strip())
+            if text:
+                role = (message.get('author') or {}).get('role') or 'user'
+                rows.append((branch, position, node_id, node.get('parent'), role, text, _iso(message.get('create_time'))))
+                position += 1
+            position_after[node_id] = position
+
+    canonical, _ = path_up(leaf)
+    emit(0, canonical, 0)
+    if branches:
+        on_path = set(canonical)
+        side_leaves = [k for k in mapping if k not in on_path and not children(k)]
+        for branch, side_leaf in enumerate(side_leaves, start=1):
+            suffix, fork = path_up(side_leaf, stop=on_path)
+            emit(branch, suffix, position_after.get(fork, 0))
+    return rows
+
+
+def flatten_claude(chat_messages):
+    """Claude exports are already linear: one canonical branch in list order."""
+    rows = []
+    for message in chat_messages or []:
+        text = message.get('text')
+        if not text:
+            blocks = message.get('content') or []
+            text = "\n".join(b.get('text', '') for b in blocks if isinstance(b, dict) and b.get('type') == 'text')
+        if not text or not text.strip():
+            continue
+        role = 'user' if message.get('sender') == 'human' else (message.get('sender') or 'assistant')
+        rows.append((0, len(rows), message.get('uuid'), message.get('parent_message_uuid'), role, text, message.get('created_at')))
+    return rows
+
+
+def chatgpt_row(conversation, branches=False):
+    """Map one ChatGPT export conversation to its conversations, conversation_text and imported_messages rows."""
+    conv_id = conversation.get('id', str(conversation.get('create_time', '')))
+    title = conversation.get('title', 'Untitled')
+    created_at = datetime.fromtimestamp(conversation.get('create_time', 0)).isoformat()
+    updated_at = datetime.fromtimestamp(conversation.get('update_time', 0)).isoformat()
+    mapping = conversation.get('mapping', {})
+    messages = flatten_chatgpt(mapping, conversation.get('current_node'), branches)
+    return (conv_id, title, 'chatgpt', created_at, updated_at, json.dumps(mapping), extract_chatgpt_text(mapping), messages)
+
+
+def claude_row(conversation, branches=False):
+    """Map one Claude export conversation to its conversations, conversation_text and imported_messages rows."""
+    conv_id = conversation.get('uuid', conversation.get('id', ''))
+    title = conversation.get('name', 'Untitled')
+    created_at = conversation.get('created_at', datetime.now().isoformat())
+    updated_at = conversation.get('updated_at', created_at)
+    chat_messages = conversation.get('chat_messages', [])
+    messages = flatten_claude(chat_messages)
+    return (conv_id, title, 'claude', created_at, updated_at, json.dumps(chat_messages), extract_claude_text(chat_messages), messages)
+
+
+ROW_BUILDERS = {'chatgpt': chatgpt_row, 'claude': claude_row}
+PLATFORM_LABELS = {'chatgpt': 'ChatGPT', 'claude': 'Claude'}
+
+# Conversations per executemany/commit during import
+IMPORT_BATCH_SIZE = int(os.getenv('AIFRED_IMPORT_BATCH', '500'))
+IMPORT_WORKERS = int(os.getenv('AIFRED_IMPORT_WORKERS', '1'))
+# Conversations per worker task: large enough to amortise pickling, small
+# enough that the writer is never starved.
+IMPORT_CHUNK = 64
+
+_UPSERT_CONVERSATION = '''
+    INSERT INTO conversations (id, title, platform, created_at, updated_at, messages, content_hash)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        title = excluded.title, platform = excluded.platform,
+        created_at = excluded.created_at, updated_at = excluded.updated_at,
+        messages = excluded.messages, content_hash = excluded.content_hash
+'''
+_UPSERT_TEXT = '''
+    INSERT INTO conversation_text (conv_id, title, body) VALUES (?, ?, ?)
+    ON CONFLICT(conv_id) DO UPDATE SET title = excluded.title, body = excluded.body
+'''
+_INSERT_MESSAGE = '''
+    INSERT INTO imported_messages (conv_id, branch, position, node_id, parent_node_id, role, content, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+_CONVERSATION_ENTRY = re.compile(r'(^|/)conversations(-\d+)?\.json$')
+
+
+def iter_export_sources(paths):
+    """Yield (name, signature, text stream) for each JSON export in ``paths``.
+
+    Zip archives are read entry by entry without extracting them: the
+    conversations.json (or split conversations-NNN.json) entries, or every
+    .json entry when there are none. The signature (size plus mtime or CRC)
+    changes whenever the source content does.
+    """
+    for path in paths:
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as zf:
+                names = [n for n in zf.namelist() if _CONVERSATION_ENTRY.search(n)]
+                for name in names or [n for n in zf.namelist() if n.endswith('.json')]:
+                    info = zf.getinfo(name)
+                    with zf.open(name) as raw:
+                        yield f"{os.path.abspath(path)}:{name}", f"{info.file_size}:{info.CRC}", io.TextIOWrapper(raw, encoding='utf-8')
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                st = os.fstat(f.fileno())
+                yield os.path.abspath(path), f"{st.st_size}:{st.st_mtime_ns}", f
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def content_hash(raw, branches=False):
+    """SHA-256 of a conversation's raw export JSON and the options that shape its rows.
+
+    Hashing the raw text means an unchanged conversation is recognised
+    without building or writing its rows. The parallel import also skips
+    parsing it, because its splitter doesn't decode.
+    """
+    digest = hashlib.sha256(raw.encode('utf-8'))
+    if branches:
+        digest.update(b'\0branches')
+    return digest.hexdigest()
+
+
+# State of a parallel-import worker process, set by the pool initializer
+_WORKER = {}
+
+
+def _import_worker_init(platform, branches, rows_queue):
+    _WORKER.update(build_row=ROW_BUILDERS[platform], branches=branches, rows_queue=rows_queue)
+
+
+def _import_worker(items):
+    """Parse and normalise one chunk of (raw conversation, content hash) pairs.
+
+    Rows go straight to the writer's queue rather than back through the
+    parent; returns (rows built, conversations skipped).
+    """
+    rows, skipped = [], 0
+    for raw, digest in items:
+        try:
+            rows.append(_WORKER['build_row'](json.loads(raw), _WORKER['branches']) + (digest,))
+        except Exception as e:
+            print(f"⚠️ Warning: Skipped conversation due to error: {e}")
+            skipped += 1
+    if rows:
+        _WORKER['rows_queue'].put(rows)
+    return len(rows), skipped
+
+
+def _import_writer(db_path, rows_queue, results, batch_size):
+    """Single writer process: drain row chunks into SQLite until a None sentinel."""
+    db = AifredDB(db_path)
+    conn = sqlite3.connect(db_path)
+    written, changed, pending, error = 0, 0, [], None
+    started = time.perf_counter()
+
+    def flush():
+        nonlocal written, changed, pending
+        changed += db._write_rows(conn, pending)
+        conn.commit()
+        written += len(pending)
+        pending = []
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        print(f"⏳ Processed {written} conversations ({written / elapsed:.0f} conv/s)...")
+
+    while True:
+        rows = rows_queue.get()
+        if rows is None:
+            break
+        if error:
+            continue  # keep draining so workers never block on a full queue
+        pending.extend(rows)
+        try:
+            if len(pending) >= batch_size:
+                flush()
+        except Exception as e:
+            error = str(e)
+    try:
+        if pending and not error:
+            flush()
+    except Exception as e:
+        error = str(e)
+    conn.close()
+    results.put((written, changed, error))
+
 
 class AifredDB:
-    def __init__(self):
+    def __init__(self, db_path=None):
+        if db_path:
+            self.db_path = Path(db_path)
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self.init_db()
+            return
         # Use Alfred's recommended data directory
         data_dir = os.getenv('alfred_workflow_data')
         if not data_dir:
@@ -38,126 +325,385 @@ class AifredDB:
                 is_pinned INTEGER DEFAULT 0
             )
         ''')
+        if 'content_hash' not in {row[1] for row in conn.execute("PRAGMA table_info(conversations)")}:
+            conn.execute("ALTER TABLE conversations ADD COLUMN content_hash TEXT")
+        # Progress of an interrupted import, per source file (or zip entry).
+        # Written in the same transaction as each batch, removed when the
+        # source completes; the signature detects a changed file.
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS import_checkpoints (
+                source TEXT PRIMARY KEY,
+                signature TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                new INTEGER NOT NULL DEFAULT 0,
+                changed INTEGER NOT NULL DEFAULT 0,
+                unchanged INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        # Extracted plain text per conversation. This is the external content
+        # table behind conversations_fts; its INTEGER PRIMARY KEY keeps rowids
+        # stable across VACUUM, which the FTS index relies on.
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS conversation_text (
+                rowid INTEGER PRIMARY KEY,
+                conv_id TEXT NOT NULL UNIQUE,
+                title TEXT,
+                body TEXT
+            )
+        ''')
+        # One row per message of an imported conversation, so single messages
+        # and "last N" reads are index lookups instead of parsing the JSON blob.
+        # Branch 0 is the canonical path; side branches are optional.
+        has_messages = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'imported_messages'"
+        ).fetchone()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS imported_messages (
+                id INTEGER PRIMARY KEY,
+                conv_id TEXT NOT NULL,
+                branch INTEGER NOT NULL DEFAULT 0,
+                position INTEGER NOT NULL,
+                node_id TEXT,
+                parent_node_id TEXT,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at TEXT,
+                UNIQUE (conv_id, branch, position)
+            )
+        ''')
+        has_fts = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversations_fts'"
+        ).fetchone()
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+                title, body,
+                content='conversation_text', content_rowid='rowid',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        ''')
+        conn.executescript('''
+            CREATE TRIGGER IF NOT EXISTS conversation_text_ai AFTER INSERT ON conversation_text BEGIN
+              INSERT INTO conversations_fts(rowid, title, body) VALUES (new.rowid, new.title, new.body);
+            END;
+            CREATE TRIGGER IF NOT EXISTS conversation_text_ad AFTER DELETE ON conversation_text BEGIN
+              INSERT INTO conversations_fts(conversations_fts, rowid, title, body) VALUES ('delete', old.rowid, old.title, old.body);
+            END;
+            CREATE TRIGGER IF NOT EXISTS conversation_text_au AFTER UPDATE ON conversation_text BEGIN
+              INSERT INTO conversations_fts(conversations_fts, rowid, title, body) VALUES ('delete', old.rowid, old.title, old.body);
+              INSERT INTO conversations_fts(rowid, title, body) VALUES (new.rowid, new.title, new.body);
+            END;
+            CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations(updated_at);
+        ''')
+        if not has_fts:
+            # Persist the ranking so ORDER BY rank uses it: title hits weigh 5x.
+            # FTS5 then only runs snippet() on the rows that survive the LIMIT.
+            conn.execute("INSERT INTO conversations_fts(conversations_fts, rank) VALUES ('rank', 'bm25(5.0, 1.0)')")
+            self._backfill_text(conn)
+        if not has_messages:
+            self._backfill_messages(conn)
         conn.commit()
         conn.close()
-    
-    def import_chatgpt_export(self, export_path):
+
+    def _iter_stored(self, conn):
+        # (id, title, platform, parsed messages blob) for every stored conversation
+        for conv_id, title, platform, messages in conn.execute(
+            "SELECT id, title, platform, messages FROM conversations"
+        ).fetchall():
+            try:
+                data = json.loads(messages or 'null')
+            except json.JSONDecodeError:
+                data = None
+            yield conv_id, title, platform, data
+
+    def _backfill_text(self, conn):
+        # Index conversations imported before the full-text index existed
+        for conv_id, title, platform, data in self._iter_stored(conn):
+            body = extract_claude_text(data) if platform == 'claude' else extract_chatgpt_text(data)
+            self._index_text(conn, conv_id, title, body)
+
+    def _backfill_messages(self, conn):
+        # Flatten conversations imported before imported_messages existed. The
+        # stored ChatGPT blob lacks current_node, so the last child is followed.
+        for conv_id, _, platform, data in self._iter_stored(conn):
+            rows = flatten_claude(data) if platform == 'claude' else flatten_chatgpt(data)
+            conn.executemany(_INSERT_MESSAGE, [(conv_id,) + r for r in rows])
+
+    def _index_text(self, conn, conv_id, title, body):
+        conn.execute(_UPSERT_TEXT, (conv_id, title, body))
+
+    def _store_conversation(self, conn, conv_id, title, platform, created_at, updated_at, messages, body, message_rows=(), digest=None):
+        self._write_rows(conn, [(conv_id, title, platform, created_at, updated_at, messages, body, message_rows, digest)])
+
+    def _known_hashes(self, conn):
+        return {row[0] for row in conn.execute("SELECT content_hash FROM conversations WHERE content_hash IS NOT NULL")}
+
+    def _write_rows(self, conn, rows):
+        """Write (conversation row, text, messages, content hash) rows; returns how many already existed."""
+        ids = [row[0] for row in rows]
+        existing = conn.execute(
+            f"SELECT COUNT(*) FROM conversations WHERE id IN ({','.join('?' * len(ids))})", ids
+        ).fetchone()[0] if ids else 0
+        # Upsert rather than INSERT OR REPLACE: REPLACE would reset the
+        # favourite/pinned flags on every re-import.
+        conn.executemany(_UPSERT_CONVERSATION, [row[:6] + (row[8],) for row in rows])
+        conn.executemany(_UPSERT_TEXT, [(row[0], row[1], row[6]) for row in rows])
+        conn.executemany("DELETE FROM imported_messages WHERE conv_id = ?", [(row[0],) for row in rows])
+        conn.executemany(_INSERT_MESSAGE, [(row[0],) + m for row in rows for m in row[7]])
+        return existing
+
+    def get_imported_messages(self, conv_id, last=None, branch=0):
+        """Messages of an imported conversation as (position, role, content, created_at).
+
+        ``last=N`` returns only the final N messages (still oldest first).
+        """
+        conn = sqlite3.connect(self.db_path)
+        sql = "SELECT position, role, content, created_at FROM imported_messages WHERE conv_id = ? AND branch = ?"
+        if last:
+            rows = conn.execute(sql + " ORDER BY position DESC LIMIT ?", (conv_id, branch, last)).fetchall()
+            rows.reverse()
+        else:
+            rows = conn.execute(sql + " ORDER BY position", (conv_id, branch)).fetchall()
+        conn.close()
+        return rows
+
+    def get_imported_message(self, conv_id, position, branch=0):
+        conn = sqlite3.connect(self.db_path)
+        row = conn.execute(
+            "SELECT position, role, content, created_at FROM imported_messages WHERE conv_id = ? AND branch = ? AND position = ?",
+            (conv_id, branch, position),
+        ).fetchone()
+        conn.close()
+        return row
+
+    def import_export(self, export_path, platform, batch_size=None, branches=False, workers=None):
+        """Stream an export file (or zip archive, or list of either) into the database.
+
+        The top-level array is parsed incrementally (utils/jsonstream.py), so
+        memory is bounded by one batch rather than the whole file. Rows are
+        written with executemany, one transaction per ``batch_size``
+        conversations. ``branches`` also stores ChatGPT side branches in
+        imported_messages. With ``workers`` > 1 conversations are parsed in a
+        process pool (see _import_parallel).
+
+        Re-imports are incremental: a conversation whose content hash matches
+        the stored one is skipped without being parsed. Each batch commits a
+        checkpoint with it, so an interrupted import of the same (unchanged)
+        file resumes after the last committed batch. Returns the number of
+        conversations written (new + changed).
+        """
+        paths = [export_path] if isinstance(export_path, (str, os.PathLike)) else list(export_path)
+        build_row = ROW_BUILDERS[platform]
+        label = PLATFORM_LABELS[platform]
+        batch_size = batch_size or IMPORT_BATCH_SIZE
+        workers = workers or IMPORT_WORKERS
         try:
-            print("⏳ Reading ChatGPT export file...")
-            with open(export_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            if not isinstance(data, list):
-                raise ValueError("Expected a list of conversations")
-            
-            print(f"📚 Processing {len(data)} conversations...")
+            print(f"⏳ Streaming {label} export file...")
+            if workers > 1:
+                return self._import_parallel(paths, platform, batch_size, branches, workers)
             conn = sqlite3.connect(self.db_path)
-            imported = 0
-            
-            for conversation in data:
-                try:
-                    conv_id = conversation.get('id', str(conversation.get('create_time', '')))
-                    title = conversation.get('title', 'Untitled')
-                    created_at = datetime.fromtimestamp(conversation.get('create_time', 0)).isoformat()
-                    updated_at = datetime.fromtimestamp(conversation.get('update_time', 0)).isoformat()
-                    messages = json.dumps(conversation.get('mapping', {}))
-                    
-                    conn.execute('''
-                        INSERT OR REPLACE INTO conversations 
-                        (id, title, platform, created_at, updated_at, messages)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (conv_id, title, 'chatgpt', created_at, updated_at, messages))
-                    imported += 1
-                    
-                    if imported % 50 == 0:
-                        print(f"⏳ Processed {imported} conversations...")
-                        
-                except Exception as e:
-                    print(f"⚠️ Warning: Skipped conversation due to error: {e}")
-                    continue
-            
-            conn.commit()
-            conn.close()
-            print(f"✅ Successfully imported {imported} ChatGPT conversations")
-            return imported
+            known = self._known_hashes(conn)
+            totals = dict.fromkeys(('new', 'changed', 'unchanged'), 0)
+            processed = 0
+            batch = []
+            started = time.perf_counter()
+
+            def flush():
+                # Commit the batch together with the checkpoint that covers it
+                nonlocal batch
+                changed = self._write_rows(conn, batch)
+                counts['changed'] += changed
+                counts['new'] += len(batch) - changed
+                conn.execute(
+                    "INSERT OR REPLACE INTO import_checkpoints VALUES (?, ?, ?, ?, ?, ?)",
+                    (source, signature, position, counts['new'], counts['changed'], counts['unchanged']),
+                )
+                conn.commit()
+                batch = []
+                elapsed = max(time.perf_counter() - started, 1e-9)
+                print(f"⏳ Processed {processed} conversations ({processed / elapsed:.0f} conv/s)...")
+
+            try:
+                for source, signature, f in iter_export_sources(paths):
+                    counts, resume = self._load_checkpoint(conn, source, signature)
+                    if resume:
+                        print(f"↩️ Resuming {source} after conversation {resume}")
+                    position = 0
+                    for conversation, raw in iter_array_items(f):
+                        position += 1
+                        if position <= resume:
+                            continue
+                        processed += 1
+                        digest = content_hash(raw, branches)
+                        if digest in known:
+                            counts['unchanged'] += 1
+                            continue
+                        try:
+                            batch.append(build_row(conversation, branches) + (digest,))
+                        except Exception as e:
+                            print(f"⚠️ Warning: Skipped conversation due to error: {e}")
+                            continue
+                        if len(batch) >= batch_size:
+                            flush()
+                    if batch:
+                        flush()
+                    conn.execute("DELETE FROM import_checkpoints WHERE source = ?", (source,))
+                    conn.commit()
+                    for key in totals:
+                        totals[key] += counts[key]
+            finally:
+                conn.close()
+
+            return self._report(label, totals, started)
             
-        except FileNotFoundError:
-            raise FileNotFoundError(f"Export file not found: {export_path}")
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"Export file not found: {e.filename or export_path}")
         except json.JSONDecodeError as e:
             raise ValueError(f"Invalid JSON in export file: {e}")
         except Exception as e:
             raise Exception(f"Import failed: {e}")
-    
-    def import_claude_export(self, export_path):
+
+    def _load_checkpoint(self, conn, source, signature):
+        # (counts so far, elements already committed) for an interrupted
+        # import of this exact source, or fresh counts
+        row = conn.execute(
+            "SELECT signature, position, new, changed, unchanged FROM import_checkpoints WHERE source = ?", (source,)
+        ).fetchone()
+        if row and row[0] == signature:
+            return {'new': row[2], 'changed': row[3], 'unchanged': row[4]}, row[1]
+        return {'new': 0, 'changed': 0, 'unchanged': 0}, 0
+
+    def _report(self, label, totals, started, detail=""):
+        written = totals['new'] + totals['changed']
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        print(f"✅ Successfully imported {written} {label} conversations in {elapsed:.1f}s "
+              f"({(written + totals['unchanged']) / elapsed:.0f} conv/s{detail}): "
+              f"{totals['new']} new, {totals['changed']} changed, {totals['unchanged']} unchanged")
+        return written
+
+    def _import_parallel(self, paths, platform, batch_size, branches, workers):
+        """Parse in ``workers`` processes and write from one dedicated process.
+
+        The parent only finds where each conversation starts and ends
+        (iter_array_raw matches brackets without decoding) and ships the raw
+        texts, which are cheap to pickle, keeping at most 2 * workers chunks
+        in flight. Each conversation is parsed once, in a worker, which then
+        builds its rows then hand them to the writer over a bounded queue, so
+        SQLite still sees a single serialised writer and a slow disk applies
+        back-pressure all the way to the reader. Conversations may be written
+        out of file order; the upsert makes that harmless. For the same
+        reason there is no position checkpoint: an interrupted parallel import
+        resumes through the content hashes, as committed conversations are
+        skipped unparsed.
+        """
+        label = PLATFORM_LABELS[platform]
+        ctx = mp.get_context()
+        rows_queue = ctx.Queue(maxsize=workers * 2)
+        results = ctx.Queue()
+        writer = ctx.Process(target=_import_writer, args=(self.db_path, rows_queue, results, batch_size))
+        writer.start()
+        started = time.perf_counter()
+        conn = sqlite3.connect(self.db_path)
+        known = self._known_hashes(conn)
+        conn.close()
+        skipped = unchanged = 0
         try:
-            print("⏳ Reading Claude export file...")
-            with open(export_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            if not isinstance(data, list):
-                raise ValueError("Expected a list of conversations")
-            
-            print(f"📚 Processing {len(data)} conversations...")
-            conn = sqlite3.connect(self.db_path)
-            imported = 0
-            
-            for conversation in data:
+            with ProcessPoolExecutor(
+                workers, mp_context=ctx, initializer=_import_worker_init, initargs=(platform, branches, rows_queue)
+            ) as pool:
+                in_flight = set()
+
+                def collect(done):
+                    nonlocal skipped
+                    for future in done:
+                        skipped += future.result()[1]
+
+                def pending(f):
+                    nonlocal unchanged
+                    for raw in iter_array_raw(f):
+                        digest = content_hash(raw, branches)
+                        if digest in known:
+                            unchanged += 1
+                        else:
+                            yield raw, digest
+
+                for _, _, f in iter_export_sources(paths):
+                    for chunk in _chunks(pending(f), IMPORT_CHUNK):
+                        if len(in_flight) >= workers * 2:
+                            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                            collect(done)
+                        in_flight.add(pool.submit(_import_worker, chunk))
+                collect(wait(in_flight)[0])
+        finally:
+            rows_queue.put(None)
+            while True:
                 try:
-                    conv_id = conversation.get('uuid', conversation.get('id', ''))
-                    title = conversation.get('name', 'Untitled')
-                    created_at = conversation.get('created_at', datetime.now().isoformat())
-                    updated_at = conversation.get('updated_at', created_at)
-                    messages = json.dumps(conversation.get('chat_messages', []))
-                    
-                    conn.execute('''
-                        INSERT OR REPLACE INTO conversations 
-                        (id, title, platform, created_at, updated_at, messages)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (conv_id, title, 'claude', created_at, updated_at, messages))
-                    imported += 1
-                    
-                    if imported % 50 == 0:
-                        print(f"⏳ Processed {imported} conversations...")
-                        
-                except Exception as e:
-                    print(f"⚠️ Warning: Skipped conversation due to error: {e}")
-                    continue
-            
-            conn.commit()
-            conn.close()
-            print(f"✅ Successfully imported {imported} Claude conversations")
-            return imported
-            
-        except FileNotFoundError:
-            raise FileNotFoundError(f"Export file not found: {export_path}")
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Invalid JSON in export file: {e}")
-        except Exception as e:
-            raise Exception(f"Import failed: {e}")
+                    written, changed, error = results.get(timeout=0.5)
+                    break
+                except queue.Empty:
+                    if not writer.is_alive():
+                        written, changed, error = 0, 0, f"writer exited with code {writer.exitcode}"
+                        break
+            writer.join()
+        if error:
+            raise RuntimeError(f"writer failed after {written} conversations: {error}")
+        totals = {'new': written - changed, 'changed': changed, 'unchanged': unchanged}
+        return self._report(label, totals, started, f", {workers} workers, {skipped} failed")
+
+    def import_chatgpt_export(self, export_path, batch_size=None, branches=False, workers=None):
+        return self.import_export(export_path, 'chatgpt', batch_size, branches, workers)
+
+    def import_claude_export(self, export_path, batch_size=None, branches=False, workers=None):
+        return self.import_export(export_path, 'claude', batch_size, branches, workers)
     
-    def search_conversations(self, query="", platform=None, favourite=None, pinned=None):
+    def search_conversations(self, query="", platform=None, favourite=None, pinned=None, limit=50):
+        """Full-text search over imported conversations.
+
+        Returns rows of (id, title, platform, created_at, updated_at, snippet),
+        best bm25 match first (title hits weigh more than body hits). Without a
+        query, the most recently updated conversations are listed instead.
+        """
         conn = sqlite3.connect(self.db_path)
-        
-        sql = "SELECT * FROM conversations WHERE 1=1"
+
+        match = fts_query(query)
+        filters = ""
         params = []
-        
-        if query:
-            sql += " AND (title LIKE ? OR messages LIKE ?)"
-            params.extend([f"%{query}%", f"%{query}%"])
-        
+
         if platform:
-            sql += " AND platform = ?"
+            filters += " AND c.platform = ?"
             params.append(platform)
         
         if favourite is not None:
-            sql += " AND is_favourite = ?"
+            filters += " AND c.is_favourite = ?"
             params.append(1 if favourite else 0)
         
         if pinned is not None:
-            sql += " AND is_pinned = ?"
+            filters += " AND c.is_pinned = ?"
             params.append(1 if pinned else 0)
-        
-        sql += " ORDER BY updated_at DESC"
+
+        if match:
+            sql = f"""
+                SELECT c.id, c.title, c.platform, c.created_at, c.updated_at,
+                       snippet(conversations_fts, -1, '[', ']', '…', 12)
+                FROM conversations_fts
+                JOIN conversation_text t ON t.rowid = conversations_fts.rowid
+                JOIN conversations c ON c.id = t.conv_id
+                WHERE conversations_fts MATCH ?{filters}
+                ORDER BY rank
+            """
+            params.insert(0, match)
+        elif query and query.strip():
+            # Nothing searchable (punctuation only)
+            conn.close()
+            return []
+        else:
+            sql = f"""
+                SELECT c.id, c.title, c.platform, c.created_at, c.updated_at, ''
+                FROM conversations c WHERE 1=1{filters}
+                ORDER BY c.updated_at DESC
+            """
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
         
         cursor = conn.execute(sql, params)
         results = cursor.fetchall()
@@ -165,6 +711,49 @@ class AifredDB:
         
         return results
 
+    def maintain(self):
+        """ANALYZE, FTS optimize, PRAGMA optimize and incremental vacuum; returns a line per step."""
+        steps = []
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("ANALYZE")
+        conn.execute("INSERT INTO conversations_fts(conversations_fts) VALUES ('optimize')")
+        conn.commit()
+        steps.append("conversations: ANALYZE, FTS optimize")
+        steps.append(f"conversations: {vacuum(conn)}")
+        conn.execute("PRAGMA optimize")
+        conn.close()
+        return steps
+
+def _store(profile=None):
+    # The store of ``profile`` (default: the current profile), which is its
+    # own file when AIFRED_SHARD_PROFILES=1
+    return Store(profile=profile or get_defaults().profile)
+
+
+def _file_mb(path):
+    # A database plus its WAL, in MB
+    return sum(os.path.getsize(p) for p in (str(path), f"{path}-wal") if os.path.exists(p)) / 1e6
+
+
+def _probe_latency(store, db, repeat=5):
+    """Best-of-N milliseconds for the queries Alfred runs on every keystroke."""
+    latest = store.get_recent_thread_summaries(limit=1)
+    probes = {
+        "recent threads": lambda: store.get_recent_thread_summaries(limit=20),
+        "last 50 messages": lambda: latest and store.get_thread_messages(latest[0].id, limit=50),
+        "conversation list": lambda: db.search_conversations(limit=20),
+    }
+    timings = {}
+    for name, probe in probes.items():
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            probe()
+            best = min(best, time.perf_counter() - t0)
+        timings[name] = best * 1000
+    return timings
+
+
 def main():
     if len(sys.argv) < 2:
         print("Usage: python aifred.py <command> [args]")
@@ -175,27 +764,68 @@ def main():
     
     if command == "import":
         if len(sys.argv) < 4:
-            print("Usage: python aifred.py import <platform> <file_path>")
+            print("Usage: python aifred.py import <platform> <file|export.zip>... [--batch-size N] [--workers N] [--branches]")
             return
         
         platform = sys.argv[2]
-        file_path = sys.argv[3]
+        args = sys.argv[3:]
+        options = {}
+        for flag in ("--batch-size", "--workers"):
+            if flag in args:
+                i = args.index(flag)
+                try:
+                    options[flag] = int(args[i + 1])
+                except (IndexError, ValueError):
+                    print(f"{flag} must be an integer")
+                    return
+                del args[i:i + 2]
+        batch_size = options.get("--batch-size")
+        # --workers 0 means one per CPU
+        workers = options.get("--workers")
+        if workers == 0:
+            workers = os.cpu_count() or 1
+        branches = "--branches" in args
+        file_paths = [a for a in args if not a.startswith("--")]
         
         if platform == "chatgpt":
-            count = db.import_chatgpt_export(file_path)
+            count = db.import_chatgpt_export(file_paths, batch_size, branches, workers)
             print(f"Imported {count} ChatGPT conversations")
         elif platform == "claude":
-            count = db.import_claude_export(file_path)
+            count = db.import_claude_export(file_paths, batch_size, branches, workers)
             print(f"Imported {count} Claude conversations")
         else:
             print(f"Unsupported platform: {platform}")
     
     elif command == "search":
-        query = sys.argv[2] if len(sys.argv) > 2 else ""
-        results = db.search_conversations(query)
+        args = sys.argv[2:]
+        platform = None
+        if "--platform" in args:
+            i = args.index("--platform")
+            platform = args[i + 1] if i + 1 < len(args) else None
+            del args[i:i + 2]
+        favourite = True if "--favourite" in args else None
+        pinned = True if "--pinned" in args else None
+        query = " ".join(a for a in args if a not in {"--favourite", "--pinned"})
+        results = db.search_conversations(query, platform=platform, favourite=favourite, pinned=pinned)
         
         for row in results:
             print(f"{row[1]} ({row[2]}) - {row[4]}")
+            if row[5]:
+                print(f"    {row[5]}")
+
+    elif command == "show":
+        if len(sys.argv) < 3:
+            print("Usage: python aifred.py show <conversation_id> [--last N]")
+            return
+        last = None
+        if "--last" in sys.argv:
+            try:
+                last = int(sys.argv[sys.argv.index("--last") + 1])
+            except (IndexError, ValueError):
+                print("--last must be an integer")
+                return
+        for position, role, content, _ in db.get_imported_messages(sys.argv[2], last=last):
+            print(f"[{position}] **{role}**: {content}\n")
 
     elif command == "redact":
         if len(sys.argv) < 3:
@@ -215,12 +845,12 @@ def main():
             print("thread_id must be an integer")
             return
 
-        store = Store()
-        thread = store.get_thread(thread_id)
+        store = _store()
+        thread = store.get_thread_summary(thread_id)
         if not thread:
             print("Thread not found")
             return
-        messages = store.get_thread_messages(thread.id)
+        messages = store.iter_thread_messages(thread.id)
 
         def _redact_text(t: str) -> str:
             if not mask:
@@ -236,6 +866,9 @@ def main():
                 "name": thread.name,
                 "created_at": thread.created_at,
                 "updated_at": thread.updated_at,
+                "message_count": thread.message_count,
+                "total_prompt_tokens": thread.total_prompt_tokens,
+                "total_completion_tokens": thread.total_completion_tokens,
             },
             "messages": [
                 {
@@ -278,32 +911,181 @@ def main():
         except ValueError:
             print("thread_id must be an integer")
             return
-        store = Store()
-        thread = store.get_thread(thread_id)
+        store = _store()
+        thread = store.get_thread_summary(thread_id)
         if not thread:
             print("Thread not found")
             return
-        messages = store.get_thread_messages(thread.id)
-        if fmt == "md":
-            lines = [f"# {thread.name or '(untitled)'}", "", f"Provider: {thread.provider}  ", f"Model: {thread.model}", ""]
-            for m in messages:
-                lines.append(f"**{m.role}**: {m.content}")
-            out = "\n\n".join(lines)
-        elif fmt == "html":
-            parts = ["<html><body>", f"<h1>{thread.name or '(untitled)'}</h1>", f"<p><b>Provider:</b> {thread.provider} <b>Model:</b> {thread.model}</p>")
-            for m in messages:
-                parts.append(f"<p><b>{m.role}</b>: {m.content}</p>")
-            parts.append("</body></html>")
-            out = "".join(parts)
-        else:
+        if fmt not in ("md", "html"):
             print("Unsupported format; use md or html")
             return
+        chunks = RENDERERS[fmt](thread, store.iter_thread_messages(thread.id))
         if output_path:
             with open(output_path, "w", encoding="utf-8") as f:
-                f.write(out)
+                f.writelines(chunks)
             print(f"Exported to {output_path}")
         else:
-            print(out)
+            sys.stdout.writelines(chunks)
+
+    elif command == "recompress":
+        args = sys.argv[2:]
+        algorithm = None
+        min_chars = None
+        try:
+            if "--algorithm" in args:
+                algorithm = args[args.index("--algorithm") + 1]
+            if "--min-chars" in args:
+                min_chars = int(args[args.index("--min-chars") + 1])
+        except (IndexError, ValueError):
+            print("Usage: python aifred.py recompress [--algorithm zlib|zstd|none] [--min-chars N] [--vacuum]")
+            return
+        if algorithm not in (None, "zlib", "zstd", "none"):
+            print("Unsupported algorithm; use zlib, zstd or none")
+            return
+        store = _store()
+        size_before = os.path.getsize(store.db_path)
+        rewritten, before, after = store.recompress(algorithm, min_chars)
+        print(f"Re-encoded {rewritten} messages: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB stored")
+        if "--vacuum" in args:
+            store.close()
+            conn = sqlite3.connect(store.db_path)
+            conn.execute("VACUUM")
+            conn.close()
+            print(f"Database file: {size_before / 1e6:.1f} MB -> {os.path.getsize(store.db_path) / 1e6:.1f} MB")
+
+    elif command == "maintain":
+        args = sys.argv[2:]
+        days = None
+        profile = None
+        try:
+            if "--archive-days" in args:
+                days = int(args[args.index("--archive-days") + 1])
+            if "--profile" in args:
+                profile = args[args.index("--profile") + 1]
+        except (IndexError, ValueError):
+            print("Usage: python aifred.py maintain [--archive-days N] [--profile P] [--no-archive]")
+            return
+        store = _store(profile)
+        files = {"main": store.db_path, "archive": store.archive_path, "conversations": db.db_path}
+        size_before = {name: _file_mb(path) for name, path in files.items()}
+        latency_before = _probe_latency(store, db)
+        if "--no-archive" not in args:
+            moved = store.archive_threads(days if days is not None else ARCHIVE_AFTER_DAYS, profile)
+            print(f"Archived {moved} idle threads")
+        for step in store.maintain() + db.maintain():
+            print(f"- {step}")
+        latency_after = _probe_latency(store, db)
+        print("Space (MB)            before    after")
+        for name, path in files.items():
+            print(f"  {name:<18} {size_before[name]:8.1f} {_file_mb(path):8.1f}")
+        print(f"  main reclaimed     {size_before['main'] - _file_mb(store.db_path):8.1f}")
+        total = sum(_file_mb(path) for path in files.values()) - sum(size_before.values())
+        print(f"  total change       {total:+8.1f}")
+        print("Latency (ms)          before    after")
+        for name in latency_before:
+            print(f"  {name:<18} {latency_before[name]:8.2f} {latency_after[name]:8.2f}")
+
+    elif command == "stats":
+        args = sys.argv[2:]
+        days = 30
+        profile = None
+        try:
+            if "--days" in args:
+                days = int(args[args.index("--days") + 1])
+            if "--profile" in args:
+                profile = args[args.index("--profile") + 1]
+        except (IndexError, ValueError):
+            print("Usage: python aifred.py stats [--days N] [--profile P]")
+            return
+        for line in usage_report(_store(profile), days, profile):
+            print(line)
+
+    elif command == "sync":
+        args = sys.argv[2:]
+        profile = None
+        try:
+            if "--profile" in args:
+                i = args.index("--profile")
+                profile = args[i + 1]
+                del args[i:i + 2]
+        except IndexError:
+            args = []
+        folder = next((a for a in args if not a.startswith("--")), os.getenv("AIFRED_SYNC_DIR"))
+        if not folder:
+            print("Usage: python aifred.py sync [<folder>] [--all] [--profile P]  (folder default: AIFRED_SYNC_DIR)")
+            return
+        # Apply the other machines' changes, then publish ours
+        store = _store(profile)
+        for device, count in store.sync_import(folder).items():
+            print(f"Applied {count} changes from {device}")
+        print(f"Exported {store.sync_export(folder, everything='--all' in args)} changes")
+
+    elif command == "thread-search":
+        query = " ".join(sys.argv[2:])
+        if not query.strip():
+            print("Usage: python aifred.py thread-search <words>")
+            return
+        for profile, t in Store().search_all_profiles(query):
+            print(f"[{profile}] {t.id}: {t.name or '(untitled)'} ({t.provider} {t.model}) - {t.updated_at}")
+
+    elif command == "shard-split":
+        if not SHARD_BY_PROFILE:
+            print("Set AIFRED_SHARD_PROFILES=1 first: without it the moved profiles would no longer be opened")
+            return
+        store = Store()
+        for profile, count in store.split_profiles().items():
+            print(f"Moved {count} threads of profile '{profile}' to {shard_path(store.db_path, profile)}")
+        print("Blobs only the moved threads used are collected by the next `maintain`")
+
+    elif command == "archive-search":
+        query = " ".join(sys.argv[2:])
+        for t in _store().search_archived_threads(query):
+            print(f"{t.id}: {t.name or '(untitled)'} ({t.provider} {t.model}) - {t.updated_at}")
+
+    elif command == "restore":
+        try:
+            thread_id = int(sys.argv[2])
+        except (IndexError, ValueError):
+            print("Usage: python aifred.py restore <thread_id>")
+            return
+        thread = _store().restore_thread(thread_id)
+        print(f"Restored thread {thread.id} ({thread.message_count} messages)" if thread else "Thread not found in archive")
+
+    elif command == "export-all":
+        usage = ("Usage: python aifred.py export-all <output.jsonl|output.zip> [--format jsonl|md|html] "
+                 "[--profile P] [--provider X] [--since DATE] [--before DATE] [--workers N]")
+        args = sys.argv[2:]
+        options = {}
+        for flag in ("--format", "--profile", "--provider", "--since", "--before", "--workers"):
+            if flag in args:
+                i = args.index(flag)
+                if i + 1 >= len(args):
+                    print(usage)
+                    return
+                options[flag] = args[i + 1]
+                del args[i:i + 2]
+        if len(args) != 1:
+            print(usage)
+            return
+        output_path = args[0]
+        fmt = options.get("--format", "jsonl")
+        if fmt not in EXPORT_FORMATS:
+            print(f"Unsupported format; use {', '.join(EXPORT_FORMATS)}")
+            return
+        try:
+            workers = int(options.get("--workers", os.cpu_count() or 1))
+        except ValueError:
+            print("--workers must be an integer")
+            return
+        started = time.perf_counter()
+        # jsonl is one text stream; md/html go into a zip, one entry per thread
+        with open(output_path, "w", encoding="utf-8") if fmt == "jsonl" else open(output_path, "wb") as out:
+            count = export_threads(
+                _store(options.get("--profile")), out, fmt, workers,
+                profile=options.get("--profile"), provider=options.get("--provider"),
+                since=options.get("--since"), before=options.get("--before"),
+            )
+        print(f"Exported {count} threads to {output_path} in {time.perf_counter() - started:.1f}s")
 
 if __name__ == "__main__":
     main()
@@ -5,7 +5,9 @@ from __future__ import annotations
 import json
 import os
 import sys
-from typing import Dict, List
+import time
+from contextlib import ExitStack
+from typing import Dict, List, Optional, Tuple
 
 from providers.anthropic_client import AnthropicClient
 from providers.openai_client import OpenAIClient
@@ -13,13 +15,17 @@ from providers.perplexity_client import PerplexityClient
 from providers.gemini_client import GeminiClient
 from providers.openrouter_client import OpenRouterClient
 from providers.router import route, validate_tools
-from store import Store
+from store import THREAD_LOCK_TIMEOUT, Store
+from utils import db, locks
 from utils.budget import trim_history
 from utils.config import get_defaults
 from utils.directives import Directives, parse_directives
 from utils.logger import get_logger
 from utils.notify import notify
 
+# Write-behind side effects replayed later than this are dropped (see flush_journal)
+EFFECTS_MAX_AGE_S = 60
+
 
 def _load_system_prompt(directives_sys: str | None) -> str:
     if directives_sys:
@@ -89,10 +95,28 @@ def _payload_from_arg(arg: str) -> Dict:
         return {"error": "Unrecognised argument"}
 
 
+def _retry_point(store: Store, thread_id: int) -> Tuple[Optional[int], str]:
+    """The message before the thread's last question (None if it was the first) and the question's text."""
+    messages = store.get_thread_messages(thread_id, limit=50)
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i].role == "user":
+            before = messages[i - 1:i] if i else store.get_thread_messages(thread_id, limit=1, before_id=messages[i].id)
+            return (before[0].id if before else None), messages[i].content
+    return None, ""
+
+
 def handle_action(arg: str) -> None:
-    log = get_logger()
-    store = Store()
+    # Locks taken during the turn (singleflight, thread) are released on return
+    with ExitStack() as stack:
+        _handle_action(arg, stack)
+
+
+def _handle_action(arg: str, stack: ExitStack) -> None:
     defaults = get_defaults()
+    store = Store(profile=defaults.profile)
+    # Turns journaled by an earlier write-behind invocation whose flusher
+    # never ran (e.g. a crash); a stat when there are none
+    flush_journal(store)
 
     payload = _payload_from_arg(arg)
     if "error" in payload:
@@ -130,41 +154,81 @@ def handle_action(arg: str) -> None:
         except Exception:
             pass
 
-    # Resolve thread
+    # Singleflight: an identical query already in flight (a double Enter)
+    # shares that call's reply instead of paying for a second provider call
+    flight = None
+    if query and _option("AIFRED_SINGLEFLIGHT", "singleflight"):
+        key = json.dumps([defaults.profile, provider, model, query, directives_dict, payload.get("thread_hint")], sort_keys=True)
+        try:
+            flight = stack.enter_context(locks.singleflight(store.lock_dir, key, THREAD_LOCK_TIMEOUT))
+        except locks.LockTimeout:
+            flight = None
+        if flight is not None and not flight.leader:
+            print(flight.result["output"])
+            return
+
+    # Resolve thread. All of this turn's writes (a new thread, the user
+    # message, tool results, the reply) are buffered in `turn` and committed
+    # together once the reply is in (Store.turn).
+    turn = store.turn()
     thread_hint = payload.get("thread_hint")
     thread = None
+    fork_from = None  # (thread id, last shared message id) of a new branch
     if d.new:
-        thread_id = store.create_thread(provider, model, d.name, profile=defaults.profile)
-        thread = store.get_latest_thread(provider, model, profile=defaults.profile)
+        pass  # always a new thread
+    elif d.fork:
+        # Branch the hinted (else latest) thread; with no query, retry its
+        # last question, e.g. on another model, without the old answer
+        source_id = thread_hint.get("id") if isinstance(thread_hint, dict) else None
+        if not source_id:
+            recent = store.get_recent_threads(limit=1, profile=defaults.profile)
+            source_id = recent[0].id if recent else None
+        if source_id and (store.get_thread(source_id) or store.restore_thread(source_id)):
+            if query:
+                fork_from = (source_id, None)
+            else:
+                shared, query = _retry_point(store, source_id)
+                if not query:
+                    print("Nothing to retry: the thread has no question yet.")
+                    return
+                if shared is not None:
+                    fork_from = (source_id, shared)
     elif thread_hint and isinstance(thread_hint, dict) and thread_hint.get("id"):
-        # Minimal fetch to ensure existence
-        # Use latest messages afterward
-        thread = store.get_latest_thread(provider, model, profile=defaults.profile)  # best-effort
+        # The hinted thread, re-hydrated from the archive if it was moved there
+        thread = store.get_thread(thread_hint["id"]) or store.restore_thread(thread_hint["id"])
         if not thread:
-            thread_id = store.create_thread(provider, model, d.name, profile=defaults.profile)
-            thread = store.get_latest_thread(provider, model, profile=defaults.profile)
+            thread = store.get_latest_thread(provider, model, profile=defaults.profile)  # best-effort
     elif d.cont:
         thread = store.get_latest_thread(provider, model if d.model else None, profile=defaults.profile)
-        if not thread:
-            thread_id = store.create_thread(provider, model, d.name, profile=defaults.profile)
-            thread = store.get_latest_thread(provider, model, profile=defaults.profile)
-    else:
-        # Default: create a new thread when sending a fresh query
+    elif not query:
+        # Default: a fresh query starts a new thread; otherwise reopen the latest
         thread = store.get_latest_thread(provider, model if d.model else None, profile=defaults.profile)
-        if not thread or query:
-            thread_id = store.create_thread(provider, model, d.name, profile=defaults.profile)
-            thread = store.get_latest_thread(provider, model, profile=defaults.profile)
-
-    if not thread:
-        print("Failed to resolve thread")
-        return
-
-    # Assemble messages
-    history = [
-        {"role": m.role, "content": m.content} for m in store.get_thread_messages(thread.id, limit=50)
-    ]
+    if thread:
+        # One turn per thread at a time: a concurrent turn on it finishes
+        # first, so this one sees its messages in the history below
+        try:
+            stack.enter_context(store.thread_lock(thread.id))
+        except locks.LockTimeout:
+            print(f"Thread {thread.id} is busy with another request; try again shortly.")
+            return
+        flush_journal(store)  # the turn we waited for may still be journaled
+        turn.use_thread(thread.id)
+    elif fork_from:
+        turn.fork_thread(*fork_from, provider, model, d.name)
+    else:
+        turn.new_thread(provider, model, d.name, profile=defaults.profile)
+
+    # Assemble messages (a thread created by this turn has no history yet,
+    # a branch has its parent's up to the fork point).
+    # ChatMessage rows go to trim_history and the client as they are.
+    if thread:
+        history: List = store.get_history(thread.id, limit=50)
+    elif fork_from:
+        history = store.get_history(fork_from[0], limit=50, before_id=fork_from[1] + 1 if fork_from[1] else None)
+    else:
+        history = []
     if query:
-        store.add_message(thread.id, "user", query, meta={"directives": directives_dict})
+        turn.add_message("user", query, meta={"directives": directives_dict})
         history.append({"role": "user", "content": query})
 
     client = _get_client(provider)
@@ -185,6 +249,7 @@ def handle_action(arg: str) -> None:
         reserve_for_completion=planned_out_tokens,
     )
 
+    started = time.monotonic()
     resp = client.send(
         system=system_prompt,
         messages=trimmed_history,
@@ -213,9 +278,10 @@ def handle_action(arg: str) -> None:
             name = call.get("name")
             arguments = call.get("arguments", {})
             result = execute_tool_call(name, arguments)
-            # Persist tool message and extend history
-            store.add_message(thread.id, "tool", json.dumps({"name": name, "result": result}), meta=None)
-            trimmed_history.append({"role": "tool", "content": json.dumps({"name": name, "result": result})})
+            # Persist tool message (content-addressed: repeated results are stored once) and extend history
+            tool_result = json.dumps({"name": name, "result": result})
+            turn.add_blob_message("tool", tool_result)
+            trimmed_history.append({"role": "tool", "content": tool_result})
         # Re-send to provider once with tool results
         resp2 = client.send(
             system=system_prompt,
@@ -228,62 +294,135 @@ def handle_action(arg: str) -> None:
         text = resp2.get("text", text)
         usage = resp2.get("usage", usage)
         had_error = had_error or resp2.get("error", False)
+    latency_ms = int((time.monotonic() - started) * 1000)
 
-    # Persist assistant response
+    # Persist assistant response, then write the whole turn in one transaction
     if text:
-        store.add_message(thread.id, "assistant", text, meta={"usage": usage, "tools_dropped": tools_dropped})
+        # Usage is normalised on write; provider, model and latency feed the
+        # messages usage columns (Store.usage_by_day)
+        turn.add_message("assistant", text, meta={
+            "usage": usage,
+            "provider": provider,
+            "model": model,
+            "latency_ms": latency_ms,
+            "error": bool(had_error),
+            "tools_dropped": tools_dropped,
+        })
 
     # Minimal user feedback output for Alfred
     header = f"{provider} {model}"
     if tools_dropped:
         header += f" | unsupported tools dropped: {', '.join(tools_dropped)}"
-
     output_text = text if text else "No response."
-    print(f"{header}\n\n{output_text}")
-    notify(f"Sent to {provider} {model}", output_text[:120])
 
     # Logging (meta only unless AIFRED_DEBUG=1)
-    debug = os.getenv("AIFRED_DEBUG") == "1"
-    if debug:
-        log.info(
-            "sent provider=%s model=%s tools=%s usage=%s query=%s",
-            provider,
-            model,
-            tools_supported,
-            usage,
-            query,
-        )
-    else:
-        log.info(
-            "sent provider=%s model=%s tools=%s usage=%s",
-            provider,
-            model,
-            tools_supported,
-            usage,
-        )
+    log_args = ["sent provider=%s model=%s tools=%s usage=%s", provider, model, tools_supported, usage]
+    if os.getenv("AIFRED_DEBUG") == "1":
+        log_args[0] += " query=%s"
+        log_args.append(query)
+    effects = {
+        "notify": [f"Sent to {provider} {model}", output_text[:120]],
+        "log": log_args,
+        "clipboard": text if text and _option("AIFRED_COPY_CLIPBOARD", "copy_clipboard") else None,
+    }
+
+    if _option("AIFRED_WRITE_BEHIND", "write_behind"):
+        # Journal the turn and side effects (one fsync), reply, then let a
+        # detached flusher write SQLite; the next invocation replays leftovers
+        turn.defer(effects=effects)
+        if flight is not None:
+            flight.publish({"output": f"{header}\n\n{output_text}"})
+        print(f"{header}\n\n{output_text}")
+        sys.stdout.flush()
+        _spawn_flusher()
+        return
 
-    # Optional: copy response text to clipboard
-    copy_clip = os.getenv("AIFRED_COPY_CLIPBOARD") == "1"
-    if not copy_clip:
-        try:
-            from utils.user_config import get_option
-            copy_clip = bool(get_option("copy_clipboard", False))
-        except Exception:
-            copy_clip = False
-    if text and copy_clip:
+    turn.commit()
+    if flight is not None:
+        flight.publish({"output": f"{header}\n\n{output_text}"})
+    print(f"{header}\n\n{output_text}")
+    _run_effects(effects)
+
+
+def _option(env: str, key: str) -> bool:
+    if os.getenv(env) == "1":
+        return True
+    try:
+        from utils.user_config import get_option
+        return bool(get_option(key, False))
+    except Exception:
+        return False
+
+
+def _run_effects(effects: Dict) -> None:
+    """Post-reply side effects: notification, log line, optional clipboard copy."""
+    notify(*effects["notify"])
+    get_logger().info(*effects["log"])
+    if effects.get("clipboard"):
         try:
             from subprocess import Popen, PIPE
             p = Popen(["pbcopy"], stdin=PIPE)
-            p.communicate(input=text.encode("utf-8"))
+            p.communicate(input=effects["clipboard"].encode("utf-8"))
         except Exception:
             pass
 
 
+def _spawn_flusher() -> None:
+    # A forked child already has everything imported, so flushing costs no
+    # interpreter start-up; it detaches from Alfred's output pipe first.
+    # SQLite connections must not cross a fork: the child would inherit this
+    # process's lock bookkeeping, and our closing them at exit could then
+    # checkpoint away the WAL under the child's commit.
+    db.close_all()
+    try:
+        pid = os.fork()
+    except (AttributeError, OSError):
+        return  # the next invocation replays the journal
+    if pid:
+        return
+    try:
+        os.setsid()
+        os.nice(10)
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        flush_journal()
+    finally:
+        os._exit(0)
+
+
+def flush_journal(store: Optional[Store] = None) -> int:
+    """Apply journaled turns; side effects run only for entries still fresh.
+
+    After a crash, the turns are replayed by the next invocation. Their
+    notifications and clipboard copies would be minutes stale by then, so
+    they are skipped. A replay that fails is logged and left for the next
+    one: the caller's own turn goes ahead either way.
+    """
+    store = store or Store(profile=get_defaults().profile)
+
+    def on_entry(entry: Dict) -> None:
+        if entry.get("effects") and time.time() - entry.get("created", 0) < EFFECTS_MAX_AGE_S:
+            try:
+                _run_effects(entry["effects"])
+            except Exception as exc:  # the turn is committed; don't replay it for its effects
+                get_logger().warning("Journaled effects failed: %s", exc)
+
+    try:
+        return store.replay_journal(on_entry)
+    except Exception as exc:
+        get_logger().warning("Journal replay failed: %s", exc)
+        return 0
+
+
 def main() -> None:
     if len(sys.argv) < 2:
         print("No action specified")
         return
     arg = sys.argv[1]
+    if arg == "--flush":
+        flush_journal()
+        return
     handle_action(arg)
 
 
@@ -59,9 +59,10 @@ def main():
     summary = summarize_text(text, client, model)
 
     # Create a new thread and persist the attachment summary
-    store = Store()
+    store = Store(profile=defaults.profile)
     thread_id = store.create_thread(provider, model, name=file_path.stem, profile=defaults.profile)
-    store.add_message(thread_id, "user", f"[Attached file: {file_path.name}]")
+    # Keep the extracted source with the thread; identical files share one blob
+    store.add_blob_message(thread_id, "user", f"[Attached file: {file_path.name}]\n\n{text}")
     if summary:
         store.add_message(thread_id, "assistant", summary)
     print(f"Attached and summarized: {file_path.name}\nThread ID: {thread_id}")
@@ -4,10 +4,12 @@ import json
 import os
 import sys
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
 from providers.router import route
-from utils.config import get_defaults
-from store import Store
+from utils.config import Defaults, get_defaults
+from store import Store, ThreadSummary
+from utils import user_config
 from utils.directives import parse_directives, summarise_directives
 
 
@@ -15,8 +17,8 @@ def alfred_items(items):
     return json.dumps({"items": items})
 
 
-def _resolve_provider_model(model_hint, provider_hint):
-    defaults = get_defaults()
+def _resolve_provider_model(model_hint, provider_hint, defaults=None):
+    defaults = defaults or get_defaults()
     provider_default = defaults.provider
     provider = route(model_hint, provider_hint) if (model_hint or provider_hint) else provider_default
     if provider == "openai":
@@ -34,24 +36,23 @@ def _resolve_provider_model(model_hint, provider_hint):
     return provider, model
 
 
-def _thread_item(t) -> dict:
+def _thread_item(t, fork=None) -> dict:
     title = t.name or "(untitled)"
-    subtitle = f"{t.provider} {t.model} • {t.updated_at}"
-    # Provide Large Type and copy previews using the last assistant message
-    # We fetch on-demand in alfred_action if needed, but also surface via text field when available
+    subtitle = f"{t.provider} {t.model} • {t.message_count} msgs • {t.updated_at}"
+    # Provide Large Type and copy previews using the last assistant message,
+    # which get_recent_thread_summaries returns alongside the thread row
     # Note: Alfred shows Large Type with ⌘L
-    try:
-        store = Store()
-        msgs = store.get_thread_messages(t.id, limit=1_000)
-        last_assistant = next((m for m in reversed(msgs) if m.role == "assistant" and m.content), None)
-        preview = last_assistant.content if last_assistant else ""
-    except Exception:
-        preview = ""
+    preview = t.preview or ""
     payload = {
         "query": "",
         "directives": {"cont": True, "provider": t.provider, "model": t.model, "name": t.name},
         "thread_hint": {"id": t.id},
     }
+    if fork:
+        # @fork: Enter branches this thread (see alfred_action) instead of continuing it
+        payload = dict(fork, thread_hint={"id": t.id})
+        what = "ask there" if fork["query"] else "retry its last question"
+        subtitle = f"Branch and {what} on {fork['provider']} {fork['model']} • {subtitle}"
     return {
         "uid": f"thread-{t.id}",
         "title": f"{title}",
@@ -61,11 +62,48 @@ def _thread_item(t) -> dict:
     }
 
 
-def build_items(query: str) -> str:
-    store = Store()
-    defaults = get_defaults()
+class Session:
+    """What the filter reads besides the query: config, store and recent threads.
+
+    build_items uses a fresh one per run. The filter daemon keeps one, so it
+    re-reads the config only when the file changes and lists threads only
+    when another process has written to the database.
+    """
+
+    def __init__(self) -> None:
+        self._defaults: Optional[Defaults] = None
+        self._config_mtime: Optional[int] = None
+        self._stores: Dict[str, Store] = {}
+        self._recent: Dict[Tuple[str, int], Tuple[int, List[ThreadSummary]]] = {}
+
+    def defaults(self) -> Defaults:
+        try:
+            mtime = user_config._config_path().stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        if self._defaults is None or mtime != self._config_mtime:
+            self._defaults, self._config_mtime = get_defaults(), mtime
+        return self._defaults
+
+    def recent_threads(self, profile: str, limit: int) -> List[ThreadSummary]:
+        store = self._stores.get(profile)
+        if store is None:
+            store = self._stores[profile] = Store(profile=profile)
+        version = store.data_version()
+        cached = self._recent.get((profile, limit))
+        if cached is None or cached[0] != version:
+            cached = self._recent[(profile, limit)] = (version, store.get_recent_thread_summaries(limit=limit, profile=profile))
+        return cached[1]
+
+    def items(self, query: str) -> str:
+        return build_items(query, self)
+
+
+def build_items(query: str, session: Optional[Session] = None) -> str:
+    session = session or Session()
+    defaults = session.defaults()
     cleaned, d = parse_directives(query)
-    provider, model = _resolve_provider_model(d.model, d.provider)
+    provider, model = _resolve_provider_model(d.model, d.provider, defaults)
 
     items = []
 
@@ -74,12 +112,11 @@ def build_items(query: str) -> str:
         summary = summarise_directives(d)
         # If legal mode and no explicit tools, show intended default tools
         try:
-            defs = get_defaults()
-            if defs.legal_mode and not d.tools:
-                summary = (summary + (" | " if summary else "")) + "tools: " + ",".join(defs.legal_tools)
+            if defaults.legal_mode and not d.tools:
+                summary = (summary + (" | " if summary else "")) + "tools: " + ",".join(defaults.legal_tools)
             # Show persona
-            if defs.persona_name:
-                summary = (summary + (" | " if summary else "")) + f"persona: {defs.persona_name}"
+            if defaults.persona_name:
+                summary = (summary + (" | " if summary else "")) + f"persona: {defaults.persona_name}"
         except Exception:
             pass
         payload = {
@@ -98,8 +135,9 @@ def build_items(query: str) -> str:
 
     # List recent threads (limit 5 when query, else 20)
     limit = 5 if cleaned else 20
-    for t in store.get_recent_threads(limit=limit, profile=defaults.profile):
-        items.append(_thread_item(t))
+    fork = {"query": cleaned, "directives": d.to_dict(), "provider": provider, "model": model} if d.fork else None
+    for t in session.recent_threads(defaults.profile, limit):
+        items.append(_thread_item(t, fork))
 
     # Empty state
     if not items:
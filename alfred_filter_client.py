@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Script Filter entry point: ask the resident filter daemon, else run alfred_filter.
+
+With AIFRED_FILTER_DAEMON=1, a keystroke is answered by a long-lived daemon
+(utils/filterd.py) that already has the modules, config and database open.
+If none is running, this run forks one and answers in-process, as it always
+does with the daemon off. Until it falls back, this script imports only
+builtin modules: even `socket` and `typing` would double its start-up.
+"""
+
+from __future__ import annotations
+
+import _socket
+import os
+import sys
+import zlib
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+REPLY_TIMEOUT_S = 2.0
+
+
+def socket_path() -> str:
+    """The socket of the daemon matching this process's environment and code.
+
+    Alfred passes workflow variables to every run, and a daemon started with
+    other values (or before the workflow was updated) would answer with
+    stale settings. Hashing them into the name means such a daemon is simply
+    never asked; it exits once idle.
+    """
+    key = [os.getcwd()]
+    key += sorted(f"{k}={v}" for k, v in os.environ.items() if k.startswith(("AIFRED_", "alfred_workflow_")))
+    for directory in (ROOT, os.path.join(ROOT, "utils"), os.path.join(ROOT, "providers")):
+        try:
+            with os.scandir(directory) as entries:
+                key += sorted(f"{e.name}:{e.stat().st_mtime_ns}" for e in entries if e.name.endswith(".py"))
+        except OSError:
+            pass
+    digest = zlib.crc32("\0".join(key).encode("utf-8"))
+    # TMPDIR, not the workflow data dir: macOS caps socket paths at 104 bytes
+    return os.path.join(os.getenv("TMPDIR", "/tmp"), f"aifred-filter-{os.getuid()}-{digest:08x}.sock")
+
+
+def ask(path: str, query: str, timeout: float = REPLY_TIMEOUT_S) -> str | None:
+    """The daemon's output for ``query``, or None if it sent none (its handler failed).
+
+    Raises OSError when no daemon is listening at ``path``.
+    """
+    sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(query.encode("utf-8"))
+        sock.shutdown(_socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        sock.close()
+    return b"".join(chunks).decode("utf-8") or None
+
+
+def request(query: str) -> str | None:
+    """Ask the daemon; None means run the filter in-process.
+
+    With no daemon listening, one is forked and this keystroke falls back,
+    so it is never slower than running without one.
+    """
+    path = socket_path()
+    try:
+        return ask(path, query)
+    except _socket.timeout:
+        return None
+    except OSError:
+        _spawn(path)
+        return None
+
+
+def _spawn(path: str) -> None:
+    # Detached like alfred_action._spawn_flusher: a new session, off Alfred's
+    # output pipe, so Alfred doesn't wait for it
+    try:
+        pid = os.fork()
+    except (AttributeError, OSError):
+        return
+    if pid:
+        return
+    try:
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        import alfred_filter
+        from utils import filterd
+
+        filterd.serve(path, alfred_filter.Session().items)
+    finally:
+        os._exit(0)
+
+
+def main() -> None:
+    query = sys.argv[1] if len(sys.argv) > 1 else ""
+    out = request(query) if os.getenv("AIFRED_FILTER_DAEMON") == "1" else None
+    if out is None:
+        import alfred_filter
+
+        out = alfred_filter.build_items(query)
+    print(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Alfred Script Filter: local usage stats from the usage_rollup table.
+
+Query: optional number of days for the per-model breakdown (default 30).
+Reads a few dozen rollup rows, never the messages table.
+"""
+
+import json
+import sys
+
+from store import LATENCY_BUCKETS_MS, Store
+from utils.config import get_defaults
+from utils.stats import WINDOWS, describe, summarise, window_start
+
+
+def _item(uid: str, title: str, subtitle: str) -> dict:
+    return {
+        "uid": uid,
+        "title": title,
+        "subtitle": subtitle,
+        "valid": False,
+        "text": {"copy": f"{title}: {subtitle}", "largetype": f"{title}\n{subtitle}"},
+    }
+
+
+def stats_items(store: Store, days: int = 30, profile: str = "default") -> list:
+    n_buckets = len(LATENCY_BUCKETS_MS) + 1
+    rows = store.usage_rollup(since=window_start(max(days, WINDOWS[-1][1])), profile=profile)
+    items = []
+    for label, window in WINDOWS:
+        start = window_start(window)
+        total, _ = summarise((r for r in rows if r.day >= start), n_buckets)
+        items.append(_item(f"stats-{window}", f"{label.capitalize()}: {total.requests} requests",
+                           describe(total, LATENCY_BUCKETS_MS)))
+    start = window_start(days)
+    _, per_model = summarise((r for r in rows if r.day >= start), n_buckets)
+    for (provider, model), t in sorted(per_model.items(), key=lambda kv: -kv[1].requests):
+        items.append(_item(f"stats-{provider}-{model}", f"{provider} {model or '(unknown)'} ({days}d)",
+                           describe(t, LATENCY_BUCKETS_MS)))
+    return items
+
+
+def main() -> None:
+    q = sys.argv[1].strip() if len(sys.argv) > 1 else ""
+    days = int(q) if q.isdigit() and int(q) > 0 else 30
+    profile = get_defaults().profile
+    print(json.dumps({"items": stats_items(Store(profile=profile), days, profile)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Branching a long thread: copying its history vs Store.fork_thread's shared references.
+
+Builds one thread, then a chain of branches, each forked from the previous
+one's last message with a few new turns of its own. Reports database size and
+get_history / get_thread_messages(limit=50) latency on the deepest branch,
+once with every branch holding a full copy of its history and once with
+fork_thread.
+
+    python3 bench/bench_branches.py --messages 2000 --branches 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from store import Store  # noqa: E402
+from utils import db  # noqa: E402
+
+
+def build(store: Store, messages: int, branches: int, own: int, copy: bool) -> int:
+    tid = store.create_thread("openai", "gpt-4o", "root")
+    for i in range(messages):
+        store.add_message(tid, "user" if i % 2 == 0 else "assistant", f"message {i} " + "lorem ipsum " * 150)
+    for b in range(branches):
+        if copy:
+            parent, tid = tid, store.create_thread("openai", "gpt-4o", f"copy {b}")
+            with store._conn() as conn:
+                conn.execute(
+                    "INSERT INTO messages(thread_id, role, content, meta, created_at, content_encoding, blob_id) "
+                    "SELECT ?, role, content, meta, created_at, content_encoding, blob_id FROM messages WHERE thread_id = ? ORDER BY id",
+                    (tid, parent),
+                )
+                conn.commit()
+        else:
+            tid = store.fork_thread(tid)
+        for i in range(own):
+            store.add_message(tid, "user" if i % 2 == 0 else "assistant", f"branch {b} turn {i} " + "lorem ipsum " * 150)
+    return tid
+
+
+def best_ms(fn, repeat: int = 50) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--messages", type=int, default=2000, help="messages in the root thread")
+    ap.add_argument("--branches", type=int, default=20, help="depth of the branch chain")
+    ap.add_argument("--own", type=int, default=4, help="new messages per branch")
+    args = ap.parse_args()
+
+    print(f"{args.messages} root messages, {args.branches} nested branches of {args.own} messages each")
+    print(f"{'':14}{'DB MB':>8}{'history ms':>12}{'last 50 ms':>12}{'all ms':>10}")
+    for label, copy in (("copied", True), ("fork_thread", False)):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = Store(os.path.join(tmp, "aifred.db"))
+            leaf = build(store, args.messages, args.branches, args.own, copy)
+            with store._conn() as conn:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            size = os.path.getsize(store.db_path) / 1e6
+            history = best_ms(lambda: store.get_history(leaf, limit=50))
+            last50 = best_ms(lambda: store.get_thread_messages(leaf, limit=50))
+            everything = best_ms(lambda: store.get_thread_messages(leaf, limit=None), repeat=5)
+            print(f"{label:14}{size:8.1f}{history:12.2f}{last50:12.2f}{everything:10.1f}")
+            db.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""DB size and read latency of stored message bodies: plain vs zlib vs zstd.
+
+The corpus mimics real threads: short questions, Markdown answers of 1-6 KB,
+fetch_url page text (5-30 KB) and case_search JSON results.
+
+    python3 bench/bench_compress.py --threads 300
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from store import Store  # noqa: E402
+from utils import compress, db  # noqa: E402
+
+WORDS = (
+    "the of and to a in that is was he for it with as his on be at by this had not are but from or have an they which "
+    "one you were her all she there would their we him been has when who will more no if out so said what up its about "
+    "into than them can only other new some could time these two may then do first any my now such like our over man me "
+    "even most made after also did many before must through back years where much your way well down should because each "
+    "court held duty care breach negligence contract damages plaintiff defendant appeal judgment evidence statute section "
+    "tribunal reasonable foreseeable loss causation liability claim order costs party respondent appellant decision act"
+).split()
+CUM = list(itertools.accumulate(1.0 / (i + 1) for i in range(len(WORDS))))
+
+
+def prose(rng: random.Random, chars: int) -> str:
+    out, size = [], 0
+    while size < chars:
+        sentence = " ".join(rng.choices(WORDS, cum_weights=CUM, k=rng.randint(8, 24))).capitalize() + "."
+        if rng.random() < 0.15:
+            sentence = "\n\n## " + sentence[:40] + "\n\n" + sentence
+        out.append(sentence)
+        size += len(sentence) + 1
+    return " ".join(out)
+
+
+def case_json(rng: random.Random) -> str:
+    results = [{
+        "citation": f"[{rng.randint(1990, 2024)}] HCA {rng.randint(1, 60)}",
+        "title": prose(rng, 40),
+        "court": rng.choice(["HCA", "NSWCA", "VSCA", "FCAFC"]),
+        "date": f"{rng.randint(1990, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "url": f"https://www.austlii.edu.au/cgi-bin/viewdoc/au/cases/cth/HCA/{rng.randint(1990, 2024)}/{rng.randint(1, 60)}.html",
+        "summary": prose(rng, 300),
+    } for _ in range(20)]
+    return json.dumps({"query": prose(rng, 30), "results": results}, indent=2)
+
+
+def corpus(threads: int, seed: int = 11):
+    rng = random.Random(seed)
+    for t in range(threads):
+        messages = []
+        for _ in range(rng.randint(6, 30)):
+            messages.append(("user", prose(rng, rng.randint(60, 400))))
+            kind = rng.random()
+            if kind < 0.2:
+                messages.append(("tool", prose(rng, rng.randint(5000, 30000))))
+            elif kind < 0.3:
+                messages.append(("tool", case_json(rng)))
+            messages.append(("assistant", prose(rng, rng.randint(1000, 6000))))
+        yield messages
+
+
+def run(algorithm: str, threads: int, tmp: str) -> dict:
+    compress.ALGORITHM = algorithm
+    db_path = os.path.join(tmp, f"{algorithm}.db")
+    store = Store(db_path)
+    raw = 0
+    t0 = time.perf_counter()
+    ids = []
+    for messages in corpus(threads):
+        tid = store.create_thread("openai", "gpt-4o", None)
+        ids.append(tid)
+        for role, content in messages:
+            store.add_message(tid, role, content)
+            raw += len(content.encode("utf-8"))
+    write_s = time.perf_counter() - t0
+    stored = db.connect(db_path).execute(
+        "SELECT COUNT(*), COALESCE(SUM(content_encoding IS NOT NULL), 0) FROM messages"
+    ).fetchone()
+    store.close()
+    conn = sqlite3.connect(db_path)
+    conn.execute("VACUUM")
+    conn.close()
+    size = os.path.getsize(db_path)
+
+    store = Store(db_path)
+    last50, full = [], []
+    for _ in range(3):
+        for tid in ids:
+            t0 = time.perf_counter()
+            store.get_thread_messages(tid, limit=50)
+            t1 = time.perf_counter()
+            for _m in store.iter_thread_messages(tid):
+                pass
+            t2 = time.perf_counter()
+            last50.append(t1 - t0)
+            full.append(t2 - t1)
+    store.close()
+    return {
+        "algorithm": algorithm, "raw_mb": raw / 1e6, "db_mb": size / 1e6, "messages": stored[0],
+        "compressed": stored[1], "write_s": write_s,
+        "last50_ms": statistics.median(last50) * 1000, "last50_p99": sorted(last50)[int(0.99 * (len(last50) - 1))] * 1000,
+        "full_ms": statistics.median(full) * 1000,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--threads", type=int, default=300)
+    ap.add_argument("--algorithms", default="none,zlib,zstd")
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        print("algorithm   raw MB   DB MB  compressed/messages  write s   last-50 p50/p99 ms   full thread p50 ms")
+        for algorithm in args.algorithms.split(","):
+            if algorithm == "zstd" and compress._zstd() is None:
+                print("zstd        skipped (pip install zstandard)")
+                continue
+            r = run(algorithm, args.threads, tmp)
+            print(f"{r['algorithm']:<10} {r['raw_mb']:7.1f} {r['db_mb']:7.1f}  {r['compressed']:>8}/{r['messages']:<9}  "
+                  f"{r['write_s']:7.1f}   {r['last50_ms']:6.2f}/{r['last50_p99']:<10.2f} {r['full_ms']:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
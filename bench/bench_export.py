@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Wall time and peak RSS of `aifred.py export-all` over a synthetic thread store.
+
+Each export runs as a child process so its peak RSS can be read from wait4()
+(for pooled runs this is the parent only; workers hold one thread each).
+
+    python3 bench/bench_export.py --threads 2000,8000 --messages 50 --workers 1,4
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from store import Store  # noqa: E402
+from utils import db  # noqa: E402
+
+
+def build(db_path: str, threads: int, messages: int) -> None:
+    rng = random.Random(3)
+    store = Store(db_path)
+    conn = db.connect(db_path)
+    words = [f"w{i}" for i in range(3000)]
+    for t in range(threads):
+        tid = store.create_thread("openai" if t % 2 else "anthropic", "m", f"thread {t}", profile="default")
+        conn.executemany(
+            "INSERT INTO messages(thread_id, role, content, meta, created_at) VALUES (?,?,?,?,?)",
+            [(tid, "user" if m % 2 == 0 else "assistant", " ".join(rng.choices(words, k=150)), None, "2024-01-01T00:00:00")
+             for m in range(messages)],
+        )
+        conn.commit()
+    store.close()
+
+
+def run(db_path: str, out: str, fmt: str, workers: int):
+    env = dict(os.environ, AIFRED_DB_PATH=db_path)
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, str(ROOT / "aifred.py"), "export-all", out, "--format", fmt, "--workers", str(workers)],
+        env=env, stdout=subprocess.DEVNULL,
+    )
+    _, status, rusage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - t0
+    if os.waitstatus_to_exitcode(status) != 0:
+        return None
+    size_mb = os.path.getsize(out) / 1e6
+    os.remove(out)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return wall, rusage.ru_maxrss / (1e6 if sys.platform == "darwin" else 1e3), size_mb
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--threads", default="2000,8000")
+    ap.add_argument("--messages", type=int, default=50, help="messages per thread (~1 KB each)")
+    ap.add_argument("--workers", default="1,4")
+    ap.add_argument("--formats", default="jsonl,md")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print("threads  format  workers   wall s   output MB   peak RSS MB")
+        for threads in [int(x) for x in args.threads.split(",")]:
+            db_path = os.path.join(tmp, f"bench-{threads}.db")
+            build(db_path, threads, args.messages)
+            for fmt in args.formats.split(","):
+                for workers in [int(w) for w in args.workers.split(",")]:
+                    res = run(db_path, os.path.join(tmp, f"out.{'jsonl' if fmt == 'jsonl' else 'zip'}"), fmt, workers)
+                    if res is None:
+                        print(f"{threads:>7}  {fmt:<6}  {workers:>7}  failed")
+                        continue
+                    wall, rss, size = res
+                    print(f"{threads:>7}  {fmt:<6}  {workers:>7}  {wall:7.1f}  {size:10.0f}  {rss:12.0f}")
+
+
+if __name__ == "__main__":
+    main()
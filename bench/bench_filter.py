@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Script Filter latency per keystroke: a fresh process vs the resident filter daemon.
+
+Runs the Script Filter as Alfred does, one process per keystroke, over a
+database of N threads, and reports p50/p99 wall time for alfred_filter.py,
+the client shim with the daemon off, and the shim with the daemon running.
+
+    python3 bench/bench_filter.py --threads 2000 --runs 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from store import Store  # noqa: E402
+from utils import db  # noqa: E402
+
+QUERIES = ["", "h", "he", "hello", "hello @claude-3-7-sonnet", "hello @fork"]
+
+
+def run(script: str, env: dict, runs: int) -> list:
+    times = []
+    for i in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, str(ROOT / script), QUERIES[i % len(QUERIES)]], env=env, stdout=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - t0) * 1000)
+    return sorted(times)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--threads", type=int, default=2000)
+    ap.add_argument("--runs", type=int, default=200)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "aifred.db")
+        store = Store(db_path)
+        for i in range(args.threads):
+            tid = store.create_thread("openai", "gpt-4o", f"thread {i}")
+            store.add_message(tid, "user", "question")
+            store.add_message(tid, "assistant", "answer " + "lorem ipsum " * 40)
+        db.close_all()
+
+        env = dict(os.environ, AIFRED_DB_PATH=db_path, TMPDIR=tmp, AIFRED_FILTER_DAEMON_IDLE="5")
+        env.pop("AIFRED_FILTER_DAEMON", None)
+        daemon_env = dict(env, AIFRED_FILTER_DAEMON="1")
+        # The first run forks the daemon; wait for its socket
+        run("alfred_filter_client.py", daemon_env, 1)
+        deadline = time.monotonic() + 10
+        while not any(name.endswith(".sock") for name in os.listdir(tmp)) and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        print(f"{args.threads} threads, {args.runs} runs each")
+        print(f"{'':34}{'p50 ms':>8}{'p99 ms':>8}")
+        for label, script, e in (
+            ("alfred_filter.py", "alfred_filter.py", env),
+            ("client shim, daemon off", "alfred_filter_client.py", env),
+            ("client shim, daemon running", "alfred_filter_client.py", daemon_env),
+        ):
+            times = run(script, e, args.runs)
+            p99 = times[min(len(times) - 1, int(len(times) * 0.99))]
+            print(f"{label:34}{times[len(times) // 2]:8.1f}{p99:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Wall time and peak RSS of importing a synthetic ChatGPT export: json.load vs streaming vs parallel.
+
+Each import runs in a child process so its peak RSS can be read from wait4()
+(for the parallel mode this is the largest single process, not the sum).
+
+    python3 bench/bench_import.py --mb 200,2000 --legacy-max-mb 500 --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+def write_export(path: str, target_mb: int, seed: int = 7) -> int:
+    """Write a ChatGPT-style conversations.json of roughly target_mb; returns the conversation count."""
+    rng = random.Random(seed)
+    words = [f"w{i}" for i in range(5000)] + ["contract", "negligence", "python", "sqlite"]
+    target = target_mb * 1_000_000
+    written = 0
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        while written < target:
+            mapping = {}
+            parent = None
+            for m in range(rng.randint(4, 16)):
+                node_id = f"{n}-{m}"
+                text = " ".join(rng.choices(words, k=rng.randint(40, 200)))
+                mapping[node_id] = {
+                    "id": node_id,
+                    "parent": parent,
+                    "children": [],
+                    "message": {
+                        "id": node_id,
+                        "author": {"role": "user" if m % 2 == 0 else "assistant"},
+                        "content": {"content_type": "text", "parts": [text]},
+                        "create_time": 1_700_000_000 + m,
+                    },
+                }
+                if parent:
+                    mapping[parent]["children"].append(node_id)
+                parent = node_id
+            conv = {
+                "id": f"conv-{n}",
+                "title": " ".join(rng.choices(words, k=4)),
+                "create_time": 1_700_000_000 + n,
+                "update_time": 1_700_000_000 + n,
+                "mapping": mapping,
+                "current_node": parent,
+            }
+            chunk = ("," if n else "") + json.dumps(conv)
+            f.write(chunk)
+            written += len(chunk)
+            n += 1
+        f.write("]")
+    return n
+
+
+def _child(mode: str, export: str, db_path: str, workers: str) -> None:
+    import contextlib
+    import io
+
+    from aifred import AifredDB, chatgpt_row
+
+    db = AifredDB(db_path)
+    if mode in ("streaming", "parallel"):
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.import_chatgpt_export(export, workers=int(workers) if mode == "parallel" else 1)
+        return
+    # legacy: parse the whole file up front, as the importer used to
+    with open(export, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    conn = sqlite3.connect(db_path)
+    for i in range(0, len(data), 500):
+        db._write_rows(conn, [chatgpt_row(c) + (None,) for c in data[i:i + 500]])
+        conn.commit()
+    conn.close()
+
+
+def run(mode: str, export: str, tmp: str, workers: int = 1):
+    db_path = os.path.join(tmp, f"{mode}.db")
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, __file__, "--child", mode, export, db_path, str(workers)])
+    _, status, rusage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - t0
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        return None
+    os.remove(db_path)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss_mb = rusage.ru_maxrss / (1e6 if sys.platform == "darwin" else 1e3)
+    return wall, rss_mb
+
+
+def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        _child(*sys.argv[2:6])
+        return
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--mb", default="200,2000", help="export sizes to test (MB)")
+    ap.add_argument("--legacy-max-mb", type=int, default=500, help="skip json.load above this size")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes for the parallel mode")
+    ap.add_argument("--dir", default=None, help="scratch directory (needs ~3x the export size)")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        print("export MB  conversations  mode        wall s   conv/s   peak RSS MB")
+        for mb in [int(x) for x in args.mb.split(",")]:
+            export = os.path.join(tmp, f"export-{mb}.json")
+            n = write_export(export, mb)
+            for mode in ("legacy", "streaming", "parallel"):
+                if mode == "legacy" and mb > args.legacy_max_mb:
+                    continue
+                res = run(mode, export, tmp, args.workers)
+                if res is None:
+                    print(f"{mb:>9}  {n:>13}  {mode:<10}  failed (likely out of memory)")
+                    continue
+                wall, rss = res
+                label = f"parallel/{args.workers}" if mode == "parallel" else mode
+                print(f"{mb:>9}  {n:>13}  {label:<10}  {wall:7.1f}  {n / wall:7.0f}   {rss:10.0f}")
+            os.remove(export)
+
+
+if __name__ == "__main__":
+    main()
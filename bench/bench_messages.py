@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Loading the newest messages of very long threads: Python-side slicing vs SQL LIMIT.
+
+    python3 bench/bench_messages.py --sizes 1000,10000,50000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from store import Message, Store  # noqa: E402
+
+
+def legacy_newest(store: Store, thread_id: int, limit: int = 50):
+    """The previous implementation: load the whole thread, slice in Python."""
+    with store._conn() as conn:
+        rows = conn.execute(
+            "SELECT id, thread_id, role, content, meta, created_at FROM messages WHERE thread_id = ? ORDER BY id ASC",
+            (thread_id,),
+        ).fetchall()
+    msgs = [Message(*row) for row in rows]
+    return msgs[-limit:]
+
+
+def measure(fn, repeat: int = 5):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best * 1000, peak / 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--sizes", default="1000,10000,50000")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = Store(os.path.join(tmp, "bench.db"))
+        body = "lorem ipsum dolor sit amet " * 40  # ~1 KB per message
+        print("thread size   legacy ms / peak MB   limit=50 ms / peak MB   iterate-all ms / peak MB")
+        for size in [int(s) for s in args.sizes.split(",")]:
+            tid = store.create_thread("openai", "gpt-4o", f"bench-{size}")
+            with store._conn() as conn:
+                conn.executemany(
+                    "INSERT INTO messages(thread_id, role, content, meta, created_at) VALUES (?,?,?,?,?)",
+                    ((tid, "user" if i % 2 else "assistant", body, None, "2024-01-01") for i in range(size)),
+                )
+                conn.commit()
+            legacy = measure(lambda: legacy_newest(store, tid))
+            keyset = measure(lambda: store.get_thread_messages(tid, limit=50))
+            stream = measure(lambda: sum(1 for _ in store.iter_thread_messages(tid)))
+            print(
+                f"{size:>11}   {legacy[0]:8.2f} / {legacy[1]:6.1f}     {keyset[0]:8.2f} / {keyset[1]:6.1f}       "
+                f"{stream[0]:8.2f} / {stream[1]:6.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Memory and time of materialising message rows: legacy dataclasses + dicts vs slotted rows.
+
+Builds one large thread, then measures (tracemalloc peak, best-of wall time):
+  - all messages as Message rows, legacy (__dict__) vs slotted
+  - the provider history path: Message rows converted to {"role", "content"}
+    dicts (the old handle_action) vs Store.get_history's ChatMessage rows
+
+    python3 bench/bench_rows.py --messages 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from store import Store  # noqa: E402
+from utils import db  # noqa: E402
+
+
+@dataclass
+class LegacyMessage:
+    """The pre-slots row type."""
+
+    id: int
+    thread_id: int
+    role: str
+    content: str
+    meta: Optional[str]
+    created_at: str
+
+
+def legacy_messages(store: Store, thread_id: int):
+    with store._conn() as conn:
+        rows = conn.execute(
+            "SELECT id, thread_id, role, content, meta, created_at FROM messages WHERE thread_id = ? ORDER BY id",
+            (thread_id,),
+        ).fetchall()
+    return [LegacyMessage(*row) for row in rows]
+
+
+def legacy_history(store: Store, thread_id: int, limit: int):
+    with store._conn() as conn:
+        rows = conn.execute(
+            "SELECT id, thread_id, role, content, meta, created_at FROM messages WHERE thread_id = ? ORDER BY id DESC LIMIT ?",
+            (thread_id, limit),
+        ).fetchall()
+    rows.reverse()
+    return [{"role": m.role, "content": m.content} for m in (LegacyMessage(*row) for row in rows)]
+
+
+def measure(fn, repeat: int = 3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return best * 1000, peak / 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--messages", type=int, default=20_000)
+    ap.add_argument("--chars", type=int, default=200, help="characters per message (kept below the compression threshold)")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = Store(os.path.join(tmp, "rows.db"))
+        tid = store.create_thread("openai", "gpt-4o", "big")
+        meta = '{"usage": {"prompt_tokens": 120, "completion_tokens": 80}, "tools_dropped": []}'
+        with store._conn() as conn:
+            conn.executemany(
+                "INSERT INTO messages(thread_id, role, content, meta, created_at) VALUES (?,?,?,?,?)",
+                [(tid, "user" if i % 2 else "assistant", f"message {i} " + "x" * args.chars, meta, "2024-01-01T00:00:00")
+                 for i in range(args.messages)],
+            )
+            conn.commit()
+
+        print(f"thread of {args.messages} messages, ~{args.chars} chars each")
+        print("path                                   ms     peak MB")
+        for label, fn in (
+            ("all messages, legacy dataclass", lambda: legacy_messages(store, tid)),
+            ("all messages, slotted Message", lambda: store.get_thread_messages(tid, limit=None)),
+            (f"history {args.messages}, Message -> dicts", lambda: legacy_history(store, tid, args.messages)),
+            (f"history {args.messages}, ChatMessage", lambda: store.get_history(tid, limit=args.messages)),
+            ("history 50, Message -> dicts", lambda: legacy_history(store, tid, 50)),
+            ("history 50, ChatMessage", lambda: store.get_history(tid, limit=50)),
+        ):
+            ms, mb = measure(fn)
+            print(f"{label:<36} {ms:7.2f}  {mb:8.2f}")
+        db.close_all()
+
+
+if __name__ == "__main__":
+    main()
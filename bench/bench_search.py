@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Search latency over a synthetic imported-conversation corpus: LIKE scan vs FTS5.
+
+    python3 bench/bench_search.py --conversations 50000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import itertools
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from aifred import AifredDB, extract_chatgpt_text  # noqa: E402
+
+TOPICAL = (
+    "contract negligence duty care breach damages remoteness causation estoppel equity trust "
+    "fiduciary statute appeal tribunal evidence hearsay privilege discovery costs judgment "
+    "python sqlite index query latency cache memory thread process socket export import "
+    "holiday kyoto tasmania recipe garden bicycle weather music history budget invoice"
+).split()
+
+
+def _vocabulary(rng: random.Random, size: int = 20_000):
+    """Synthetic words with Zipf-like frequencies; topical words spread over the ranks."""
+    syllables = ["ka", "lo", "mi", "ne", "ru", "ta", "shi", "po", "ve", "da", "gri", "on", "el", "ur"]
+    words = ["".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(size)]
+    for j, word in enumerate(TOPICAL):
+        words[5 + j * 97] = word  # ranks 5..~4000: from very common to fairly rare
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(size)))
+    return words, cum_weights
+
+
+def _conversation(rng: random.Random, i: int, vocab) -> dict:
+    words, cum_weights = vocab
+    mapping = {}
+    parent = None
+    for n in range(rng.randint(4, 12)):
+        node_id = f"c{i}-n{n}"
+        text = " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(20, 80)))
+        mapping[node_id] = {
+            "id": node_id,
+            "parent": parent,
+            "children": [],
+            "message": {"author": {"role": "user" if n % 2 == 0 else "assistant"}, "content": {"content_type": "text", "parts": [text]}},
+        }
+        parent = node_id
+    # A rare marker word so selective queries have a small result set
+    if i % 997 == 0:
+        mapping[parent]["message"]["content"]["parts"].append("zanzibar")
+    return {"id": f"conv-{i}", "title": " ".join(rng.choices(words, cum_weights=cum_weights, k=4)), "mapping": mapping}
+
+
+def build(db: AifredDB, n: int) -> None:
+    rng = random.Random(42)
+    vocab = _vocabulary(rng)
+    conn = sqlite3.connect(db.db_path)
+    for i in range(n):
+        conv = _conversation(rng, i, vocab)
+        db._store_conversation(
+            conn, conv["id"], conv["title"], "chatgpt" if i % 3 else "claude",
+            f"2024-01-01T00:00:{i % 60:02d}", f"2024-{1 + i % 12:02d}-01T00:00:00",
+            json.dumps(conv["mapping"]), extract_chatgpt_text(conv["mapping"]),
+        )
+    conn.commit()
+    conn.close()
+
+
+def like_search(db_path, query, limit=50):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(
+        "SELECT * FROM conversations WHERE (title LIKE ? OR messages LIKE ?) ORDER BY updated_at DESC LIMIT ?",
+        (f"%{query}%", f"%{query}%", limit),
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        rows = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000, len(rows)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--conversations", type=int, default=50_000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = AifredDB(os.path.join(tmp, "conversations.db"))
+        t0 = time.perf_counter()
+        build(db, args.conversations)
+        size_mb = os.path.getsize(db.db_path) / 1e6
+        print(f"corpus: {args.conversations} conversations, {size_mb:.0f} MB, built in {time.perf_counter() - t0:.0f}s")
+        print("query                      LIKE ms (rows)     FTS ms (rows)")
+        # contract (rank 5) is in most conversations; later topical words get progressively rarer
+        for query in ["zanzibar", "contract", "negligence", "estop", "kyoto tasmania", "fiduciary duty", "invoice"]:
+            like_ms, like_n = timed(lambda: like_search(db.db_path, query))
+            fts_ms, fts_n = timed(lambda: db.search_conversations(query))
+            print(f"{query:<26} {like_ms:8.1f} ({like_n:>3})    {fts_ms:8.1f} ({fts_n:>3})")
+        fts_ms, _ = timed(lambda: db.search_conversations("zanzibar", platform="claude"))
+        print(f"{'zanzibar +platform':<26} {'':>14}    {fts_ms:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
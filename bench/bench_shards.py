@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""One shared database vs per-profile shards: file size and first-keystroke latency of a small profile.
+
+Fills a large "work" profile and a small "personal" one in a single
+aifred.db, times the personal profile's thread listing in a fresh process,
+then splits the profiles (Store.split_profiles) and times it again.
+
+    python3 bench/bench_shards.py --work-threads 20000 --personal-threads 500
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from store import Store, shard_path  # noqa: E402
+from utils import db  # noqa: E402
+
+# Run in a new interpreter: open the store and list 20 threads, as the
+# Script Filter does on its first keystroke
+_PROBE = """
+import sys, time
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+from store import Store
+s = Store({path!r})
+s.get_recent_thread_summaries(limit=20, profile="personal")
+print((time.perf_counter() - t0) * 1000)
+"""
+
+
+def fill(store: Store, profile: str, threads: int, messages: int) -> None:
+    with store._conn() as conn:
+        for i in range(threads):
+            tid = conn.execute(
+                "INSERT INTO threads(profile, provider, model, name, created_at, updated_at) VALUES (?,?,?,?,?,?)",
+                (profile, "openai", "gpt-4o", f"{profile} {i}", "2024-01-01T00:00:00", "2024-01-01T00:00:00"),
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO messages(thread_id, role, content, meta, created_at) VALUES (?,?,?,?,?)",
+                [(tid, "user" if j % 2 else "assistant", f"message {j} " + "x" * 400, None, f"2024-01-01T00:{j:02d}:00")
+                 for j in range(messages)],
+            )
+        conn.commit()
+
+
+def probe(path: Path, repeat: int = 5) -> float:
+    code = _PROBE.format(root=str(ROOT), path=str(path))
+    return min(float(subprocess.check_output([sys.executable, "-c", code])) for _ in range(repeat))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--work-threads", type=int, default=20_000)
+    ap.add_argument("--personal-threads", type=int, default=500)
+    ap.add_argument("--messages", type=int, default=10, help="messages per thread")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base = Path(tmp) / "aifred.db"
+        store = Store(str(base))
+        fill(store, "work", args.work_threads, args.messages)
+        fill(store, "personal", args.personal_threads, args.messages)
+        db.close_all()
+        shared_mb, shared_ms = os.path.getsize(base) / 1e6, probe(base)
+
+        Store(str(base)).split_profiles()
+        db.close_all()
+        personal = shard_path(base, "personal")
+        print(f"{args.work_threads} work + {args.personal_threads} personal threads, {args.messages} messages each")
+        print("personal profile          file MB   fresh-process list ms")
+        print(f"  shared aifred.db       {shared_mb:8.1f}   {shared_ms:8.1f}")
+        print(f"  own shard              {os.path.getsize(personal) / 1e6:8.1f}   {probe(personal):8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Per-call latency of Store.add_message / get_thread_messages under concurrent writers.
+
+Compares the shared WAL connection (current Store) with the legacy pattern of
+opening a fresh rollback-journal connection per call.
+
+    python3 bench/bench_store.py --writers 1,2,4,8 --ops 300
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from store import Store, utcnow_iso  # noqa: E402
+
+
+class LegacyStore:
+    """The pre-pooling access pattern: connect/commit/close on every call."""
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+
+    def add_message(self, thread_id: int, role: str, content: str) -> None:
+        conn = sqlite3.connect(self.db_path)
+        try:
+            now = utcnow_iso()
+            conn.execute(
+                "INSERT INTO messages(thread_id, role, content, meta, created_at) VALUES (?,?,?,?,?)",
+                (thread_id, role, content, None, now),
+            )
+            conn.execute("UPDATE threads SET updated_at = ? WHERE id = ?", (now, thread_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_thread_messages(self, thread_id: int, limit: int = 50):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(
+                "SELECT id, thread_id, role, content, meta, created_at FROM messages WHERE thread_id = ? ORDER BY id ASC",
+                (thread_id,),
+            ).fetchall()
+        finally:
+            conn.close()
+        return rows[-limit:]
+
+
+def _worker(mode: str, db_path: str, ops: int, out: "mp.Queue") -> None:
+    store = Store(db_path)
+    thread_id = store.create_thread("openai", "gpt-4o", f"bench-{os.getpid()}")
+    api = store if mode == "pooled" else LegacyStore(db_path)
+    add, get, errors = [], [], 0
+    for i in range(ops):
+        try:
+            t0 = time.perf_counter()
+            api.add_message(thread_id, "user", f"message {i} " + "x" * 200)
+            t1 = time.perf_counter()
+            api.get_thread_messages(thread_id, limit=50)
+            t2 = time.perf_counter()
+        except sqlite3.OperationalError:
+            errors += 1
+            continue
+        add.append(t1 - t0)
+        get.append(t2 - t1)
+    out.put((add, get, errors))
+
+
+def _pct(values, p: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p * (len(values) - 1))))] * 1000
+
+
+def run(mode: str, writers: int, ops: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        Store(db_path).close()  # create schema (and switch to WAL)
+        if mode == "legacy":
+            conn = sqlite3.connect(db_path)
+            conn.execute("PRAGMA journal_mode = DELETE")
+            conn.close()
+        q: "mp.Queue" = mp.Queue()
+        procs = [mp.Process(target=_worker, args=(mode, db_path, ops, q)) for _ in range(writers)]
+        for p in procs:
+            p.start()
+        results = [q.get() for _ in procs]
+        for p in procs:
+            p.join()
+    add = [v for r in results for v in r[0]]
+    get = [v for r in results for v in r[1]]
+    return {
+        "mode": mode,
+        "writers": writers,
+        "add_p50": _pct(add, 0.50),
+        "add_p99": _pct(add, 0.99),
+        "get_p50": _pct(get, 0.50),
+        "get_p99": _pct(get, 0.99),
+        "errors": sum(r[2] for r in results),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--writers", default="1,2,4,8")
+    ap.add_argument("--ops", type=int, default=300)
+    ap.add_argument("--modes", default="legacy,pooled")
+    args = ap.parse_args()
+
+    print("mode     writers  add p50/p99 (ms)   get p50/p99 (ms)   locked errors")
+    for writers in [int(w) for w in args.writers.split(",")]:
+        for mode in args.modes.split(","):
+            r = run(mode, writers, args.ops)
+            print(
+                f"{r['mode']:<8} {r['writers']:>7}  {r['add_p50']:7.2f}/{r['add_p99']:<9.2f} "
+                f"{r['get_p50']:7.2f}/{r['get_p99']:<9.2f} {r['errors']:>6}"
+            )
+
+
+if __name__ == "__main__":
+    main()
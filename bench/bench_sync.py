@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Incremental sync vs copying the database: time and bytes for a few new turns.
+
+Fills one database, syncs it in full to a second one (sync --all), then adds
+a few turns and times an incremental export + import against copying the
+whole file.
+
+    python3 bench/bench_sync.py --threads 2000 --messages 20 --new 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from store import Store  # noqa: E402
+from utils import db  # noqa: E402
+
+
+def folder_bytes(path: str) -> int:
+    return sum(f.stat().st_size for f in Path(path).rglob("*.jsonl"))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--threads", type=int, default=2000)
+    ap.add_argument("--messages", type=int, default=20, help="messages per thread")
+    ap.add_argument("--new", type=int, default=10, help="turns added before the incremental sync")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shared = os.path.join(tmp, "shared")
+        for d in ("a", "b", "copy"):
+            os.makedirs(os.path.join(tmp, d))
+        a, b = Store(os.path.join(tmp, "a", "aifred.db")), Store(os.path.join(tmp, "b", "aifred.db"))
+        with a._conn() as conn:
+            for i in range(args.threads):
+                tid = conn.execute(
+                    "INSERT INTO threads(provider, model, name, created_at, updated_at) VALUES ('openai', 'gpt-4o', ?, ?, ?)",
+                    (f"thread {i}", "2024-01-01T00:00:00", "2024-01-01T00:00:00"),
+                ).lastrowid
+                conn.executemany(
+                    "INSERT INTO messages(thread_id, role, content, created_at) VALUES (?,?,?,?)",
+                    [(tid, "user" if j % 2 else "assistant", f"message {j} " + "lorem ipsum " * 60, "2024-01-01T00:00:00")
+                     for j in range(args.messages)],
+                )
+            conn.commit()
+
+        t0 = time.perf_counter()
+        a.sync_export(shared, device="a", everything=True)
+        b.sync_import(shared, device="b")
+        full = time.perf_counter() - t0
+        full_bytes = folder_bytes(shared)
+
+        tid = a.create_thread("openai", "gpt-4o", "new")
+        for i in range(args.new):
+            a.add_message(tid, "user", f"question {i}")
+            a.add_message(tid, "assistant", "answer " + "lorem ipsum " * 60)
+        t0 = time.perf_counter()
+        records = a.sync_export(shared, device="a")
+        b.sync_import(shared, device="b")
+        incremental = time.perf_counter() - t0
+        incremental_bytes = folder_bytes(shared) - full_bytes
+
+        with a._conn() as conn:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        t0 = time.perf_counter()
+        shutil.copyfile(a.db_path, os.path.join(tmp, "copy", "aifred.db"))
+        copy = time.perf_counter() - t0
+        db_bytes = os.path.getsize(a.db_path)
+        db.close_all()
+
+    print(f"{args.threads} threads x {args.messages} messages, then {args.new} new turns ({records} records)")
+    print(f"{'':28}{'ms':>10}{'MB':>10}")
+    print(f"{'first sync (--all)':28}{full * 1000:10.0f}{full_bytes / 1e6:10.2f}")
+    print(f"{'incremental export+import':28}{incremental * 1000:10.1f}{incremental_bytes / 1e6:10.3f}")
+    print(f"{'copy aifred.db':28}{copy * 1000:10.1f}{db_bytes / 1e6:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
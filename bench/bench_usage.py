@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Per-day/per-model usage totals: parsing meta in Python vs Store.usage_by_day.
+
+Fills one database with assistant replies spread over a year and several
+models (each preceded by a user message), then times the aggregation both ways.
+
+    python3 bench/bench_usage.py --replies 50000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from store import Store  # noqa: E402
+from utils import db  # noqa: E402
+from utils.usage import normalise  # noqa: E402
+
+MODELS = [("openai", "gpt-4o"), ("openai", "o4-mini"), ("anthropic", "claude-3-7-sonnet"), ("gemini", "gemini-1.5-pro")]
+
+
+def python_rollup(store: Store):
+    """What a usage report had to do before: read and parse every message's meta."""
+    totals = defaultdict(lambda: [0, 0, 0])
+    with store._conn() as conn:
+        rows = conn.execute(
+            "SELECT substr(m.created_at, 1, 10), t.provider, t.model, m.meta FROM messages m "
+            "JOIN threads t ON t.id = m.thread_id WHERE m.role = 'assistant'"
+        )
+        for day, provider, model, meta in rows:
+            u = normalise(json.loads(meta).get("usage")) if meta else {}
+            row = totals[(day, provider, model)]
+            row[0] += 1
+            row[1] += u.get("prompt_tokens", 0)
+            row[2] += u.get("completion_tokens", 0)
+    return sorted(totals.items())
+
+
+def measure(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--replies", type=int, default=50_000)
+    args = ap.parse_args()
+
+    rnd = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = Store(os.path.join(tmp, "usage.db"))
+        threads = [store.create_thread(p, m, None) for p, m in MODELS]
+        rows = []
+        for i in range(args.replies):
+            k = rnd.randrange(len(MODELS))
+            provider, model = MODELS[k]
+            day = f"2024-{1 + i * 12 // args.replies:02d}-{1 + rnd.randrange(28):02d}T12:00:00+00:00"
+            meta = {"usage": normalise({"prompt_tokens": rnd.randrange(2000), "completion_tokens": rnd.randrange(800)}),
+                    "provider": provider, "model": model, "latency_ms": rnd.randrange(300, 9000)}
+            rows.append((threads[k], "user", "question " * 20, None, day))
+            rows.append((threads[k], "assistant", "answer " * 80, json.dumps(meta), day))
+        with store._conn() as conn:
+            conn.executemany("INSERT INTO messages(thread_id, role, content, meta, created_at) VALUES (?,?,?,?,?)", rows)
+            conn.commit()
+            conn.execute("ANALYZE")
+
+        groups = len(store.usage_by_day())
+        print(f"{args.replies} replies, {groups} day x model groups")
+        print(f"  parse meta in Python   {measure(lambda: python_rollup(store)):9.2f} ms")
+        print(f"  usage_by_day           {measure(store.usage_by_day):9.2f} ms")
+        print(f"  usage_by_day (1 month) {measure(lambda: store.usage_by_day('2024-06-01', '2024-06-30')):9.2f} ms")
+        db.close_all()
+
+
+if __name__ == "__main__":
+    main()
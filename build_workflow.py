@@ -32,6 +32,7 @@ def main():
             root / "setup.py",
             root / "aifred.py",
             root / "alfred_filter.py",
+            root / "alfred_filter_client.py",
             root / "alfred_action.py",
             root / "alfred_settings.py",
             root / "alfred_personas.py",
@@ -39,6 +40,7 @@ def main():
             root / "alfred_actions_run.py",
             root / "alfred_attach.py",
             root / "alfred_models.py",
+            root / "alfred_stats.py",
             root / "store.py",
             root / "build_workflow.py",
         ]
@@ -16,7 +16,7 @@ def main():
         return
     
     # Make scripts executable
-    scripts = ['aifred.py', 'alfred_filter.py', 'alfred_action.py']
+    scripts = ['aifred.py', 'alfred_filter.py', 'alfred_filter_client.py', 'alfred_action.py']
     for script in scripts:
         os.chmod(script, 0o755)
         print(f"✅ Made {script} executable")
@@ -28,7 +28,7 @@ def main():
     print("   - ANTHROPIC_API_KEY (required for Anthropic)")
     print("   - Optional: AIFRED_PROVIDER_DEFAULT, AIFRED_MODEL_DEFAULT_OPENAI, AIFRED_MODEL_DEFAULT_ANTHROPIC")
     print("   - Optional: AIFRED_SYSTEM_PROMPT_PATH, AIFRED_DB_PATH, AIFRED_DRY_RUN=1")
-    print("2) In Alfred, add a Script Filter node running: /usr/bin/python3 \"$PWD/alfred_filter.py\" \"{query}\"")
+    print("2) In Alfred, add a Script Filter node running: /usr/bin/python3 \"$PWD/alfred_filter_client.py\" \"{query}\"")
     print("3) Connect it to a Run Script node running: /usr/bin/python3 \"$PWD/alfred_action.py\" \"{query}\"")
     print("4) Type 'ai Hello @gpt-4o' in Alfred to send a message.")
 
@@ -1,20 +1,30 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import os
-import sqlite3
+import re
+import uuid
 from contextlib import contextmanager
 from dataclasses import dataclass
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Iterable, List, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from utils import compress, db, journal, locks, migrations, sync, usage
+from utils.fts import fts_query
+from utils.logger import get_logger
 
 
 def utcnow_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
-def _default_db_path() -> Path:
+# One database file per profile (see _default_db_path)
+SHARD_BY_PROFILE = os.getenv("AIFRED_SHARD_PROFILES") == "1"
+
+
+def _base_db_path() -> Path:
     # Priority: explicit env -> Alfred workflow data -> local file
     env_path = os.getenv("AIFRED_DB_PATH")
     if env_path:
@@ -29,8 +39,127 @@ def _default_db_path() -> Path:
     return Path("aifred.db")
 
 
+def _default_db_path(profile: Optional[str] = None) -> Path:
+    # With sharding on, a profile other than the default gets its own file
+    # next to the base one; the default profile stays in the base file
+    base = _base_db_path()
+    if SHARD_BY_PROFILE and profile and profile != "default":
+        return shard_path(base, profile)
+    return base
+
+
+def shard_path(base: Path, profile: str) -> Path:
+    """The database file of ``profile`` beside ``base`` (aifred.db -> aifred.work.db)."""
+    return base.with_name(f"{base.stem}.{re.sub(r'[^A-Za-z0-9_]', '_', profile)}{base.suffix or '.db'}")
+
+
+def shard_paths(base: Path) -> List[Path]:
+    """The profile shards that exist beside ``base``, not counting ``base`` itself."""
+    pattern = re.compile(re.escape(base.stem) + r"\.[A-Za-z0-9_]+" + re.escape(base.suffix or ".db") + "$")
+    if not base.parent.is_dir():
+        return []
+    return sorted(p for p in base.parent.iterdir() if pattern.match(p.name))
+
+
+def _default_archive_path(db_path: Path) -> Path:
+    env_path = os.getenv("AIFRED_ARCHIVE_PATH")
+    if env_path:
+        return Path(env_path)
+    return db_path.with_name(f"{db_path.stem}-archive{db_path.suffix or '.db'}")
+
+
+def _default_journal_path(db_path: Path) -> Path:
+    env_path = os.getenv("AIFRED_JOURNAL_PATH")
+    if env_path:
+        return Path(env_path)
+    return db_path.with_suffix(".journal")
+
+
+# Longest a turn waits for another turn on the same thread (Store.thread_lock)
+THREAD_LOCK_TIMEOUT = float(os.getenv("AIFRED_THREAD_LOCK_TIMEOUT", "120"))
+
+# Threads idle longer than this many days move to the archive on `maintain`
+ARCHIVE_AFTER_DAYS = int(os.getenv("AIFRED_ARCHIVE_DAYS", "180"))
+
+# Characters of the last assistant reply kept on the thread row
+PREVIEW_CHARS = 2000
+
+# Token counts from a message's meta JSON. Providers report usage in different
+# shapes (OpenAI prompt_tokens, Anthropic input_tokens, Gemini usageMetadata).
+_PROMPT_TOKENS_SQL = """COALESCE(CASE WHEN json_valid({m}.meta) THEN COALESCE(
+  json_extract({m}.meta, '$.usage.prompt_tokens'),
+  json_extract({m}.meta, '$.usage.input_tokens'),
+  json_extract({m}.meta, '$.usage.promptTokenCount')) END, 0)"""
+_COMPLETION_TOKENS_SQL = """COALESCE(CASE WHEN json_valid({m}.meta) THEN COALESCE(
+  json_extract({m}.meta, '$.usage.completion_tokens'),
+  json_extract({m}.meta, '$.usage.output_tokens'),
+  json_extract({m}.meta, '$.usage.candidatesTokenCount')) END, 0)"""
+
+# Recompute a thread's summary columns from its messages ({tid} is an SQL
+# expression). Used by the delete/update triggers and the backfill migration;
+# inserts take the cheaper incremental path in messages_summary_ai. SQL cannot
+# read a compressed body, so a compressed last reply leaves the preview empty
+# here (blob rows store no content and are skipped); Store.add_message sets it
+# from the plain text instead.
+_RECOMPUTE_SUMMARY_SQL = """
+UPDATE threads SET
+  message_count = (SELECT COUNT(*) FROM messages WHERE thread_id = {tid}),
+  last_message_id = (SELECT MAX(id) FROM messages WHERE thread_id = {tid}),
+  last_assistant_preview = (
+    SELECT CASE WHEN content_encoding IS NULL THEN substr(content, 1, %(preview)d) END FROM messages
+    WHERE thread_id = {tid} AND role = 'assistant' AND content <> ''
+    ORDER BY id DESC LIMIT 1),
+  total_prompt_tokens = (SELECT COALESCE(SUM(%(prompt)s), 0) FROM messages mm WHERE mm.thread_id = {tid}),
+  total_completion_tokens = (SELECT COALESCE(SUM(%(completion)s), 0) FROM messages mm WHERE mm.thread_id = {tid})
+WHERE id = {tid}
+""" % {
+    "preview": PREVIEW_CHARS,
+    "prompt": _PROMPT_TOKENS_SQL.format(m="mm"),
+    "completion": _COMPLETION_TOKENS_SQL.format(m="mm"),
+}
+
+# A row in trigger_bypass, written and deleted inside one transaction (so no
+# other connection sees it), turns off the update triggers for a rewrite that
+# keeps every message's text: Store.recompress
+_SUMMARY_TRIGGERS_SQL = """
+CREATE TABLE IF NOT EXISTS trigger_bypass (name TEXT PRIMARY KEY) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS messages_summary_ai AFTER INSERT ON messages BEGIN
+  UPDATE threads SET
+    message_count = message_count + 1,
+    last_message_id = NEW.id,
+    last_assistant_preview = CASE
+      WHEN NEW.role = 'assistant' AND NEW.content_encoding IS NULL AND NEW.content <> ''
+        THEN substr(NEW.content, 1, %(preview)d)
+      ELSE last_assistant_preview END,
+    total_prompt_tokens = total_prompt_tokens + %(prompt)s,
+    total_completion_tokens = total_completion_tokens + %(completion)s,
+    updated_at = NEW.created_at
+  WHERE id = NEW.thread_id;
+END;
+CREATE TRIGGER IF NOT EXISTS messages_summary_ad AFTER DELETE ON messages BEGIN
+  %(recompute_old)s;
+END;
+CREATE TRIGGER IF NOT EXISTS messages_summary_au AFTER UPDATE OF thread_id, role, content, meta ON messages
+WHEN NOT EXISTS (SELECT 1 FROM trigger_bypass) BEGIN
+  %(recompute_old)s;
+  %(recompute_new)s;
+END;
+""" % {
+    "preview": PREVIEW_CHARS,
+    "prompt": _PROMPT_TOKENS_SQL.format(m="NEW"),
+    "completion": _COMPLETION_TOKENS_SQL.format(m="NEW"),
+    "recompute_old": _RECOMPUTE_SUMMARY_SQL.format(tid="OLD.thread_id"),
+    "recompute_new": _RECOMPUTE_SUMMARY_SQL.format(tid="NEW.thread_id"),
+}
+
+
+# Row types declare __slots__ (no per-instance __dict__): listings and
+# exports build thousands of them.
+
+
 @dataclass
 class Thread:
+    __slots__ = ("id", "provider", "model", "name", "created_at", "updated_at")
     id: int
     provider: str
     model: str
@@ -40,7 +169,32 @@ class Thread:
 
 
 @dataclass
-class Message:
+class ThreadSummary(Thread):
+    __slots__ = ("preview", "message_count", "last_message_id", "total_prompt_tokens", "total_completion_tokens")
+    preview: str
+    message_count: int
+    last_message_id: Optional[int]
+    total_prompt_tokens: int
+    total_completion_tokens: int
+
+
+class _MessageMapping:
+    # Read-only mapping access (m["content"], m.get("role")), so provider
+    # clients and trim_history take rows as they are, with no dict per message
+    __slots__ = ()
+
+    def __getitem__(self, key: str):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+
+@dataclass
+class Message(_MessageMapping):
+    __slots__ = ("id", "thread_id", "role", "content", "meta", "created_at")
     id: int
     thread_id: int
     role: str
@@ -49,77 +203,739 @@ class Message:
     created_at: str
 
 
+@dataclass
+class ChatMessage(_MessageMapping):
+    """Just role and content: the projection sent to providers (Store.get_history)."""
+
+    __slots__ = ("role", "content")
+    role: str
+    content: str
+
+
+@dataclass
+class DailyUsage:
+    """Assistant replies and their usage for one day, provider and model (Store.usage_by_day)."""
+
+    __slots__ = ("day", "provider", "model", "replies", "prompt_tokens", "completion_tokens", "avg_latency_ms")
+    day: str
+    provider: str
+    model: Optional[str]
+    replies: int
+    prompt_tokens: int
+    completion_tokens: int
+    avg_latency_ms: Optional[float]
+
+
+@dataclass
+class UsageRollup:
+    """One usage_rollup row: a day's replies for a profile, provider and model (Store.usage_rollup)."""
+
+    __slots__ = (
+        "day", "profile", "provider", "model", "requests", "errors", "prompt_tokens", "completion_tokens",
+        "latency_ms_sum", "latency_count", "latency_buckets",
+    )
+    day: str
+    profile: str
+    provider: str
+    model: str
+    requests: int
+    errors: int
+    prompt_tokens: int
+    completion_tokens: int
+    latency_ms_sum: int
+    latency_count: int
+    latency_buckets: Tuple[int, ...]  # counts per LATENCY_BUCKETS_MS bound, then one for slower replies
+
+
+_MESSAGE_COLUMNS = "id, thread_id, role, content, meta, created_at, content_encoding, blob_id"
+# Every column, for moving rows between databases (archive, shards)
+_MESSAGE_COPY_COLUMNS = _MESSAGE_COLUMNS + ", uid, edited_at, edited_by"
+_THREAD_COLUMNS = (
+    "id, profile, provider, model, name, created_at, updated_at, last_message_id, "
+    "last_assistant_preview, message_count, total_prompt_tokens, total_completion_tokens, "
+    "parent_id, fork_message_id, uid, meta_updated_at"
+)
+
+# A branch (Store.fork_thread) stores only its own messages and reads its
+# parent's up to fork_message_id, and so on up the chain. Resolved here to
+# (thread_id, last message id or NULL for all) per thread, newest first.
+_ANCESTRY_SQL = """
+WITH RECURSIVE chain(thread_id, upto) AS (
+  SELECT ?, NULL
+  UNION ALL
+  SELECT t.parent_id, t.fork_message_id FROM chain JOIN threads t ON t.id = chain.thread_id
+  WHERE t.parent_id IS NOT NULL
+)
+SELECT thread_id, upto FROM chain
+"""
+
+# Cold storage for idle threads, attached to the main connection as
+# `archive`. Rows keep their ids (AUTOINCREMENT never reuses them) and summary
+# columns; there are no triggers, since archived threads are read-only. Blobs
+# stay in the main database, shared with live threads.
+# messages_fts is contentless: the text lives (possibly compressed) in
+# archive.messages, and is indexed once on the way in.
+_ARCHIVE_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS archive.threads (
+  id INTEGER PRIMARY KEY,
+  profile TEXT NOT NULL DEFAULT 'default',
+  provider TEXT NOT NULL,
+  model TEXT NOT NULL,
+  name TEXT,
+  created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL,
+  last_message_id INTEGER,
+  last_assistant_preview TEXT,
+  message_count INTEGER NOT NULL DEFAULT 0,
+  total_prompt_tokens INTEGER NOT NULL DEFAULT 0,
+  total_completion_tokens INTEGER NOT NULL DEFAULT 0,
+  archived_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS archive.idx_archive_threads_updated ON threads(profile, updated_at);
+CREATE TABLE IF NOT EXISTS archive.messages (
+  id INTEGER PRIMARY KEY,
+  thread_id INTEGER NOT NULL,
+  role TEXT NOT NULL,
+  content TEXT NOT NULL,
+  meta JSON,
+  created_at TEXT NOT NULL,
+  content_encoding TEXT,
+  blob_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS archive.idx_archive_messages_thread ON messages(thread_id, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS archive.messages_fts USING fts5(
+  content, content='', tokenize='unicode61 remove_diacritics 2'
+);
+"""
+_MESSAGES_FTS_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+    "content, content='', tokenize='unicode61 remove_diacritics 2')"
+)
+_SUMMARY_COLUMNS = (
+    "id, provider, model, name, created_at, updated_at, COALESCE(last_assistant_preview, ''), "
+    "message_count, last_message_id, total_prompt_tokens, total_completion_tokens"
+)
+
+
+def _blob_chunks(conn, blob_id: int, chunk_size: int) -> Iterator[bytes]:
+    # Incremental blob I/O: never materialises the whole value in SQL
+    if hasattr(conn, "blobopen"):  # Python 3.11+
+        with conn.blobopen("blobs", "data", blob_id, readonly=True) as blob:
+            while True:
+                chunk = blob.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+    offset = 1
+    while True:
+        row = conn.execute("SELECT substr(data, ?, ?) FROM blobs WHERE id = ?", (offset, chunk_size, blob_id)).fetchone()
+        if not row or not row[0]:
+            return
+        yield row[0]
+        offset += len(row[0])
+
+
+def _thread_row(cursor, row) -> Thread:
+    return Thread(*row)
+
+
+def _summary_row(cursor, row) -> ThreadSummary:
+    return ThreadSummary(*row)
+
+
+def _usage_row(cursor, row) -> DailyUsage:
+    return DailyUsage(*row)
+
+
+def _rollup_row(cursor, row) -> UsageRollup:
+    return UsageRollup(*row[:10], tuple(row[10:]))
+
+
+def _profile_summary_row(cursor, row) -> Tuple[str, ThreadSummary]:
+    return row[0], ThreadSummary(*row[1:])
+
+
+def _profiles(conn, schema: str) -> Iterator[str]:
+    # Distinct non-default profiles, one index probe each (no scan)
+    profile = ""
+    while True:
+        row = conn.execute(
+            f"SELECT profile FROM {schema}.threads WHERE profile > ? ORDER BY profile LIMIT 1", (profile,)
+        ).fetchone()
+        if row is None:
+            return
+        profile = row[0]
+        if profile != "default":
+            yield profile
+
+
+def _blob_preview(data: Union[str, bytes]) -> str:
+    text = data if isinstance(data, str) else data[: PREVIEW_CHARS * 4].decode("utf-8", "ignore")
+    return text[:PREVIEW_CHARS]
+
+
+def _stored_size(value) -> int:
+    return len(value.encode("utf-8")) if isinstance(value, str) else len(value)
+
+
+def _chain_sql(columns: str, chain, before_id: Optional[int] = None, after_id: Optional[int] = None) -> Tuple[str, list]:
+    # One SELECT per thread of a branch's chain (_ANCESTRY_SQL), joined by
+    # UNION ALL. Ordered by id, SQLite merges the arms in index order, so a
+    # long chain costs no sort; an ordinary thread is a single arm.
+    arms, params = [], []
+    for thread_id, upto in chain:
+        sql = f"SELECT {columns} FROM messages WHERE thread_id = ?"
+        params.append(thread_id)
+        for clause, value in (("id <= ?", upto), ("id < ?", before_id), ("id > ?", after_id)):
+            if value is not None:
+                sql += f" AND {clause}"
+                params.append(value)
+        arms.append(sql)
+    return " UNION ALL ".join(arms), params
+
+
+# Schema migrations, applied in order and recorded in PRAGMA user_version
+# (utils/migrations.py). Append new steps; never edit or reorder shipped ones.
+# Databases created before versioning start at 0 in any earlier layout, so
+# the first steps check what already exists before altering.
+
+
+def _create_tables(conn) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS threads (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          profile TEXT NOT NULL DEFAULT 'default',
+          provider TEXT NOT NULL,
+          model TEXT NOT NULL,
+          name TEXT,
+          created_at TEXT NOT NULL,
+          updated_at TEXT NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          thread_id INTEGER NOT NULL,
+          role TEXT NOT NULL,
+          content TEXT NOT NULL,
+          meta JSON,
+          created_at TEXT NOT NULL,
+          FOREIGN KEY(thread_id) REFERENCES threads(id)
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_thread ON messages(thread_id)")
+    # Latest message of a given role per thread (thread previews)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_thread_role ON messages(thread_id, role, id)")
+
+
+def _columns(conn, table: str) -> List[str]:
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _add_profile(conn) -> None:
+    if "profile" not in _columns(conn, "threads"):
+        conn.execute("ALTER TABLE threads ADD COLUMN profile TEXT NOT NULL DEFAULT 'default'")
+
+
+def _add_summary_columns(conn) -> None:
+    # Denormalised summary columns, kept current by triggers
+    if "message_count" not in _columns(conn, "threads"):
+        conn.execute("ALTER TABLE threads ADD COLUMN last_message_id INTEGER")
+        conn.execute("ALTER TABLE threads ADD COLUMN last_assistant_preview TEXT")
+        conn.execute("ALTER TABLE threads ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0")
+        conn.execute("ALTER TABLE threads ADD COLUMN total_prompt_tokens INTEGER NOT NULL DEFAULT 0")
+        conn.execute("ALTER TABLE threads ADD COLUMN total_completion_tokens INTEGER NOT NULL DEFAULT 0")
+
+
+def _add_content_encoding(conn) -> None:
+    # Per-row compression flag (NULL = plain text)
+    if "content_encoding" not in _columns(conn, "messages"):
+        conn.execute("ALTER TABLE messages ADD COLUMN content_encoding TEXT")
+
+
+def _create_summary_triggers(conn) -> None:
+    # Recreated against the final column set, then every thread backfilled
+    for name in ("messages_summary_ai", "messages_summary_ad", "messages_summary_au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for statement in migrations.statements(_SUMMARY_TRIGGERS_SQL):
+        conn.execute(statement)
+    conn.execute(_RECOMPUTE_SUMMARY_SQL.format(tid="threads.id"))
+
+
+def _create_blobs(conn) -> None:
+    # Content-addressed payloads (tool results, attachments): one copy per
+    # distinct SHA-256, referenced from messages.blob_id
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS blobs (
+          id INTEGER PRIMARY KEY,
+          hash TEXT NOT NULL UNIQUE,
+          size INTEGER NOT NULL,
+          encoding TEXT,
+          data BLOB NOT NULL,
+          created_at TEXT NOT NULL
+        )
+        """
+    )
+    if "blob_id" not in _columns(conn, "messages"):
+        conn.execute("ALTER TABLE messages ADD COLUMN blob_id INTEGER REFERENCES blobs(id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_blob ON messages(blob_id) WHERE blob_id IS NOT NULL")
+
+
+def _create_thread_indexes(conn) -> None:
+    # One per threads query shape: equality columns first, then updated_at, so
+    # "newest first" is an index walk with no sort (tests/test_query_plans.py)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_threads_profile_updated ON threads(profile, updated_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_threads_provider_updated ON threads(profile, provider, updated_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_threads_model_updated ON threads(profile, provider, model, updated_at)")
+    # archive_threads across all profiles
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_threads_updated ON threads(updated_at)")
+
+
+def _create_journal_applied(conn) -> None:
+    # Write-behind journal entries already applied (Turn.commit), so a replay
+    # after a crash between commit and journal truncation is a no-op
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS journal_applied (id TEXT PRIMARY KEY, thread_id INTEGER NOT NULL, applied_at TEXT NOT NULL) WITHOUT ROWID"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_journal_applied_at ON journal_applied(applied_at)")
+
+
+# Reply analytics read from meta by virtual generated columns. Meta stays
+# JSON text: SQLite's JSONB needs 3.45, and a file written with it is
+# unreadable by the older SQLite bundled with many Pythons. The aggregates
+# read only the covering index below, never the JSON.
+_USAGE_COLUMNS = (
+    ("prompt_tokens", "INTEGER", "json_extract(meta, '$.usage.prompt_tokens')"),
+    ("completion_tokens", "INTEGER", "json_extract(meta, '$.usage.completion_tokens')"),
+    ("reply_provider", "TEXT", "json_extract(meta, '$.provider')"),
+    ("reply_model", "TEXT", "json_extract(meta, '$.model')"),
+    ("latency_ms", "INTEGER", "json_extract(meta, '$.latency_ms')"),
+)
+
+# Rewrite pre-normalisation meta into the canonical shape (utils/usage.py):
+# usage keys renamed, and provider/model taken from the thread
+_NORMALISE_META_SQL = """
+UPDATE {schema}.messages SET meta = json_set(meta,
+  '$.usage', json_object(
+    'prompt_tokens', COALESCE(json_extract(meta, '$.usage.prompt_tokens'), json_extract(meta, '$.usage.input_tokens'),
+      json_extract(meta, '$.usage.promptTokenCount')),
+    'completion_tokens', COALESCE(json_extract(meta, '$.usage.completion_tokens'), json_extract(meta, '$.usage.output_tokens'),
+      json_extract(meta, '$.usage.candidatesTokenCount'))),
+  '$.provider', COALESCE(json_extract(meta, '$.provider'), (SELECT provider FROM {schema}.threads t WHERE t.id = thread_id)),
+  '$.model', COALESCE(json_extract(meta, '$.model'), (SELECT model FROM {schema}.threads t WHERE t.id = thread_id)))
+WHERE json_valid(meta) AND json_type(meta, '$.usage') = 'object'
+"""
+
+
+def _add_usage_columns(conn) -> None:
+    # Token totals are unchanged by the rewrite, so skip the summary
+    # recompute the update trigger would run for every row
+    conn.execute("DROP TRIGGER IF EXISTS messages_summary_au")
+    conn.execute(_NORMALISE_META_SQL.format(schema="main"))
+    for statement in migrations.statements(_SUMMARY_TRIGGERS_SQL):
+        conn.execute(statement)
+    existing = [r[1] for r in conn.execute("PRAGMA table_xinfo(messages)")]
+    for name, kind, expr in _USAGE_COLUMNS:
+        if name not in existing:
+            conn.execute(
+                f"ALTER TABLE messages ADD COLUMN {name} {kind} "
+                f"GENERATED ALWAYS AS (CASE WHEN json_valid(meta) THEN {expr} END) VIRTUAL"
+            )
+    if "created_day" not in existing:
+        conn.execute("ALTER TABLE messages ADD COLUMN created_day TEXT GENERATED ALWAYS AS (substr(created_at, 1, 10)) VIRTUAL")
+    # Covering index for usage_by_day: the GROUP BY walks it in order
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_messages_usage ON messages("
+        "created_day, reply_provider, reply_model, prompt_tokens, completion_tokens, latency_ms) "
+        "WHERE reply_provider IS NOT NULL"
+    )
+
+
+# Upper bounds of the usage_rollup latency histogram; a last bucket counts slower replies
+LATENCY_BUCKETS_MS = (1000, 3000, 10000, 30000)
+_LATENCY_BUCKET_COLUMNS = [f"latency_le_{b // 1000}s" for b in LATENCY_BUCKETS_MS] + [
+    f"latency_gt_{LATENCY_BUCKETS_MS[-1] // 1000}s"
+]
+
+
+def _latency_bucket_sql(m: str) -> List[str]:
+    # One 0/1 expression per histogram column for the reply {m}
+    bounds = [f"{m}.latency_ms <= {b}" + (f" AND {m}.latency_ms > {a}" if a else "")
+              for a, b in zip((0,) + LATENCY_BUCKETS_MS, LATENCY_BUCKETS_MS)]
+    bounds.append(f"{m}.latency_ms > {LATENCY_BUCKETS_MS[-1]}")
+    return [f"({b})" for b in bounds]
+
+
+# Per day x profile x provider x model totals, bumped by a trigger as each
+# reply is written, so reports never read messages. Rollups are history:
+# archiving or deleting messages leaves them as they are, and restored
+# messages (inserted before their thread row) aren't counted again.
+_USAGE_ROLLUP_SQL = """
+CREATE TABLE IF NOT EXISTS usage_rollup (
+  day TEXT NOT NULL,
+  profile TEXT NOT NULL,
+  provider TEXT NOT NULL,
+  model TEXT NOT NULL,
+  requests INTEGER NOT NULL,
+  errors INTEGER NOT NULL,
+  prompt_tokens INTEGER NOT NULL,
+  completion_tokens INTEGER NOT NULL,
+  latency_ms_sum INTEGER NOT NULL,
+  latency_count INTEGER NOT NULL,
+  %(bucket_defs)s,
+  PRIMARY KEY (day, profile, provider, model)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS messages_usage_ai AFTER INSERT ON messages
+WHEN NEW.reply_provider IS NOT NULL BEGIN
+  INSERT INTO usage_rollup (day, profile, provider, model, requests, errors, prompt_tokens, completion_tokens,
+    latency_ms_sum, latency_count, %(buckets)s)
+  SELECT NEW.created_day, t.profile, NEW.reply_provider, COALESCE(NEW.reply_model, ''), 1, %(error)s,
+    COALESCE(NEW.prompt_tokens, 0), COALESCE(NEW.completion_tokens, 0),
+    COALESCE(NEW.latency_ms, 0), NEW.latency_ms IS NOT NULL, %(new_buckets)s
+  FROM threads t WHERE t.id = NEW.thread_id
+  ON CONFLICT (day, profile, provider, model) DO UPDATE SET
+    requests = requests + 1,
+    errors = errors + excluded.errors,
+    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+    completion_tokens = completion_tokens + excluded.completion_tokens,
+    latency_ms_sum = latency_ms_sum + excluded.latency_ms_sum,
+    latency_count = latency_count + excluded.latency_count,
+    %(bucket_updates)s;
+END;
+""" % {
+    "bucket_defs": ",\n  ".join(f"{c} INTEGER NOT NULL" for c in _LATENCY_BUCKET_COLUMNS),
+    "buckets": ", ".join(_LATENCY_BUCKET_COLUMNS),
+    "error": "COALESCE(json_extract(NEW.meta, '$.error'), 0) <> 0",
+    "new_buckets": ", ".join(f"COALESCE({e}, 0)" for e in _latency_bucket_sql("NEW")),
+    "bucket_updates": ",\n    ".join(f"{c} = {c} + excluded.{c}" for c in _LATENCY_BUCKET_COLUMNS),
+}
+
+
+# Add one usage_rollup row into another with the same key (split_profiles)
+_ROLLUP_MERGE_SQL = ", ".join(
+    f"{c} = {c} + excluded.{c}"
+    for c in ["requests", "errors", "prompt_tokens", "completion_tokens", "latency_ms_sum", "latency_count"]
+    + _LATENCY_BUCKET_COLUMNS
+)
+
+
+def _create_usage_rollup(conn) -> None:
+    for statement in migrations.statements(_USAGE_ROLLUP_SQL):
+        conn.execute(statement)
+    buckets = _latency_bucket_sql("m")
+    conn.execute(
+        f"INSERT OR REPLACE INTO usage_rollup SELECT m.created_day, t.profile, m.reply_provider, "
+        f"COALESCE(m.reply_model, ''), COUNT(*), SUM(COALESCE(json_extract(m.meta, '$.error'), 0) <> 0), "
+        f"COALESCE(SUM(m.prompt_tokens), 0), COALESCE(SUM(m.completion_tokens), 0), "
+        f"COALESCE(SUM(m.latency_ms), 0), COUNT(m.latency_ms), "
+        + ", ".join(f"COALESCE(SUM({b}), 0)" for b in buckets)
+        + " FROM messages m JOIN threads t ON t.id = m.thread_id WHERE m.reply_provider IS NOT NULL "
+        "GROUP BY 1, 2, 3, 4"
+    )
+
+
+def _add_thread_branches(conn) -> None:
+    # fork_message_id is the parent's last message the branch shares; it
+    # always belongs to parent_id itself (see Store._fork_point)
+    if "parent_id" not in _columns(conn, "threads"):
+        conn.execute("ALTER TABLE threads ADD COLUMN parent_id INTEGER REFERENCES threads(id)")
+        conn.execute("ALTER TABLE threads ADD COLUMN fork_message_id INTEGER")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_threads_parent ON threads(parent_id) WHERE parent_id IS NOT NULL")
+
+
+# Replication (Store.sync_export / sync_import). Rows get a uid that is the
+# same on every machine: new rows a uuid4, existing rows one derived from
+# their id and creation time, so two copies of one database agree on it.
+# Triggers log each insert, and each edit of replicated fields, to `changes`
+# by local row id; an export reads those rows' current state. Deletes are
+# not logged: here they are moves into the archive or a shard, which every
+# machine does on its own schedule.
+_CHANGE_LOG_SQL = """
+CREATE TABLE IF NOT EXISTS changes (
+  seq INTEGER PRIMARY KEY AUTOINCREMENT,
+  kind TEXT NOT NULL,
+  row_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS threads_uid_ai AFTER INSERT ON threads WHEN NEW.uid IS NULL BEGIN
+  UPDATE threads SET uid = lower(hex(randomblob(16))) WHERE id = NEW.id;
+END;
+CREATE TRIGGER IF NOT EXISTS messages_uid_ai AFTER INSERT ON messages WHEN NEW.uid IS NULL BEGIN
+  UPDATE messages SET uid = lower(hex(randomblob(16))) WHERE id = NEW.id;
+END;
+"""
+
+# Rows are logged only once this database syncs (sync_state has a position);
+# until then sync_export's first run logs every row itself
+_CHANGE_LOG_TRIGGERS_SQL = """
+CREATE TRIGGER IF NOT EXISTS changes_threads_ai AFTER INSERT ON threads
+WHEN EXISTS (SELECT 1 FROM sync_state) BEGIN
+  INSERT INTO changes(kind, row_id) VALUES ('thread', NEW.id);
+END;
+CREATE TRIGGER IF NOT EXISTS changes_threads_au AFTER UPDATE OF profile, provider, model, name ON threads
+WHEN EXISTS (SELECT 1 FROM sync_state) BEGIN
+  INSERT INTO changes(kind, row_id) VALUES ('thread', NEW.id);
+END;
+CREATE TRIGGER IF NOT EXISTS changes_messages_ai AFTER INSERT ON messages
+WHEN EXISTS (SELECT 1 FROM sync_state) BEGIN
+  INSERT INTO changes(kind, row_id) VALUES ('message', NEW.id);
+END;
+CREATE TRIGGER IF NOT EXISTS changes_messages_au AFTER UPDATE OF role, content, meta ON messages
+WHEN EXISTS (SELECT 1 FROM sync_state) AND NOT EXISTS (SELECT 1 FROM trigger_bypass) BEGIN
+  INSERT INTO changes(kind, row_id) VALUES ('message', NEW.id);
+END;
+"""
+
+# uid for rows that predate replication ({schema} is main or archive)
+_BACKFILL_UIDS_SQL = """
+UPDATE {schema}.threads SET uid = 't' || id || '-' || created_at WHERE uid IS NULL;
+UPDATE {schema}.messages SET uid = 'm' || id || '-' || created_at WHERE uid IS NULL;
+"""
+
+
+def _create_change_log(conn) -> None:
+    for table in ("threads", "messages"):
+        if "uid" not in _columns(conn, table):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN uid TEXT")
+    for statement in migrations.statements(_BACKFILL_UIDS_SQL.format(schema="main")):
+        conn.execute(statement)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_threads_uid ON threads(uid)")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_uid ON messages(uid)")
+    for statement in migrations.statements(_CHANGE_LOG_SQL + _CHANGE_LOG_TRIGGERS_SQL):
+        conn.execute(statement)
+
+
+def _create_messages_fts(conn) -> None:
+    # Live message text for search_all_profiles, contentless like the
+    # archive's: each row is indexed as it is written (Store._fts), so
+    # existing rows are indexed here once
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone():
+        return
+    conn.execute(_MESSAGES_FTS_SQL)
+    last = 0
+    while True:
+        rows = conn.execute(
+            "SELECT m.id, m.content, m.content_encoding, b.encoding, b.data FROM messages m "
+            "LEFT JOIN blobs b ON b.id = m.blob_id WHERE m.id > ? ORDER BY m.id LIMIT 1000",
+            (last,),
+        ).fetchall()
+        if not rows:
+            return
+        texts = []
+        for message_id, value, encoding, blob_encoding, data in rows:
+            if data is not None:
+                decoder = compress.decompressor(blob_encoding)
+                texts.append((message_id, (decoder.decompress(data) + decoder.flush()).decode("utf-8")))
+            else:
+                texts.append((message_id, compress.decompress(value, encoding)))
+        conn.executemany("INSERT INTO messages_fts(rowid, content) VALUES (?, ?)", texts)
+        last = rows[-1][0]
+
+
+def _add_thread_meta_updated_at(conn) -> None:
+    # When name/provider/model last changed (NULL: never since created_at).
+    # Sync compares this, not updated_at, which every message bumps.
+    if "meta_updated_at" not in _columns(conn, "threads"):
+        conn.execute("ALTER TABLE threads ADD COLUMN meta_updated_at TEXT")
+
+
+# A local edit of a message's text, role or meta (not a recompression, see
+# trigger_bypass) stamps it; edited_by NULL means this device. sync_import
+# sets both to the version it applies, which the WHEN clause leaves alone.
+_MESSAGE_EDITS_SQL = """
+CREATE TRIGGER IF NOT EXISTS messages_edited_au AFTER UPDATE OF role, content, meta ON messages
+WHEN NEW.edited_at IS OLD.edited_at AND NEW.edited_by IS OLD.edited_by
+AND NOT EXISTS (SELECT 1 FROM trigger_bypass) BEGIN
+  UPDATE messages SET edited_at = strftime('%Y-%m-%dT%H:%M:%f000+00:00', 'now'), edited_by = NULL WHERE id = NEW.id;
+END;
+"""
+
+
+def _add_message_edits(conn) -> None:
+    for column in ("edited_at", "edited_by"):
+        if column not in _columns(conn, "messages"):
+            conn.execute(f"ALTER TABLE messages ADD COLUMN {column} TEXT")
+    for statement in migrations.statements(_MESSAGE_EDITS_SQL):
+        conn.execute(statement)
+
+
+def _log_changes_once_synced(conn) -> None:
+    # The change log grew forever on a database that never syncs; a first
+    # export logs every row anyway, so an unsynced log is dropped
+    for name in ("changes_threads_ai", "changes_threads_au", "changes_messages_ai", "changes_messages_au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for statement in migrations.statements(_CHANGE_LOG_TRIGGERS_SQL):
+        conn.execute(statement)
+    if conn.execute("SELECT 1 FROM sync_state").fetchone() is None:
+        conn.execute("DELETE FROM changes")
+
+
+def _add_trigger_bypass(conn) -> None:
+    # messages_summary_au took a changed content_encoding for a
+    # recompression, so it missed edits changing the text and its encoding
+    # together; recompress now bypasses it explicitly
+    conn.execute("DROP TRIGGER IF EXISTS messages_summary_au")
+    for statement in migrations.statements(_SUMMARY_TRIGGERS_SQL):
+        conn.execute(statement)
+
+
+def _bypass_sync_triggers(conn) -> None:
+    # Like messages_summary_au: edits changing the text and its encoding
+    # together were neither logged for sync nor stamped as edits
+    for name in ("changes_messages_au", "messages_edited_au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for statement in migrations.statements(_CHANGE_LOG_TRIGGERS_SQL + _MESSAGE_EDITS_SQL):
+        conn.execute(statement)
+
+
+_MIGRATIONS = [
+    _create_tables,
+    _add_profile,
+    _add_summary_columns,
+    _add_content_encoding,
+    _create_summary_triggers,
+    _create_blobs,
+    _create_thread_indexes,
+    _create_journal_applied,
+    _add_usage_columns,
+    _create_usage_rollup,
+    _add_thread_branches,
+    _create_change_log,
+    _create_messages_fts,
+    _add_thread_meta_updated_at,
+    _add_message_edits,
+    _log_changes_once_synced,
+    _add_trigger_bypass,
+    _bypass_sync_triggers,
+]
+
+
+def _create_archive(conn) -> None:
+    for statement in migrations.statements(_ARCHIVE_SCHEMA_SQL):
+        conn.execute(statement)
+    if "blob_id" not in [r[1] for r in conn.execute("PRAGMA archive.table_info(messages)")]:
+        conn.execute("ALTER TABLE archive.messages ADD COLUMN blob_id INTEGER")
+
+
+def _create_archive_blob_index(conn) -> None:
+    # gc_blobs checks archived references too
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_messages_blob ON messages(blob_id) WHERE blob_id IS NOT NULL")
+
+
+def _normalise_archive_meta(conn) -> None:
+    # So restored messages arrive in the shape the main generated columns read
+    conn.execute(_NORMALISE_META_SQL.format(schema="archive"))
+
+
+def _add_archive_branches(conn) -> None:
+    if "parent_id" not in [r[1] for r in conn.execute("PRAGMA archive.table_info(threads)")]:
+        conn.execute("ALTER TABLE archive.threads ADD COLUMN parent_id INTEGER")
+        conn.execute("ALTER TABLE archive.threads ADD COLUMN fork_message_id INTEGER")
+
+
+def _add_archive_uids(conn) -> None:
+    # sync_import looks up threads archived here by uid
+    for table in ("threads", "messages"):
+        if "uid" not in [r[1] for r in conn.execute(f"PRAGMA archive.table_info({table})")]:
+            conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN uid TEXT")
+    for statement in migrations.statements(_BACKFILL_UIDS_SQL.format(schema="archive")):
+        conn.execute(statement)
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_threads_uid ON threads(uid)")
+
+
+def _add_archive_meta_updated_at(conn) -> None:
+    if "meta_updated_at" not in [r[1] for r in conn.execute("PRAGMA archive.table_info(threads)")]:
+        conn.execute("ALTER TABLE archive.threads ADD COLUMN meta_updated_at TEXT")
+
+
+def _add_archive_message_edits(conn) -> None:
+    existing = [r[1] for r in conn.execute("PRAGMA archive.table_info(messages)")]
+    for column in ("edited_at", "edited_by"):
+        if column not in existing:
+            conn.execute(f"ALTER TABLE archive.messages ADD COLUMN {column} TEXT")
+
+
+_ARCHIVE_MIGRATIONS = [
+    _create_archive,
+    _create_archive_blob_index,
+    _normalise_archive_meta,
+    _add_archive_branches,
+    _add_archive_uids,
+    _add_archive_meta_updated_at,
+    _add_archive_message_edits,
+]
+
+
 class Store:
-    def __init__(self, db_path: Optional[str] = None) -> None:
-        self.db_path = Path(db_path) if db_path else _default_db_path()
+    def __init__(self, db_path: Optional[str] = None, archive_path: Optional[str] = None, profile: Optional[str] = None) -> None:
+        """Open (creating or migrating as needed) the store at ``db_path``.
+
+        Without a path the file comes from _default_db_path: with
+        AIFRED_SHARD_PROFILES=1 that is ``profile``'s own shard.
+        """
+        self.db_path = Path(db_path) if db_path else _default_db_path(profile)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.archive_path = Path(archive_path) if archive_path else _default_archive_path(self.db_path)
+        self.journal_path = _default_journal_path(self.db_path)
+        self.lock_dir = self.db_path.with_name(f"{self.db_path.stem}-locks")
         self._init()
 
     @contextmanager
     def _conn(self):
-        conn = sqlite3.connect(self.db_path)
+        # Shared per-process connection (see utils/db.py); never closed here so
+        # the statement cache and WAL state persist across calls.
+        conn = db.connect(self.db_path)
         try:
             yield conn
-        finally:
-            conn.close()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+
+    def close(self) -> None:
+        db.close(self.db_path)
+
+    @contextmanager
+    def _archive_conn(self):
+        # The shared connection with the archive attached (on first use only,
+        # so everyday calls never open the cold file)
+        with self._conn() as conn:
+            if not any(row[1] == "archive" for row in conn.execute("PRAGMA database_list")):
+                conn.execute("ATTACH DATABASE ? AS archive", (str(self.archive_path),))
+                conn.execute("PRAGMA archive.auto_vacuum = INCREMENTAL")
+                try:
+                    conn.execute("PRAGMA archive.journal_mode = WAL")
+                except Exception:
+                    pass
+                migrations.migrate(conn, _ARCHIVE_MIGRATIONS, schema="archive")
+            yield conn
 
     def _init(self) -> None:
         with self._conn() as conn:
-            conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS threads (
-                  id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  profile TEXT NOT NULL DEFAULT 'default',
-                  provider TEXT NOT NULL,
-                  model TEXT NOT NULL,
-                  name TEXT,
-                  created_at TEXT NOT NULL,
-                  updated_at TEXT NOT NULL
-                )
-                """
-            )
-            conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS messages (
-                  id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  thread_id INTEGER NOT NULL,
-                  role TEXT NOT NULL,
-                  content TEXT NOT NULL,
-                  meta JSON,
-                  created_at TEXT NOT NULL,
-                  FOREIGN KEY(thread_id) REFERENCES threads(id)
-                )
-                """
-            )
-            conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_messages_thread ON messages(thread_id)"
-            )
-            # Migration: add profile column to existing threads if missing
-            try:
-                cur = conn.execute("PRAGMA table_info(threads)")
-                cols = [r[1] for r in cur.fetchall()]
-                if "profile" not in cols:
-                    conn.execute("ALTER TABLE threads ADD COLUMN profile TEXT NOT NULL DEFAULT 'default'")
-            except Exception:
-                pass
-            conn.commit()
+            migrations.migrate(conn, _MIGRATIONS)
 
     # Thread API
     def create_thread(self, provider: str, model: str, name: Optional[str], profile: str = "default") -> int:
         now = utcnow_iso()
         with self._conn() as conn:
             cur = conn.execute(
-                "INSERT INTO threads(profile, provider, model, name, created_at, updated_at) VALUES (?,?,?,?,?,?)",
-                (profile, provider, model, name, now, now),
+                "INSERT INTO threads(profile, provider, model, name, created_at, updated_at, uid) VALUES (?,?,?,?,?,?,?)",
+                (profile, provider, model, name, now, now, uuid.uuid4().hex),
             )
             conn.commit()
             return int(cur.lastrowid)
 
     def update_thread_name(self, thread_id: int, name: str) -> None:
+        now = utcnow_iso()
         with self._conn() as conn:
             conn.execute(
-                "UPDATE threads SET name = ?, updated_at = ? WHERE id = ?",
-                (name, utcnow_iso(), thread_id),
+                "UPDATE threads SET name = ?, updated_at = ?, meta_updated_at = ? WHERE id = ?",
+                (name, now, now, thread_id),
             )
             conn.commit()
 
@@ -131,14 +947,78 @@ class Store:
             )
             conn.commit()
 
+    def _rows(self, factory, sql: str, params) -> list:
+        # Rows are built by the cursor's row factory as they are fetched, so
+        # no list of raw tuples is held alongside the finished objects
+        with self._conn() as conn:
+            cur = conn.cursor()
+            cur.row_factory = factory
+            return cur.execute(sql, params).fetchall()
+
     def get_recent_threads(self, limit: int = 20, profile: str = "default") -> List[Thread]:
+        return self._rows(
+            _thread_row,
+            "SELECT id, provider, model, name, created_at, updated_at FROM threads WHERE profile = ? ORDER BY updated_at DESC LIMIT ?",
+            (profile, limit),
+        )
+
+    def get_recent_thread_summaries(self, limit: int = 20, profile: str = "default") -> List[ThreadSummary]:
+        """Recent threads with their last assistant reply and message count.
+
+        Reads only the threads table: the summary columns are maintained by
+        triggers on messages, so cost is independent of history size.
+        """
+        return self._rows(
+            _summary_row,
+            f"SELECT {_SUMMARY_COLUMNS} FROM threads WHERE profile = ? ORDER BY updated_at DESC LIMIT ?",
+            (profile, limit),
+        )
+
+    def data_version(self) -> int:
+        """A number that changes whenever another connection commits to the database.
+
+        A cheap check for long-lived readers (the filter daemon) that cache
+        query results; this process's own writes don't change it.
+        """
         with self._conn() as conn:
-            cur = conn.execute(
-                "SELECT id, provider, model, name, created_at, updated_at FROM threads WHERE profile = ? ORDER BY updated_at DESC LIMIT ?",
-                (profile, limit),
-            )
-            rows = cur.fetchall()
-        return [Thread(*row) for row in rows]
+            return conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def get_thread_summary(self, thread_id: int) -> Optional[ThreadSummary]:
+        with self._conn() as conn:
+            cur = conn.execute(f"SELECT {_SUMMARY_COLUMNS} FROM threads WHERE id = ?", (thread_id,))
+            row = cur.fetchone()
+        return ThreadSummary(*row) if row else None
+
+    def iter_thread_summaries(
+        self,
+        profile: Optional[str] = None,
+        provider: Optional[str] = None,
+        since: Optional[str] = None,
+        before: Optional[str] = None,
+        batch_size: int = 500,
+    ) -> Iterator[ThreadSummary]:
+        """Yield every matching thread in id order, one keyset page at a time.
+
+        ``since``/``before`` bound ``updated_at`` (ISO strings, so a bare date
+        such as 2024-06-01 works). Like iter_thread_messages, no statement
+        stays open between pages.
+        """
+        sql = f"SELECT {_SUMMARY_COLUMNS} FROM threads WHERE id > ?"
+        filters: list = []
+        # Unary + keeps the filters off the (profile, ...) indexes: walking the
+        # primary key in id order beats an index search plus a sort per page
+        for clause, value in (("+profile = ?", profile), ("+provider = ?", provider), ("+updated_at >= ?", since), ("+updated_at < ?", before)):
+            if value is not None:
+                sql += f" AND {clause}"
+                filters.append(value)
+        sql += " ORDER BY id LIMIT ?"
+        last_id = 0
+        while True:
+            rows = self._rows(_summary_row, sql, [last_id, *filters, batch_size])
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1].id
 
     def get_thread(self, thread_id: int) -> Optional[Thread]:
         with self._conn() as conn:
@@ -165,29 +1045,1115 @@ class Store:
         return Thread(*row) if row else None
 
     # Messages API
-    def add_message(self, thread_id: int, role: str, content: str, meta: Optional[dict] = None) -> int:
-        now = utcnow_iso()
+    def add_message(
+        self, thread_id: int, role: str, content: str, meta: Optional[dict] = None, blob_id: Optional[int] = None
+    ) -> int:
+        """Append a message.
+
+        With ``blob_id`` the body is that blob (see put_blob); ``content`` is
+        then only used for the thread preview and is not stored.
+        """
+        with self._conn() as conn:
+            message_id = self._insert_message(conn, thread_id, role, content, meta, blob_id)
+            conn.commit()
+            return message_id
+
+    def _insert_message(
+        self,
+        conn,
+        thread_id: int,
+        role: str,
+        content: str,
+        meta: Optional[dict],
+        blob_id: Optional[int],
+        created_at: Optional[str] = None,
+        uid: Optional[str] = None,
+        body: Union[str, bytes, None] = None,
+    ) -> int:
+        if meta and "usage" in meta:
+            meta = dict(meta, usage=usage.normalise(meta["usage"]))
         meta_json = json.dumps(meta) if meta is not None else None
+        stored, encoding = compress.compress(content) if blob_id is None else ("", None)
+        # messages_summary_ai bumps the thread's updated_at and summary columns
+        cur = conn.execute(
+            "INSERT INTO messages(thread_id, role, content, meta, created_at, content_encoding, blob_id, uid) VALUES (?,?,?,?,?,?,?,?)",
+            (thread_id, role, stored, meta_json, created_at or utcnow_iso(), encoding, blob_id, uid or uuid.uuid4().hex),
+        )
+        if (encoding or blob_id) and role == "assistant":
+            # The trigger can't read a compressed body; set the preview here
+            conn.execute(
+                "UPDATE threads SET last_assistant_preview = ? WHERE id = ?",
+                (content[:PREVIEW_CHARS], thread_id),
+            )
+        # With a blob, content is only the preview; index the full body the
+        # caller has in hand rather than reading the blob back
+        if blob_id is None:
+            text = content
+        elif body is None:
+            text = self.read_blob(blob_id)
+        else:
+            text = body.decode("utf-8") if isinstance(body, bytes) else body
+        self._fts(conn, "main", [(cur.lastrowid, text)])
+        return int(cur.lastrowid)
+
+    def turn(self) -> "Turn":
+        """Unit of work for one action: thread creation and its messages, written in a single transaction.
+
+        Use as ``with store.turn() as turn: ...``; nothing is written until the
+        block exits normally (see Turn).
+        """
+        return Turn(self)
+
+    def thread_lock(self, thread_id: int, timeout: Optional[float] = None):
+        """Advisory lock serialising turns on one thread across processes (utils/locks.py).
+
+        Raises locks.LockTimeout if another turn still holds it after
+        ``timeout`` seconds (default THREAD_LOCK_TIMEOUT).
+        """
+        return locks.lock(self.lock_dir, f"thread-{thread_id}", THREAD_LOCK_TIMEOUT if timeout is None else timeout)
+
+    def replay_journal(self, on_entry: Optional[Callable[[dict], None]] = None) -> int:
+        """Apply turns deferred to the write-behind journal (Turn.defer); returns how many.
+
+        Cheap when there is nothing to do. ``on_entry`` runs after each entry
+        is committed (e.g. its deferred side effects). An entry that fails
+        (its fork point was deleted, the database stayed locked) is logged and
+        retried by later replays, and moved to ``<journal>.failed`` after
+        ``journal.MAX_ATTEMPTS`` failures. Applied ids are kept for a day,
+        which outlasts any journal that could still hold them.
+        """
+        if not journal.pending(self.journal_path):
+            return 0
+
+        def apply(entry: dict) -> None:
+            Turn.from_entry(self, entry["turn"]).commit(journal_id=entry["id"])
+            if on_entry is not None:
+                on_entry(entry)
+
+        def on_error(entry: dict, exc: Exception) -> None:
+            get_logger().warning("Journal entry %s failed to apply: %s", entry.get("id"), exc)
+
+        count = journal.drain(self.journal_path, apply, on_error)
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()
         with self._conn() as conn:
-            cur = conn.execute(
-                "INSERT INTO messages(thread_id, role, content, meta, created_at) VALUES (?,?,?,?,?)",
-                (thread_id, role, content, meta_json, now),
+            conn.execute("DELETE FROM journal_applied WHERE applied_at < ?", (cutoff,))
+            conn.commit()
+        return count
+
+    # Blob API
+
+    def put_blob(self, data: Union[str, bytes]) -> int:
+        """Store ``data`` once per SHA-256 and return its blob id.
+
+        Storing the same payload again (the same page fetched in another
+        thread) returns the existing id. Payloads are compressed like message
+        bodies (utils/compress.py).
+        """
+        with self._conn() as conn:
+            blob_id = self._put_blob(conn, data)
+            conn.commit()
+            return blob_id
+
+    def _put_blob(self, conn, data: Union[str, bytes]) -> int:
+        raw = data.encode("utf-8") if isinstance(data, str) else data
+        digest = hashlib.sha256(raw).hexdigest()
+        row = conn.execute("SELECT id FROM blobs WHERE hash = ?", (digest,)).fetchone()
+        if row:
+            return int(row[0])
+        packed, encoding = compress.pack(raw)
+        conn.execute(
+            "INSERT INTO blobs(hash, size, encoding, data, created_at) VALUES (?,?,?,?,?) ON CONFLICT(hash) DO NOTHING",
+            (digest, len(raw), encoding, packed, utcnow_iso()),
+        )
+        return int(conn.execute("SELECT id FROM blobs WHERE hash = ?", (digest,)).fetchone()[0])
+
+    def add_blob_message(self, thread_id: int, role: str, data: Union[str, bytes], meta: Optional[dict] = None) -> int:
+        """Append a message whose body is stored as a (deduplicated) blob."""
+        with self._conn() as conn:
+            message_id = self._insert_message(
+                conn, thread_id, role, _blob_preview(data), meta, self._put_blob(conn, data), body=data
             )
+            conn.commit()
+            return message_id
+
+    def iter_blob(self, blob_id: int, chunk_size: int = 1 << 16) -> Iterator[bytes]:
+        """Yield a blob's original bytes, decompressed incrementally as they are read."""
+        with self._conn() as conn:
+            row = conn.execute("SELECT encoding FROM blobs WHERE id = ?", (blob_id,)).fetchone()
+            if row is None:
+                raise KeyError(f"No blob {blob_id}")
+            decoder = compress.decompressor(row[0])
+            for chunk in _blob_chunks(conn, blob_id, chunk_size):
+                out = decoder.decompress(chunk)
+                if out:
+                    yield out
+            tail = decoder.flush()
+            if tail:
+                yield tail
+
+    def read_blob(self, blob_id: int) -> str:
+        return b"".join(self.iter_blob(blob_id)).decode("utf-8")
+
+    def gc_blobs(self, min_age_seconds: int = 3600) -> Tuple[int, int]:
+        """Delete blobs no live or archived message references; returns (blobs, bytes).
+
+        Blobs younger than ``min_age_seconds`` are kept, so a blob stored just
+        before its message is never collected in between.
+        """
+        cutoff = (datetime.now(timezone.utc) - timedelta(seconds=min_age_seconds)).isoformat()
+        orphans = (
+            "FROM blobs WHERE created_at < ? "
+            "AND id NOT IN (SELECT blob_id FROM main.messages WHERE blob_id IS NOT NULL) "
+            "AND id NOT IN (SELECT blob_id FROM archive.messages WHERE blob_id IS NOT NULL)"
+        )
+        with self._archive_conn() as conn:
+            count, size = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(length(data)), 0) {orphans}", (cutoff,)).fetchone()
+            conn.execute(f"DELETE {orphans}", (cutoff,))
+            conn.commit()
+        return count, size
+
+    def recompress(
+        self, algorithm: Optional[str] = None, min_chars: Optional[int] = None, batch_size: int = 500
+    ) -> Tuple[int, int, int]:
+        """Re-encode every stored message body with the current (or given) settings.
+
+        Returns (rows rewritten, their stored bytes before, after). Only the
+        encoding changes, not the text, so each batch bypasses the update
+        triggers (trigger_bypass). Freed pages are reused by later writes;
+        VACUUM shrinks the file.
+        """
+        rewritten = before = after = 0
+        last_id = 0
+        while True:
+            with self._conn() as conn:
+                rows = conn.execute(
+                    "SELECT id, content, content_encoding FROM messages WHERE id > ? AND blob_id IS NULL ORDER BY id LIMIT ?",
+                    (last_id, batch_size),
+                ).fetchall()
+                updates = []
+                for message_id, value, encoding in rows:
+                    stored, new_encoding = compress.compress(compress.decompress(value, encoding), algorithm, min_chars)
+                    if new_encoding != encoding:
+                        updates.append((stored, new_encoding, message_id))
+                        before += _stored_size(value)
+                        after += _stored_size(stored)
+                conn.execute("INSERT INTO trigger_bypass(name) VALUES ('recompress')")
+                conn.executemany("UPDATE messages SET content = ?, content_encoding = ? WHERE id = ?", updates)
+                conn.execute("DELETE FROM trigger_bypass WHERE name = 'recompress'")
+                conn.commit()
+            rewritten += len(updates)
+            if len(rows) < batch_size:
+                return rewritten, before, after
+            last_id = rows[-1][0]
+
+    def get_thread_messages(
+        self,
+        thread_id: int,
+        limit: Optional[int] = 50,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+    ) -> List[Message]:
+        """Messages of a thread in chronological order, limited in SQL.
+
+        By default returns the newest ``limit`` messages. ``before_id`` pages
+        backwards (the newest ``limit`` messages older than that id);
+        ``after_id`` pages forwards (the oldest ``limit`` messages newer than
+        it). ``limit=None`` or 0 returns every matching message. A branch's
+        history includes its ancestors' messages up to each fork point.
+        """
+        sql, params = _chain_sql(_MESSAGE_COLUMNS, self._ancestry(thread_id), before_id, after_id)
+        newest_first = bool(limit) and after_id is None
+        sql += " ORDER BY id DESC" if newest_first else " ORDER BY id ASC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = self._rows(self._message_row, sql, params)
+        if newest_first:
+            rows.reverse()
+        return rows
+
+    def get_history(self, thread_id: int, limit: int = 50, before_id: Optional[int] = None) -> List[ChatMessage]:
+        """The newest ``limit`` messages (older than ``before_id``, if given) as role/content pairs, oldest first.
+
+        Selects only the columns a provider needs (no meta or timestamps); the
+        rows can be passed to trim_history and the clients directly.
+        """
+        # id last, for the ORDER BY across a branch's arms; _chat_row ignores it
+        sql, params = _chain_sql("role, content, content_encoding, blob_id, id", self._ancestry(thread_id), before_id)
+        rows = self._rows(self._chat_row, sql + " ORDER BY id DESC LIMIT ?", params + [limit])
+        rows.reverse()
+        return rows
+
+    def _ancestry(self, thread_id: int) -> List[Tuple[int, Optional[int]]]:
+        with self._conn() as conn:
+            return conn.execute(_ANCESTRY_SQL, (thread_id,)).fetchall()
+
+    # Branches
+
+    def fork_thread(
+        self,
+        thread_id: int,
+        message_id: Optional[int] = None,
+        provider: Optional[str] = None,
+        model: Optional[str] = None,
+        name: Optional[str] = None,
+    ) -> int:
+        """Start a branch of ``thread_id`` sharing its history up to ``message_id`` (default: all of it).
+
+        Nothing is copied: new messages are stored under the branch, and
+        get_thread_messages reads the shared ones from the ancestors. Provider,
+        model and name default to the parent's; the profile is the parent's.
+        Raises ValueError if ``message_id`` isn't in the thread's history.
+        """
+        with self._conn() as conn:
+            branch_id = self._insert_branch(conn, thread_id, message_id, provider, model, name)
+            conn.commit()
+            return branch_id
+
+    def _insert_branch(
+        self, conn, thread_id: int, message_id: Optional[int], provider: Optional[str], model: Optional[str], name: Optional[str]
+    ) -> int:
+        row = conn.execute("SELECT profile, provider, model, name FROM threads WHERE id = ?", (thread_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"No thread {thread_id}")
+        parent_id, fork_message_id = self._fork_point(conn, thread_id, message_id)
+        now = utcnow_iso()
+        cur = conn.execute(
+            "INSERT INTO threads(profile, provider, model, name, created_at, updated_at, parent_id, fork_message_id, uid) "
+            "VALUES (?,?,?,?,?,?,?,?,?)",
+            (row[0], provider or row[1], model or row[2], row[3] if name is None else name, now, now, parent_id, fork_message_id,
+             uuid.uuid4().hex),
+        )
+        return int(cur.lastrowid)
+
+    def _fork_point(self, conn, thread_id: int, message_id: Optional[int]) -> Tuple[int, int]:
+        # (owning thread, message id): a branch points at the thread that
+        # stores the message, so its chain never walks a thread it skips all of
+        chain = conn.execute(_ANCESTRY_SQL, (thread_id,)).fetchall()
+        if message_id is None:
+            sql, params = _chain_sql("id, thread_id", chain)
+            row = conn.execute(sql + " ORDER BY id DESC LIMIT 1", params).fetchone()
+        else:
+            row = conn.execute("SELECT id, thread_id FROM messages WHERE id = ?", (message_id,)).fetchone()
+            if row and not any(tid == row[1] and (upto is None or row[0] <= upto) for tid, upto in chain):
+                row = None
+        if row is None:
+            what = f"message {message_id}" if message_id is not None else "messages"
+            raise ValueError(f"Thread {thread_id} has no {what} to branch from")
+        return row[1], row[0]
+
+    # Row factories for message queries. Plain rows (the common case) skip
+    # the codec and blob lookups entirely.
+
+    def _message_row(self, cursor, row) -> Message:
+        if row[6] is None and row[7] is None:
+            return Message(row[0], row[1], row[2], row[3], row[4], row[5])
+        return Message(row[0], row[1], row[2], self._text(row[3], row[6], row[7]), row[4], row[5])
+
+    def _chat_row(self, cursor, row) -> ChatMessage:
+        if row[2] is None and row[3] is None:
+            return ChatMessage(row[0], row[1])
+        return ChatMessage(row[0], self._text(row[1], row[2], row[3]))
+
+    def _text(self, value, encoding: Optional[str], blob_id: Optional[int]) -> str:
+        return self.read_blob(blob_id) if blob_id is not None else compress.decompress(value, encoding)
+
+    def iter_thread_messages(self, thread_id: int, batch_size: int = 500, after_id: Optional[int] = None) -> Iterator[Message]:
+        """Yield every message of a thread oldest-first, one keyset page at a time.
+
+        Memory stays bounded by ``batch_size`` and no read statement is held
+        open between pages, so long exports don't block writers.
+        """
+        while True:
+            page = self.get_thread_messages(thread_id, limit=batch_size, after_id=after_id or 0)
+            yield from page
+            if len(page) < batch_size:
+                return
+            after_id = page[-1].id
+
+    # Usage API
+
+    def usage_by_day(self, since: Optional[str] = None, until: Optional[str] = None) -> List[DailyUsage]:
+        """Assistant replies per day (UTC, ``YYYY-MM-DD``), provider and model, oldest first.
+
+        One GROUP BY over the covering idx_messages_usage index: no meta is
+        parsed and no message row is read. ``since``/``until`` are inclusive
+        days. Archived threads are not counted.
+        """
+        return self._rows(
+            _usage_row,
+            "SELECT created_day, reply_provider, reply_model, COUNT(*), COALESCE(SUM(prompt_tokens), 0), "
+            "COALESCE(SUM(completion_tokens), 0), AVG(latency_ms) FROM messages "
+            "WHERE reply_provider IS NOT NULL AND created_day BETWEEN ? AND ? "
+            "GROUP BY created_day, reply_provider, reply_model ORDER BY created_day, reply_provider, reply_model",
+            (since or "", until or "9999-12-31"),
+        )
+
+    def usage_rollup(
+        self, since: Optional[str] = None, until: Optional[str] = None, profile: Optional[str] = None
+    ) -> List[UsageRollup]:
+        """Rows of the trigger-maintained usage_rollup table for ``since``..``until`` (inclusive days).
+
+        Unlike usage_by_day this includes replies since archived, and never
+        touches messages: a month of stats is a few dozen rows.
+        """
+        sql = (
+            "SELECT day, profile, provider, model, requests, errors, prompt_tokens, completion_tokens, "
+            f"latency_ms_sum, latency_count, {', '.join(_LATENCY_BUCKET_COLUMNS)} FROM usage_rollup "
+            "WHERE day BETWEEN ? AND ?"
+        )
+        params: list = [since or "", until or "9999-12-31"]
+        if profile:
+            # Unary +: filter while walking the primary key, so ORDER BY needs no sort
+            sql += " AND +profile = ?"
+            params.append(profile)
+        return self._rows(_rollup_row, sql + " ORDER BY day, profile, provider, model", params)
+
+    # Archive API
+
+    def archive_threads(self, idle_days: int = ARCHIVE_AFTER_DAYS, profile: Optional[str] = None, batch_size: int = 100) -> int:
+        """Move threads not updated for ``idle_days`` into the archive database.
+
+        Each batch is copied, indexed for search, then deleted from the main
+        database. Across attached WAL databases a commit is atomic per file
+        only, so the copy commits first: a crash can leave a thread in both
+        places (the next run replaces the copy), never in neither.
+        """
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=idle_days)).isoformat()
+        where = "updated_at < ?" + (" AND profile = ?" if profile else "")
+        # A thread stays while a live branch reads its messages
+        where += " AND id NOT IN (SELECT parent_id FROM main.threads WHERE parent_id IS NOT NULL)"
+        params = [cutoff] + ([profile] if profile else [])
+        moved = 0
+        with self._archive_conn() as conn:
+            while True:
+                ids = [row[0] for row in conn.execute(
+                    f"SELECT id FROM main.threads WHERE {where} ORDER BY updated_at LIMIT ?", (*params, batch_size)
+                )]
+                if not ids:
+                    return moved
+                marks = ",".join("?" * len(ids))
+                conn.execute(
+                    f"INSERT OR REPLACE INTO archive.threads ({_THREAD_COLUMNS}, archived_at) "
+                    f"SELECT {_THREAD_COLUMNS}, ? FROM main.threads WHERE id IN ({marks})",
+                    (utcnow_iso(), *ids),
+                )
+                # Entries of a copy left by an interrupted run
+                batch = f"thread_id IN ({marks})"
+                self._fts(conn, "archive", self._message_texts(conn, "archive", batch, ids), delete=True)
+                conn.execute(
+                    f"INSERT OR REPLACE INTO archive.messages ({_MESSAGE_COPY_COLUMNS}) "
+                    f"SELECT {_MESSAGE_COPY_COLUMNS} FROM main.messages WHERE {batch}",
+                    ids,
+                )
+                texts = self._message_texts(conn, "main", batch, ids)
+                self._fts(conn, "archive", texts)
+                conn.commit()
+                self._fts(conn, "main", texts, delete=True)
+                # Threads first: with the thread row gone, the summary trigger
+                # on each deleted message matches nothing and costs nothing.
+                conn.execute(f"DELETE FROM main.threads WHERE id IN ({marks})", ids)
+                conn.execute(f"DELETE FROM main.messages WHERE thread_id IN ({marks})", ids)
+                conn.commit()
+                moved += len(ids)
+
+    def _message_texts(self, conn, schema: str, where: str, params) -> List[Tuple[int, str]]:
+        # (id, text) of the messages of ``schema`` matching ``where``; blob ids
+        # always refer to the main database's blobs
+        return [(message_id, self._text(value, encoding, blob_id)) for message_id, value, encoding, blob_id in conn.execute(
+            f"SELECT id, content, content_encoding, blob_id FROM {schema}.messages WHERE {where}", params
+        ).fetchall()]
+
+    def _fts(self, conn, schema: str, texts: List[Tuple[int, str]], delete: bool = False) -> None:
+        # A contentless FTS5 row can only be removed by supplying its text
+        if delete:
+            sql = f"INSERT INTO {schema}.messages_fts(messages_fts, rowid, content) VALUES ('delete', ?, ?)"
+        else:
+            sql = f"INSERT INTO {schema}.messages_fts(rowid, content) VALUES (?, ?)"
+        conn.executemany(sql, texts)
+
+    def restore_thread(self, thread_id: int) -> Optional[ThreadSummary]:
+        """Move an archived thread back into the main database; None if it isn't archived.
+
+        Archived ancestors of a branch come back with it.
+        """
+        with self._archive_conn() as conn:
+            row = conn.execute("SELECT parent_id FROM archive.threads WHERE id = ?", (thread_id,)).fetchone()
+            if not row:
+                return None
+            # The rows aren't new: what the change log triggers record while
+            # copying them back is dropped, so the next sync doesn't send them
+            start = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM main.changes").fetchone()[0]
+            texts = self._message_texts(conn, "archive", "thread_id = ?", (thread_id,))
+            # Entries of a copy left by an interrupted restore
+            self._fts(conn, "main", self._message_texts(conn, "main", "thread_id = ?", (thread_id,)), delete=True)
+            # Messages before the thread row: the insert trigger then finds no
+            # thread to update, and the archived summary columns are kept as is.
             conn.execute(
-                "UPDATE threads SET updated_at = ? WHERE id = ?",
-                (now, thread_id),
+                f"INSERT OR REPLACE INTO main.messages ({_MESSAGE_COPY_COLUMNS}) "
+                f"SELECT {_MESSAGE_COPY_COLUMNS} FROM archive.messages WHERE thread_id = ?",
+                (thread_id,),
             )
+            self._fts(conn, "main", texts)
+            conn.execute(
+                f"INSERT OR REPLACE INTO main.threads ({_THREAD_COLUMNS}) "
+                f"SELECT {_THREAD_COLUMNS} FROM archive.threads WHERE id = ?",
+                (thread_id,),
+            )
+            conn.execute("DELETE FROM main.changes WHERE seq > ?", (start,))
             conn.commit()
-            return int(cur.lastrowid)
+            self._fts(conn, "archive", texts, delete=True)
+            conn.execute("DELETE FROM archive.messages WHERE thread_id = ?", (thread_id,))
+            conn.execute("DELETE FROM archive.threads WHERE id = ?", (thread_id,))
+            conn.commit()
+        if row[0] is not None:
+            self.restore_thread(row[0])
+        return self.get_thread_summary(thread_id)
+
+    def search_archived_threads(self, query: str, limit: int = 20, profile: Optional[str] = None) -> List[ThreadSummary]:
+        """Archived threads whose name or message text matches ``query``, newest first."""
+        match = fts_query(query)
+        if not match:
+            return []
+        sql = (
+            f"SELECT {_SUMMARY_COLUMNS} FROM archive.threads WHERE (id IN ("
+            "SELECT m.thread_id FROM archive.messages_fts f JOIN archive.messages m ON m.id = f.rowid "
+            "WHERE messages_fts MATCH ?) OR name LIKE ?)"
+        )
+        params: list = [match, f"%{query.strip()}%"]
+        if profile:
+            sql += " AND profile = ?"
+            params.append(profile)
+        sql += " ORDER BY updated_at DESC LIMIT ?"
+        params.append(limit)
+        with self._archive_conn():
+            return self._rows(_summary_row, sql, params)
+
+    # Profile shards
+
+    def split_profiles(self, batch_size: int = 100) -> Dict[str, int]:
+        """Move every profile but the default into its own shard file (shard_path); returns threads moved per profile.
+
+        Live and archived threads take their messages, blobs and usage
+        rollups along; each shard gets its own archive. A shard numbers its
+        own rows, so moved rows are matched by uid and get fresh ids (in the
+        same order; branch links follow). A profile is copied in one
+        transaction, then deleted here in batches: a crash leaves rows in
+        both files, and a re-run skips the copies and completes the move.
+        Blobs left unreferenced here go at the next gc_blobs.
+        """
+        moved: Dict[str, int] = {}
+        with self._archive_conn() as conn:
+            profiles = sorted(set(_profiles(conn, "main")) | set(_profiles(conn, "archive")))
+        for profile in profiles:
+            target = Store(str(shard_path(self.db_path, profile)))
+            with target._archive_conn():
+                pass  # creates the shard's archive schema
+            target.close()
+            with self._archive_conn() as conn:
+                conn.commit()
+                conn.execute("ATTACH DATABASE ? AS shard", (str(target.db_path),))
+                conn.execute("ATTACH DATABASE ? AS shard_archive", (str(target.archive_path),))
+                try:
+                    self._copy_profile(conn, profile, batch_size)
+                    conn.execute(
+                        f"INSERT INTO shard.usage_rollup SELECT * FROM main.usage_rollup WHERE +profile = ? "
+                        f"ON CONFLICT (day, profile, provider, model) DO UPDATE SET {_ROLLUP_MERGE_SQL}",
+                        (profile,),
+                    )
+                    conn.commit()
+                    conn.execute("DELETE FROM main.usage_rollup WHERE +profile = ?", (profile,))
+                    conn.commit()
+                    moved[profile] = sum(self._drop_profile(conn, profile, src, batch_size) for src in ("main", "archive"))
+                finally:
+                    conn.execute("DETACH DATABASE shard")
+                    conn.execute("DETACH DATABASE shard_archive")
+        return moved
+
+    def _copy_profile(self, conn, profile: str, batch_size: int) -> None:
+        # Live threads into the attached shard, archived ones into its
+        # archive, skipping threads already there (by uid): an earlier run
+        # committed those whole. Message ids move by one offset, since a
+        # branch's history is read in id order across its ancestors.
+        pending = []
+        for src, dst in (("main", "shard"), ("archive", "shard_archive")):
+            columns = _THREAD_COLUMNS + (", archived_at" if src == "archive" else "")
+            names = columns.split(", ")
+            ids = [row[0] for row in conn.execute(f"SELECT id FROM {src}.threads WHERE profile = ? ORDER BY updated_at", (profile,))]
+            for i in range(0, len(ids), batch_size):
+                batch = ids[i:i + batch_size]
+                marks = ",".join("?" * len(batch))
+                threads = [dict(zip(names, row)) for row in conn.execute(
+                    f"SELECT {columns} FROM {src}.threads WHERE id IN ({marks})", batch
+                ).fetchall()]
+                copied = {row[0] for row in conn.execute(
+                    f"SELECT uid FROM {dst}.threads WHERE uid IN ({','.join('?' * len(threads))})", [t["uid"] for t in threads]
+                )}
+                threads = [t for t in threads if t["uid"] not in copied]
+                if threads:
+                    pending.append((src, dst, names, threads))
+        if not pending:
+            return
+        low, high = None, None
+        for src, _, _, threads in pending:
+            marks = ",".join("?" * len(threads))
+            row = conn.execute(
+                f"SELECT MIN(id), MAX(id) FROM {src}.messages WHERE thread_id IN ({marks})", [t["id"] for t in threads]
+            ).fetchone()
+            if row[0] is not None:
+                low, high = min(row[0], low or row[0]), max(row[1], high or row[1])
+        offset = self._next_shard_ids(conn, "messages", high - low + 1) - low if low is not None else 0
+        first = self._next_shard_ids(conn, "threads", sum(len(threads) for _, _, _, threads in pending))
+        thread_ids = {}
+        for src, _, _, threads in pending:
+            for t in threads:
+                thread_ids[(src, t["id"])] = first + len(thread_ids)
+        for src, dst, names, threads in pending:
+            old_ids = [t["id"] for t in threads]
+            marks = ",".join("?" * len(old_ids))
+            # Blobs by hash: the shard numbers its own
+            conn.execute(
+                f"INSERT INTO shard.blobs(hash, size, encoding, data, created_at) "
+                f"SELECT hash, size, encoding, data, created_at FROM main.blobs WHERE id IN ("
+                f"SELECT blob_id FROM {src}.messages WHERE thread_id IN ({marks})) ON CONFLICT(hash) DO NOTHING",
+                old_ids,
+            )
+            # Messages before threads, so the shard's insert triggers find no
+            # thread: the copied summary columns and rollups stay as they are
+            conn.executemany(
+                f"INSERT INTO {dst}.messages ({_MESSAGE_COPY_COLUMNS}) "
+                f"VALUES (?, ?, ?, ?, ?, ?, ?, (SELECT id FROM shard.blobs WHERE hash = ?), ?, ?, ?)",
+                [(row[0] + offset, thread_ids[(src, row[1])], *row[2:]) for row in conn.execute(
+                    f"SELECT id, thread_id, role, content, meta, created_at, content_encoding, "
+                    f"(SELECT hash FROM main.blobs b WHERE b.id = m.blob_id), uid, edited_at, edited_by "
+                    f"FROM {src}.messages m WHERE thread_id IN ({marks})",
+                    old_ids,
+                ).fetchall()],
+            )
+            texts = self._message_texts(conn, src, f"thread_id IN ({marks})", old_ids)
+            self._fts(conn, dst, [(message_id + offset, text) for message_id, text in texts])
+            for t in threads:
+                # Branch links are set below, once every thread is in
+                t.update(
+                    id=thread_ids[(src, t["id"])], parent_id=None, fork_message_id=None,
+                    last_message_id=t["last_message_id"] + offset if t["last_message_id"] else None,
+                )
+            conn.executemany(
+                f"INSERT INTO {dst}.threads ({','.join(names)}) VALUES ({','.join('?' * len(names))})",
+                [tuple(t[name] for name in names) for t in threads],
+            )
+        self._link_profile(conn, profile)
+        conn.commit()
 
-    def get_thread_messages(self, thread_id: int, limit: int = 50) -> List[Message]:
+    def _next_shard_ids(self, conn, table: str, count: int) -> int:
+        # The first of ``count`` unused ids for ``table`` in the attached
+        # shard. Its archive is numbered from the shard's sequence too, as
+        # archive_threads does, so a restore there never meets a live id.
+        first = 1 + max(
+            conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM shard.{table}").fetchone()[0],
+            conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM shard_archive.{table}").fetchone()[0],
+            conn.execute("SELECT COALESCE(MAX(seq), 0) FROM shard.sqlite_sequence WHERE name = ?", (table,)).fetchone()[0],
+        )
+        last = first + count - 1
+        if not conn.execute("UPDATE shard.sqlite_sequence SET seq = ? WHERE name = ?", (last, table)).rowcount:
+            conn.execute("INSERT INTO shard.sqlite_sequence(name, seq) VALUES (?, ?)", (table, last))
+        return first
+
+    def _link_profile(self, conn, profile: str) -> None:
+        # Branch links of the copied threads, by uid. A parent already gone
+        # from here (deleted by an interrupted run) was linked by that run.
+        for src, dst in (("main", "shard"), ("archive", "shard_archive")):
+            for uid, parent, fork in conn.execute(
+                f"SELECT uid, COALESCE((SELECT uid FROM main.threads WHERE id = t.parent_id), "
+                f"(SELECT uid FROM archive.threads WHERE id = t.parent_id)), "
+                f"COALESCE((SELECT uid FROM main.messages WHERE id = t.fork_message_id), "
+                f"(SELECT uid FROM archive.messages WHERE id = t.fork_message_id)) "
+                f"FROM {src}.threads t WHERE profile = ? AND parent_id IS NOT NULL",
+                (profile,),
+            ).fetchall():
+                if parent is None:
+                    continue
+                for schema in ("shard", "shard_archive"):
+                    row = conn.execute(f"SELECT id FROM {schema}.threads WHERE uid = ?", (parent,)).fetchone()
+                    if row:
+                        fork_row = conn.execute(
+                            f"SELECT id FROM {schema}.messages WHERE thread_id = ? AND uid = ?", (row[0], fork)
+                        ).fetchone()
+                        conn.execute(
+                            f"UPDATE {dst}.threads SET parent_id = ?, fork_message_id = ? WHERE uid = ?",
+                            (row[0], fork_row[0] if fork_row else None, uid),
+                        )
+                        break
+
+    def _drop_profile(self, conn, profile: str, src: str, batch_size: int) -> int:
+        # The profile's rows here, once all are copied into the shard
+        dropped = 0
+        while True:
+            ids = [row[0] for row in conn.execute(
+                f"SELECT id FROM {src}.threads WHERE profile = ? ORDER BY updated_at LIMIT ?", (profile, batch_size)
+            )]
+            if not ids:
+                return dropped
+            marks = ",".join("?" * len(ids))
+            self._fts(conn, src, self._message_texts(conn, src, f"thread_id IN ({marks})", ids), delete=True)
+            conn.execute(f"DELETE FROM {src}.threads WHERE id IN ({marks})", ids)
+            conn.execute(f"DELETE FROM {src}.messages WHERE thread_id IN ({marks})", ids)
+            conn.commit()
+            dropped += len(ids)
+
+    def search_all_profiles(self, query: str, limit: int = 20) -> List[Tuple[str, ThreadSummary]]:
+        """(profile, thread) for live threads of every profile whose name or message text matches ``query``, newest first.
+
+        Runs the archive search's query (messages_fts MATCH or name LIKE) on
+        this database and on each shard beside it (shard_paths), attached one
+        at a time, so it works with sharding on or off; the hits are merged
+        by recency. Call it on the base store.
+        """
+        match = fts_query(query)
+        if not match:
+            return []
+        sql = (
+            f"SELECT profile, {_SUMMARY_COLUMNS} FROM {{schema}}.threads WHERE id IN ("
+            "SELECT m.thread_id FROM {schema}.messages_fts f JOIN {schema}.messages m ON m.id = f.rowid "
+            "WHERE messages_fts MATCH ?) OR name LIKE ? ORDER BY updated_at DESC LIMIT ?"
+        )
+        params = (match, f"%{query.strip()}%", limit)
+        hits = self._rows(_profile_summary_row, sql.format(schema="main"), params)
+        for path in shard_paths(self.db_path):
+            with self._conn() as conn:
+                conn.commit()
+                conn.execute("ATTACH DATABASE ? AS shard", (str(path),))
+                try:
+                    hits += self._rows(_profile_summary_row, sql.format(schema="shard"), params)
+                finally:
+                    conn.execute("DETACH DATABASE shard")
+        hits.sort(key=lambda hit: hit[1].updated_at, reverse=True)
+        return hits[:limit]
+
+    # Replication (utils/sync.py)
+
+    def sync_export(
+        self, folder: Union[str, Path], device: Optional[str] = None, everything: bool = False, batch_size: int = 5000
+    ) -> int:
+        """Write the rows changed since the last export to ``folder`` as batch files; returns the record count.
+
+        Reads the change log, so the cost follows what changed, not the size
+        of the database. The log only records changes once a database has
+        synced, so the first export (or one with ``everything``) logs every
+        row first.
+        """
+        device = device or sync.device_name()
+        written = 0
         with self._conn() as conn:
-            cur = conn.execute(
-                "SELECT id, thread_id, role, content, meta, created_at FROM messages WHERE thread_id = ? ORDER BY id ASC",
-                (thread_id,),
+            exported = self._sync_state(conn, "exported")
+            if everything or conn.execute("SELECT 1 FROM sync_state").fetchone() is None:
+                conn.execute("INSERT INTO changes(kind, row_id) SELECT 'thread', id FROM threads")
+                conn.execute("INSERT INTO changes(kind, row_id) SELECT 'message', id FROM messages")
+                # In the same transaction, so the triggers log every row
+                # written after the ones just logged
+                self._set_sync_state(conn, "exported", exported)
+                conn.commit()
+            while True:
+                rows = conn.execute(
+                    "SELECT seq, kind, row_id FROM changes WHERE seq > ? ORDER BY seq LIMIT ?", (exported, batch_size)
+                ).fetchall()
+                if not rows:
+                    return written
+                last = rows[-1][0]
+                thread_ids = sorted({row_id for _, kind, row_id in rows if kind == "thread"})
+                message_ids = sorted({row_id for _, kind, row_id in rows if kind == "message"})
+                records = self._change_records(conn, thread_ids, message_ids, device)
+                written += sync.write_batch(folder, self.db_path.stem, device, exported, last, records)
+                self._set_sync_state(conn, "exported", last)
+                conn.commit()
+                exported = last
+
+    def sync_import(self, folder: Union[str, Path], device: Optional[str] = None) -> Dict[str, int]:
+        """Apply the other devices' batches in ``folder`` not applied yet; returns records applied per device.
+
+        A batch is applied in one transaction with the device's position, so
+        an interrupted import resumes where it stopped, and applying a batch
+        twice changes nothing. Rows match by uid. Thread name, provider and
+        model: the later change (``meta_updated_at``) wins, however recent
+        the thread's messages. A message edited on both sides: the later
+        edit wins, then the greater device name, and the conflict is
+        logged. Threads archived here are restored first. With
+        AIFRED_SHARD_PROFILES=1, threads of other profiles (from a peer
+        without sharding) and their messages go to those profiles' shards.
+        Every message arrives with its thread's record, so it is never
+        skipped for want of one.
+        """
+        device = device or sync.device_name()
+        applied: Dict[str, int] = {}
+        for peer in sync.peers(folder, self.db_path.stem, device):
+            key = f"applied:{peer}"
+            with self._conn() as conn:
+                after = self._sync_state(conn, key)
+            applied[peer] = 0
+            for last, path in sync.batches(folder, self.db_path.stem, peer, after):
+                _, records = sync.read_batch(path)
+                records, elsewhere = self._route_by_profile(records)
+                # Other shards first: their records are applied again
+                # (changing nothing) if this batch's commit is lost
+                for profile, routed in elsewhere.items():
+                    applied[peer] += Store(profile=profile)._apply_batch(routed, device, peer)
+                applied[peer] += self._apply_batch(records, device, peer, (key, last))
+        return applied
+
+    def _apply_batch(self, records: List[dict], device: str, peer: str, position: Optional[Tuple[str, int]] = None) -> int:
+        self._restore_for_sync(records)
+        with self._conn() as conn:
+            if conn.in_transaction:
+                conn.commit()
+            conn.execute("BEGIN IMMEDIATE")
+            applied = self._apply_changes(conn, records, device, peer)
+            if position is not None:
+                self._set_sync_state(conn, *position)
+            conn.commit()
+        return applied
+
+    def _route_by_profile(self, records: List[dict]) -> Tuple[List[dict], Dict[str, List[dict]]]:
+        # With sharding on, a peer without it sends every profile in this
+        # database's stream: a thread not here goes to its profile's shard,
+        # and its messages follow it, to wherever an earlier batch put it
+        if not SHARD_BY_PROFILE:
+            return records, {}
+        uids = sorted({r["thread"]["uid"] if "thread" in r else r["message"]["thread"] for r in records})
+        local = self._thread_profiles(uids)
+        profiles = {r["thread"]["uid"]: r["thread"]["profile"] for r in records if "thread" in r}
+        unknown = [uid for uid in uids if uid not in local and uid not in profiles]
+        if unknown:
+            base = _base_db_path()
+            for path in [p for p in [base] + shard_paths(base) if p.exists() and p.resolve() != self.db_path.resolve()]:
+                for uid, profile in Store(str(path))._thread_profiles(unknown).items():
+                    profiles.setdefault(uid, profile)
+        records_here: List[dict] = []
+        elsewhere: Dict[str, List[dict]] = {}
+        for record in records:
+            uid = record["thread"]["uid"] if "thread" in record else record["message"]["thread"]
+            profile = profiles.get(uid)
+            if uid in local or profile is None or _default_db_path(profile).resolve() == self.db_path.resolve():
+                records_here.append(record)
+            else:
+                elsewhere.setdefault(profile, []).append(record)
+        return records_here, elsewhere
+
+    def _thread_profiles(self, uids: List[str]) -> Dict[str, str]:
+        found = {}
+        with self._conn() as conn:
+            for i in range(0, len(uids), 500):
+                chunk = uids[i:i + 500]
+                found.update(conn.execute(f"SELECT uid, profile FROM threads WHERE uid IN ({','.join('?' * len(chunk))})", chunk))
+        return found
+
+    def _sync_state(self, conn, key: str) -> int:
+        row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return int(row[0]) if row else 0
+
+    def _set_sync_state(self, conn, key: str, value: int) -> None:
+        conn.execute(
+            "INSERT INTO sync_state(key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        )
+
+    def _change_records(self, conn, thread_ids: List[int], message_ids: List[int], device: str) -> Iterator[dict]:
+        # The rows' current state, with references by uid. Rows moved out
+        # since (archived, split off) are skipped. A message's thread goes
+        # along even if unchanged: the peer may never have had it (created
+        # before the change log, or before this database first synced).
+        threads = set(thread_ids)
+        for i in range(0, len(message_ids), 500):
+            chunk = message_ids[i:i + 500]
+            threads.update(
+                row[0] for row in conn.execute(
+                    f"SELECT thread_id FROM messages WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                )
+            )
+        thread_ids = sorted(threads)
+        for i in range(0, len(thread_ids), 500):
+            chunk = thread_ids[i:i + 500]
+            for uid, profile, provider, model, name, created_at, updated_at, meta_updated_at, parent, fork in conn.execute(
+                "SELECT t.uid, t.profile, t.provider, t.model, t.name, t.created_at, t.updated_at, "
+                "COALESCE(t.meta_updated_at, t.created_at), p.uid, f.uid "
+                "FROM threads t LEFT JOIN threads p ON p.id = t.parent_id LEFT JOIN messages f ON f.id = t.fork_message_id "
+                f"WHERE t.id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall():
+                yield {"thread": {
+                    "uid": uid, "profile": profile, "provider": provider, "model": model, "name": name,
+                    "created_at": created_at, "updated_at": updated_at, "meta_updated_at": meta_updated_at,
+                    "parent": parent, "fork": fork,
+                }}
+        for i in range(0, len(message_ids), 500):
+            chunk = message_ids[i:i + 500]
+            for uid, thread, role, value, encoding, blob_id, meta, created_at, edited_at, edited_by in conn.execute(
+                "SELECT m.uid, t.uid, m.role, m.content, m.content_encoding, m.blob_id, m.meta, m.created_at, "
+                "m.edited_at, COALESCE(m.edited_by, ?) "
+                f"FROM messages m JOIN threads t ON t.id = m.thread_id WHERE m.id IN ({','.join('?' * len(chunk))})",
+                (device, *chunk),
+            ).fetchall():
+                yield {"message": {
+                    "uid": uid, "thread": thread, "role": role, "content": self._text(value, encoding, blob_id),
+                    "blob": blob_id is not None, "meta": meta, "created_at": created_at,
+                    "edited_at": edited_at, "edited_by": edited_by,
+                }}
+
+    def _restore_for_sync(self, records: List[dict]) -> None:
+        # Threads a batch touches that were archived here come back first
+        if not self.archive_path.exists():
+            return
+        uids = set()
+        for record in records:
+            if "thread" in record:
+                uids.update(u for u in (record["thread"]["uid"], record["thread"]["parent"]) if u)
+            else:
+                uids.add(record["message"]["thread"])
+        uids = sorted(uids)
+        archived = []
+        with self._archive_conn() as conn:
+            for i in range(0, len(uids), 500):
+                chunk = uids[i:i + 500]
+                archived += [row[0] for row in conn.execute(
+                    f"SELECT id FROM archive.threads WHERE uid IN ({','.join('?' * len(chunk))})", chunk
+                )]
+        for thread_id in archived:
+            self.restore_thread(thread_id)
+
+    def _apply_changes(self, conn, records: List[dict], device: str, peer: str) -> int:
+        # What the triggers log while applying came from the peer: dropped at
+        # the end, so the next export doesn't echo it back
+        start = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+        applied = 0
+        branches = []
+        for record in records:
+            t = record.get("thread")
+            if t is None:
+                continue
+            # Batches written before meta_updated_at was exported lack it
+            changed_at = t.get("meta_updated_at") or t["created_at"]
+            row = conn.execute(
+                "SELECT id, COALESCE(meta_updated_at, created_at), provider, model, name FROM threads WHERE uid = ?", (t["uid"],)
+            ).fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO threads(profile, provider, model, name, created_at, updated_at, uid, meta_updated_at) "
+                    "VALUES (?,?,?,?,?,?,?,?)",
+                    (t["profile"], t["provider"], t["model"], t["name"], t["created_at"], t["updated_at"], t["uid"], changed_at),
+                )
+                applied += 1
+            elif (t["provider"], t["model"], t["name"]) != row[2:] and (
+                # The later change wins; at the same instant the greater values
+                # do, so both devices pick the same side
+                (changed_at, t["provider"], t["model"], t["name"] or "") > (row[1], row[2], row[3], row[4] or "")
+            ):
+                conn.execute(
+                    "UPDATE threads SET provider = ?, model = ?, name = ?, meta_updated_at = ? WHERE id = ?",
+                    (t["provider"], t["model"], t["name"], changed_at, row[0]),
+                )
+                applied += 1
+            if t["parent"]:
+                branches.append(t)
+        thread_ids: Dict[str, Optional[int]] = {}
+        for record in records:
+            m = record.get("message")
+            if m is None:
+                continue
+            if m["thread"] not in thread_ids:
+                row = conn.execute("SELECT id FROM threads WHERE uid = ?", (m["thread"],)).fetchone()
+                thread_ids[m["thread"]] = row[0] if row else None
+            thread_id = thread_ids[m["thread"]]
+            if thread_id is None:
+                continue
+            blob_id = self._put_blob(conn, m["content"]) if m["blob"] else None
+            row = conn.execute(
+                "SELECT id, role, content, content_encoding, blob_id, meta, created_at, edited_at, edited_by "
+                "FROM messages WHERE uid = ?",
+                (m["uid"],),
+            ).fetchone()
+            # Batches written before edits were exported lack these
+            edited_at, edited_by = m.get("edited_at"), m.get("edited_by") or peer
+            if row is None:
+                content = _blob_preview(m["content"]) if m["blob"] else m["content"]
+                meta = json.loads(m["meta"]) if m["meta"] else None
+                message_id = self._insert_message(
+                    conn, thread_id, m["role"], content, meta, blob_id, m["created_at"], m["uid"], body=m["content"]
+                )
+                if edited_at is not None:
+                    conn.execute("UPDATE messages SET edited_at = ?, edited_by = ? WHERE id = ?", (edited_at, edited_by, message_id))
+                applied += 1
+                continue
+            text = self._text(row[2], row[3], row[4])
+            if (row[1], text, row[5]) == (m["role"], m["content"], m["meta"]):
+                continue
+            # Edited on both sides: the later edit wins, then the greater
+            # device name, so every device keeps the same version
+            incoming, local = (edited_at or m["created_at"], edited_by), (row[7] or row[6], row[8] or device)
+            if row[7] is not None:
+                get_logger().info(
+                    "sync: message %s edited on %s and %s; kept %s's version", m["uid"], local[1], incoming[1], max(incoming, local)[1]
+                )
+            if incoming > local:
+                stored, encoding = compress.compress(m["content"]) if blob_id is None else ("", None)
+                conn.execute(
+                    "UPDATE messages SET role = ?, content = ?, content_encoding = ?, blob_id = ?, meta = ?, edited_at = ?, "
+                    "edited_by = ? WHERE id = ?",
+                    (m["role"], stored, encoding, blob_id, m["meta"], edited_at, edited_by, row[0]),
+                )
+                self._fts(conn, "main", [(row[0], text)], delete=True)
+                self._fts(conn, "main", [(row[0], m["content"])])
+                applied += 1
+        # Branch links last: the fork point may be a message of this batch
+        for t in branches:
+            conn.execute(
+                "UPDATE threads SET parent_id = (SELECT id FROM threads WHERE uid = ?), "
+                "fork_message_id = (SELECT id FROM messages WHERE uid = ?) WHERE uid = ? AND parent_id IS NULL",
+                (t["parent"], t["fork"], t["uid"]),
             )
-            rows = cur.fetchall()
-        msgs = [Message(*row) for row in rows]
-        if limit and len(msgs) > limit:
-            return msgs[-limit:]
-        return msgs
+        conn.execute("DELETE FROM changes WHERE seq > ?", (start,))
+        return applied
+
+    def maintain(self) -> List[str]:
+        """Blob GC, ANALYZE, PRAGMA optimize, FTS optimize and incremental vacuum on both databases.
+
+        A database created before auto_vacuum was enabled is converted with a
+        one-off full VACUUM. Returns a line per step for the caller's report.
+        """
+        steps = []
+        with self._conn() as conn:
+            # Exported changes are in the sync folder; the log keeps the rest
+            pruned = conn.execute("DELETE FROM changes WHERE seq <= ?", (self._sync_state(conn, "exported"),)).rowcount
+            conn.commit()
+        steps.append(f"pruned {pruned} exported change log entries")
+        blobs, size = self.gc_blobs()
+        steps.append(f"collected {blobs} unreferenced blobs ({size / 1e6:.1f} MB)")
+        with self._archive_conn() as conn:
+            conn.commit()
+            conn.execute("ANALYZE")
+            for schema in ("main", "archive"):
+                conn.execute(f"INSERT INTO {schema}.messages_fts(messages_fts) VALUES ('optimize')")
+            conn.commit()
+            steps.append("ANALYZE, FTS optimize")
+        self.close()  # VACUUM needs the database to itself
+        with self._archive_conn() as conn:
+            for schema in ("main", "archive"):
+                steps.append(f"{schema}: {db.vacuum(conn, schema)}")
+                conn.execute(f"PRAGMA {schema}.wal_checkpoint(TRUNCATE)")
+            conn.execute("PRAGMA optimize")
+            steps.append("PRAGMA optimize")
+        return steps
+
+
+class Turn:
+    """Buffered writes of one action (see Store.turn).
+
+    Thread resolution and every message of the turn are applied in a single
+    BEGIN IMMEDIATE transaction when the ``with`` block exits, so a turn costs
+    one commit however many tool results it has. No transaction is held
+    while the provider call runs. If the block raises, nothing is written.
+    """
+
+    def __init__(self, store: Store) -> None:
+        self._store = store
+        self.thread_id: Optional[int] = None
+        self._new_thread: Optional[Tuple[str, str, Optional[str], str]] = None
+        self._fork: Optional[Tuple[int, Optional[int]]] = None
+        self._messages: List[Tuple[str, Union[str, bytes], Optional[dict], bool]] = []
+        self._deferred = False
+
+    def use_thread(self, thread_id: int) -> None:
+        self.thread_id = thread_id
+        self._new_thread = self._fork = None
+
+    def new_thread(self, provider: str, model: str, name: Optional[str], profile: str = "default") -> None:
+        # thread_id stays None (nothing to read back yet) until commit
+        self.thread_id = None
+        self._new_thread = (provider, model, name, profile)
+        self._fork = None
+
+    def fork_thread(self, parent_id: int, message_id: Optional[int], provider: str, model: str, name: Optional[str]) -> None:
+        """Like new_thread, but the thread is a branch of ``parent_id`` (see Store.fork_thread)."""
+        self.thread_id = None
+        self._new_thread = (provider, model, name, "default")
+        self._fork = (parent_id, message_id)
+
+    def add_message(self, role: str, content: str, meta: Optional[dict] = None) -> None:
+        self._messages.append((role, content, meta, False))
+
+    def add_blob_message(self, role: str, data: Union[str, bytes], meta: Optional[dict] = None) -> None:
+        self._messages.append((role, data, meta, True))
+
+    def to_entry(self) -> dict:
+        return {"thread_id": self.thread_id, "new_thread": self._new_thread, "fork": self._fork, "messages": self._messages}
+
+    @classmethod
+    def from_entry(cls, store: Store, entry: dict) -> "Turn":
+        turn = cls(store)
+        turn.thread_id = entry["thread_id"]
+        turn._new_thread = tuple(entry["new_thread"]) if entry["new_thread"] else None
+        turn._fork = tuple(entry["fork"]) if entry.get("fork") else None
+        turn._messages = [tuple(m) for m in entry["messages"]]
+        return turn
+
+    def defer(self, **extra) -> str:
+        """Append the turn to the write-behind journal instead of writing it now.
+
+        Returns as soon as the entry is fsynced; Store.replay_journal applies
+        it later. ``extra`` is stored alongside (e.g. side effects to run).
+        """
+        entry_id = journal.append(self._store.journal_path, dict(extra, turn=self.to_entry()))
+        self._messages = []
+        self._deferred = True
+        return entry_id
+
+    def commit(self, journal_id: Optional[str] = None) -> int:
+        """Write the turn and return its thread id (created here for a new thread).
+
+        With ``journal_id`` (a replayed journal entry) the turn is written at
+        most once: a second commit of the same id returns the thread it wrote.
+        """
+        if self.thread_id is None and self._new_thread is None:
+            raise ValueError("Turn has no thread: call use_thread or new_thread first")
+        store = self._store
+        with store._conn() as conn:
+            if conn.in_transaction:
+                conn.commit()
+            conn.execute("BEGIN IMMEDIATE")
+            if journal_id is not None:
+                row = conn.execute("SELECT thread_id FROM journal_applied WHERE id = ?", (journal_id,)).fetchone()
+                if row:
+                    conn.rollback()
+                    self.thread_id, self._new_thread, self._messages = int(row[0]), None, []
+                    return self.thread_id
+            if self._fork is not None:
+                # Profile from the parent; a vanished fork point fails the turn
+                self.thread_id = store._insert_branch(conn, *self._fork, *self._new_thread[:3])
+                self._new_thread = self._fork = None
+            elif self._new_thread is not None:
+                now = utcnow_iso()
+                cur = conn.execute(
+                    "INSERT INTO threads(profile, provider, model, name, created_at, updated_at, uid) VALUES (?,?,?,?,?,?,?)",
+                    (self._new_thread[3], *self._new_thread[:3], now, now, uuid.uuid4().hex),
+                )
+                self.thread_id = int(cur.lastrowid)
+                self._new_thread = None
+            for role, content, meta, is_blob in self._messages:
+                if is_blob:
+                    blob_id = store._put_blob(conn, content)
+                    store._insert_message(conn, self.thread_id, role, _blob_preview(content), meta, blob_id, body=content)
+                else:
+                    store._insert_message(conn, self.thread_id, role, content, meta, None)
+            if journal_id is not None:
+                conn.execute(
+                    "INSERT INTO journal_applied(id, thread_id, applied_at) VALUES (?,?,?)",
+                    (journal_id, self.thread_id, utcnow_iso()),
+                )
+            conn.commit()
+        self._messages = []
+        return self.thread_id
+
+    def __enter__(self) -> "Turn":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None and not self._deferred:
+            self.commit()
@@ -1,5 +1,6 @@
 import io
 import json
+import logging
 import os
 import tempfile
 import unittest
@@ -7,6 +8,7 @@ from contextlib import redirect_stdout
 
 import alfred_action as action
 from store import Store
+from utils import logger
 
 
 class TestActionDryRun(unittest.TestCase):
@@ -14,10 +16,18 @@ class TestActionDryRun(unittest.TestCase):
         self.tmp = tempfile.TemporaryDirectory()
         os.environ["AIFRED_DB_PATH"] = os.path.join(self.tmp.name, "test.db")
         os.environ["AIFRED_DRY_RUN"] = "1"
+        # The log goes to the temporary directory, not ./aifred.log
+        os.environ["AIFRED_LOG_PATH"] = os.path.join(self.tmp.name, "aifred.log")
+        logger._LOGGER = None
         # Ensure clean store
         self.store = Store()
 
     def tearDown(self) -> None:
+        for handler in logging.getLogger("aifred").handlers[:]:
+            logging.getLogger("aifred").removeHandler(handler)
+            handler.close()
+        logger._LOGGER = None
+        os.environ.pop("AIFRED_LOG_PATH", None)
         self.tmp.cleanup()
         os.environ.pop("AIFRED_DB_PATH", None)
         os.environ.pop("AIFRED_DRY_RUN", None)
@@ -35,6 +45,44 @@ class TestActionDryRun(unittest.TestCase):
         out = buf.getvalue()
         self.assertIn("openai gpt-4o", out)
         self.assertIn("hello world", out)
+        threads = self.store.get_recent_thread_summaries()
+        self.assertEqual([t.message_count for t in threads], [2])
+        self.assertEqual([m.role for m in self.store.get_thread_messages(threads[0].id)], ["user", "assistant"])
+
+    def test_write_behind_defers_persistence(self):
+        payload = {"query": "hello later", "directives": {"new": True}}
+        os.environ["AIFRED_WRITE_BEHIND"] = "1"
+        spawn = action._spawn_flusher
+        action._spawn_flusher = lambda: None
+        try:
+            buf = io.StringIO()
+            with redirect_stdout(buf):
+                action.handle_action(json.dumps(payload))
+        finally:
+            action._spawn_flusher = spawn
+            os.environ.pop("AIFRED_WRITE_BEHIND", None)
+        self.assertIn("hello later", buf.getvalue())
+        # Replied before anything reached SQLite; the flusher (or next run) applies it
+        self.assertEqual(self.store.get_recent_threads(), [])
+        self.assertEqual(action.flush_journal(self.store), 1)
+        self.assertEqual([t.message_count for t in self.store.get_recent_thread_summaries()], [2])
+        self.assertEqual(action.flush_journal(self.store), 0)
+
+    def test_busy_thread_wait_is_bounded(self):
+        import store as store_module
+        tid = self.store.create_thread("openai", "gpt-4o", "seed")
+        payload = {"query": "again", "directives": {}, "thread_hint": {"id": tid}}
+        timeout = store_module.THREAD_LOCK_TIMEOUT
+        store_module.THREAD_LOCK_TIMEOUT = 0.1
+        try:
+            with self.store.thread_lock(tid):
+                buf = io.StringIO()
+                with redirect_stdout(buf):
+                    action.handle_action(json.dumps(payload))
+        finally:
+            store_module.THREAD_LOCK_TIMEOUT = timeout
+        self.assertIn("busy", buf.getvalue())
+        self.assertEqual(self.store.get_thread_summary(tid).message_count, 0)
 
     def test_continue_latest_thread(self):
         # Seed a thread
@@ -50,6 +98,24 @@ class TestActionDryRun(unittest.TestCase):
         out = buf.getvalue()
         self.assertIn("openai gpt-4o", out)  # default provider/model
 
+    def test_fork_retries_last_question_on_another_model(self):
+        tid = self.store.create_thread("openai", "gpt-4o", "seed")
+        self.store.add_message(tid, "user", "first")
+        shared = self.store.add_message(tid, "assistant", "first answer")
+        self.store.add_message(tid, "user", "second")
+        self.store.add_message(tid, "assistant", "second answer")
+        payload = {"query": "", "directives": {"fork": True, "model": "claude-3-7-sonnet"}, "thread_hint": {"id": tid}}
+        buf = io.StringIO()
+        with redirect_stdout(buf):
+            action.handle_action(json.dumps(payload))
+        self.assertIn("second", buf.getvalue())
+        branch = self.store.get_recent_thread_summaries()[0]
+        self.assertEqual((branch.provider, branch.message_count), ("anthropic", 2))
+        messages = self.store.get_thread_messages(branch.id)
+        self.assertEqual([m.content for m in messages[:3]], ["first", "first answer", "second"])
+        self.assertEqual(messages[1].id, shared)
+        self.assertEqual(self.store.get_thread_summary(tid).message_count, 4)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -30,6 +30,10 @@ class TestDirectives(unittest.TestCase):
         self.assertEqual(cleaned, "continue please")
         self.assertTrue(d.cont)
         self.assertFalse(d.new)
+        cleaned, d = parse_directives("@fork @claude-3-7-sonnet")
+        self.assertEqual(cleaned, "")
+        self.assertTrue(d.fork)
+        self.assertIn("fork", summarise_directives(d))
 
     def test_unknown_tokens_remain(self):
         text = "Ask @weird:token to stay"
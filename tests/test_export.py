@@ -0,0 +1,56 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+import zipfile
+
+from store import Store
+from utils import db, export
+
+
+class TestBulkExport(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = Store(os.path.join(self.tmp.name, "aifred.db"))
+        for i, (profile, provider) in enumerate([("default", "openai"), ("work", "openai"), ("default", "anthropic")]):
+            tid = self.store.create_thread(provider, "m", f"Thread {i} <b>", profile=profile)
+            for j in range(3):
+                self.store.add_message(tid, "user" if j % 2 == 0 else "assistant", f"t{i} message {j} & more")
+
+    def tearDown(self) -> None:
+        db.close_all()
+        self.tmp.cleanup()
+
+    def test_jsonl_pooled_matches_inline(self):
+        outputs = []
+        for workers in (1, 2):
+            out = io.StringIO()
+            self.assertEqual(export.export_threads(self.store, out, "jsonl", workers), 3)
+            outputs.append(out.getvalue())
+        self.assertEqual(outputs[0], outputs[1])
+        records = [json.loads(line) for line in outputs[0].splitlines()]
+        self.assertEqual([r["type"] for r in records], ["thread", "message", "message", "message"] * 3)
+        self.assertEqual(records[3]["content"], "t0 message 2 & more")
+
+    def test_zip_markdown_with_filters(self):
+        out = io.BytesIO()
+        count = export.export_threads(self.store, out, "md", workers=1, profile="default", provider="openai")
+        self.assertEqual(count, 1)
+        with zipfile.ZipFile(io.BytesIO(out.getvalue())) as zf:
+            self.assertEqual(zf.namelist(), ["000001-thread-0-b.md"])
+            body = zf.read("000001-thread-0-b.md").decode()
+        self.assertTrue(body.startswith("# Thread 0 <b>"))
+        self.assertIn("**assistant**: t0 message 1", body)
+        # Nothing updated before the dawn of time
+        self.assertEqual(export.export_threads(self.store, io.BytesIO(), "html", before="2000-01-01"), 0)
+
+    def test_html_is_escaped(self):
+        thread = self.store.get_thread_summary(1)
+        page = "".join(export.iter_html(thread, self.store.iter_thread_messages(1)))
+        self.assertIn("Thread 0 &lt;b&gt;", page)
+        self.assertIn("&amp; more", page)
+
+
+if __name__ == "__main__":
+    unittest.main()
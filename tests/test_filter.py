@@ -0,0 +1,103 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import alfred_filter
+import alfred_filter_client
+from store import Store
+from utils import db, filterd
+
+
+class TestFilter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "test.db")
+        os.environ["AIFRED_DB_PATH"] = self.db_path
+        self.store = Store()
+        self.servers = []
+
+    def tearDown(self) -> None:
+        for server in self.servers:
+            server.join(5)
+        db.close_all()
+        self.tmp.cleanup()
+        os.environ.pop("AIFRED_DB_PATH", None)
+
+    def _count_queries(self, query: str):
+        statements = []
+        conn = db.connect(self.db_path)
+        conn.set_trace_callback(statements.append)
+        try:
+            out = json.loads(alfred_filter.build_items(query))
+        finally:
+            conn.set_trace_callback(None)
+        return out["items"], [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+
+    def test_thread_previews_use_constant_queries(self):
+        for n in range(3):
+            tid = self.store.create_thread("openai", "gpt-4o", f"t{n}")
+            self.store.add_message(tid, "user", "q")
+            self.store.add_message(tid, "assistant", f"answer {n}")
+        items, small = self._count_queries("")
+        self.assertEqual(items[0]["text"]["copy"], "answer 2")
+        self.assertIn("2 msgs", items[0]["subtitle"])
+
+        for n in range(10):
+            tid = self.store.create_thread("openai", "gpt-4o", f"more{n}")
+            for _ in range(5):
+                self.store.add_message(tid, "assistant", "x")
+        items, large = self._count_queries("")
+        self.assertEqual(len(items), 13)
+        self.assertEqual(len(large), len(small))
+
+    def test_fork_items_branch_the_listed_thread(self):
+        tid = self.store.create_thread("openai", "gpt-4o", "plan")
+        items, _ = self._count_queries("@fork @claude-3-7-sonnet")
+        payload = json.loads(items[0]["arg"])
+        self.assertEqual((payload["thread_hint"], payload["query"], payload["directives"]["fork"]), ({"id": tid}, "", True))
+        self.assertIn("retry its last question on anthropic claude-3-7-sonnet", items[0]["subtitle"])
+
+    def _serve(self, handler):
+        # The daemon's loop in a thread: its own SQLite connection, like the
+        # forked process; it exits after a short idle period
+        path = os.path.join(self.tmp.name, "filter.sock")
+
+        def run():
+            filterd.serve(path, handler, idle=0.5)
+            db.close(self.db_path)
+
+        server = threading.Thread(target=run)
+        server.start()
+        self.servers.append(server)
+        for _ in range(100):
+            if os.path.exists(path):
+                return path
+            threading.Event().wait(0.01)
+        self.fail("daemon did not start")
+
+    def test_daemon_answers_like_in_process_and_sees_new_threads(self):
+        self.store.create_thread("openai", "gpt-4o", "first")
+        path = self._serve(alfred_filter.Session().items)
+        self.assertEqual(alfred_filter_client.ask(path, "hi @claude-3-7-sonnet"), alfred_filter.build_items("hi @claude-3-7-sonnet"))
+
+        # Another connection writes: the daemon's cached thread list is stale
+        self.store.create_thread("openai", "gpt-4o", "second")
+        items = json.loads(alfred_filter_client.ask(path, ""))["items"]
+        self.assertEqual([i["title"] for i in items], ["second", "first"])
+
+    def test_client_falls_back_without_a_working_daemon(self):
+        with mock.patch.dict(os.environ, {"TMPDIR": self.tmp.name}), mock.patch.object(alfred_filter_client, "_spawn") as spawn:
+            self.assertIsNone(alfred_filter_client.request(""))
+            spawn.assert_called_once_with(alfred_filter_client.socket_path())
+
+        def broken(query):
+            raise RuntimeError("boom")
+
+        self.assertIsNone(alfred_filter_client.ask(self._serve(broken), ""))
+
+
+if __name__ == "__main__":
+    unittest.main()
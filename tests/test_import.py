@@ -0,0 +1,168 @@
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+import zipfile
+from contextlib import redirect_stdout
+
+from aifred import AifredDB, flatten_chatgpt
+
+
+class TestStreamingImport(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = AifredDB(os.path.join(self.tmp.name, "conversations.db"))
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def _write(self, data) -> str:
+        path = os.path.join(self.tmp.name, "export.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        return path
+
+    def test_batches_commit_and_skip_bad_entries(self):
+        data = [
+            {"uuid": f"k{i}", "name": f"chat {i}", "created_at": "2024-01-01", "chat_messages": [{"sender": "human", "text": f"hello {i}"}]}
+            for i in range(5)
+        ]
+        data.insert(2, "not a conversation")
+        out = io.StringIO()
+        with redirect_stdout(out):
+            count = self.db.import_claude_export(self._write(data), batch_size=2)
+        self.assertEqual(count, 5)
+        self.assertIn("Skipped conversation", out.getvalue())
+        self.assertIn("conv/s", out.getvalue())
+        conn = sqlite3.connect(self.db.db_path)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0], 5)
+        conn.close()
+
+    def test_parallel_import_from_zip(self):
+        data = [{"id": f"c{i}", "title": f"chat {i}", "create_time": i, "update_time": i,
+                 "mapping": {"n": _node("n", None, [], "user", f"hello {i}")}} for i in range(150)]
+        data.insert(70, "not a conversation")
+        archive = os.path.join(self.tmp.name, "export.zip")
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("conversations.json", json.dumps(data))
+            zf.writestr("user.json", json.dumps({"id": "ignored"}))
+        out = io.StringIO()
+        with redirect_stdout(out):
+            count = self.db.import_chatgpt_export(archive, batch_size=40, workers=2)
+        self.assertEqual(count, 150)
+        self.assertIn("1 failed", out.getvalue())
+        conn = sqlite3.connect(self.db.db_path)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0], 150)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM imported_messages").fetchone()[0], 150)
+        conn.close()
+        self.assertEqual(self.db.get_imported_message("c149", 0)[2], "hello 149")
+
+    def test_reimport_skips_unchanged_conversations(self):
+        data = [{"uuid": f"k{i}", "name": f"chat {i}", "chat_messages": [{"sender": "human", "text": f"hello {i}"}]} for i in range(4)]
+        with redirect_stdout(io.StringIO()):
+            self.db.import_claude_export(self._write(data))
+        data[1]["chat_messages"].append({"sender": "assistant", "text": "new reply"})
+        data.append({"uuid": "k9", "name": "late", "chat_messages": []})
+        for workers in (1, 2):
+            out = io.StringIO()
+            with redirect_stdout(out):
+                count = self.db.import_claude_export(self._write(data), workers=workers)
+            if workers == 1:
+                self.assertEqual(count, 2)
+                self.assertIn("1 new, 1 changed, 3 unchanged", out.getvalue())
+            else:
+                self.assertEqual(count, 0)
+                self.assertIn("0 new, 0 changed, 5 unchanged", out.getvalue())
+        self.assertEqual(self.db.get_imported_messages("k1")[-1][2], "new reply")
+
+    def test_resume_from_checkpoint(self):
+        data = [{"uuid": f"k{i}", "name": f"chat {i}", "chat_messages": []} for i in range(5)]
+        path = self._write(data)
+        st = os.stat(path)
+        conn = sqlite3.connect(self.db.db_path)
+        # As left by an import interrupted after committing the first 3
+        conn.execute(
+            "INSERT INTO import_checkpoints VALUES (?, ?, 3, 3, 0, 0)",
+            (os.path.abspath(path), f"{st.st_size}:{st.st_mtime_ns}"),
+        )
+        conn.commit()
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self.db.import_claude_export(path)
+        self.assertIn("Resuming", out.getvalue())
+        self.assertIn("5 new", out.getvalue())
+        ids = [r[0] for r in conn.execute("SELECT id FROM conversations ORDER BY id")]
+        self.assertEqual(ids, ["k3", "k4"])
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM import_checkpoints").fetchone()[0], 0)
+        conn.close()
+
+    def test_top_level_must_be_array(self):
+        with redirect_stdout(io.StringIO()), self.assertRaises(Exception) as ctx:
+            self.db.import_chatgpt_export(self._write({"id": "x"}))
+        self.assertIn("array", str(ctx.exception))
+
+
+def _node(node_id, parent, children, role, text):
+    return {
+        "id": node_id,
+        "parent": parent,
+        "children": children,
+        "message": {"author": {"role": role}, "content": {"parts": [text] if text else []}, "create_time": 1_700_000_000},
+    }
+
+
+class TestImportedMessages(unittest.TestCase):
+    # root -> q -> a1 (regenerated as a2) -> q2 follows a2
+    MAPPING = {
+        "root": {"id": "root", "parent": None, "children": ["q"], "message": None},
+        "q": _node("q", "root", ["a1", "a2"], "user", "question"),
+        "a1": _node("a1", "q", [], "assistant", "first answer"),
+        "a2": _node("a2", "q", ["q2"], "assistant", "second answer"),
+        "q2": _node("q2", "a2", [], "user", "follow up"),
+    }
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = AifredDB(os.path.join(self.tmp.name, "conversations.db"))
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_flatten_canonical_and_side_branches(self):
+        rows = flatten_chatgpt(self.MAPPING, "q2", branches=True)
+        canonical = [(r[1], r[2], r[4]) for r in rows if r[0] == 0]
+        self.assertEqual(canonical, [(0, "q", "user"), (1, "a2", "assistant"), (2, "q2", "user")])
+        # The abandoned answer forks after "q", so it sits at position 1 of branch 1
+        self.assertEqual([(r[0], r[1], r[2]) for r in rows if r[0] != 0], [(1, 1, "a1")])
+        # Without current_node the last child is followed
+        self.assertEqual([r[2] for r in flatten_chatgpt(self.MAPPING)], ["q", "a2", "q2"])
+
+    def test_import_and_read_last_n(self):
+        path = os.path.join(self.tmp.name, "export.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump([{"id": "c1", "title": "t", "create_time": 1, "update_time": 2, "mapping": self.MAPPING, "current_node": "q2"}], f)
+        with redirect_stdout(io.StringIO()):
+            self.db.import_chatgpt_export(path)
+            self.db.import_chatgpt_export(path)  # re-import replaces, not duplicates
+        self.assertEqual([r[2] for r in self.db.get_imported_messages("c1")], ["question", "second answer", "follow up"])
+        self.assertEqual([r[0] for r in self.db.get_imported_messages("c1", last=2)], [1, 2])
+        self.assertEqual(self.db.get_imported_message("c1", 1)[1:3], ("assistant", "second answer"))
+        self.assertIsNone(self.db.get_imported_message("c1", 1, branch=1))
+
+    def test_backfill_existing_conversations(self):
+        conn = sqlite3.connect(self.db.db_path)
+        conn.execute("DROP TABLE imported_messages")
+        conn.execute(
+            "INSERT INTO conversations (id, title, platform, messages) VALUES ('k1', 't', 'claude', ?)",
+            (json.dumps([{"sender": "human", "text": "hi"}, {"sender": "assistant", "text": "hello"}]),),
+        )
+        conn.commit()
+        conn.close()
+        db = AifredDB(self.db.db_path)
+        self.assertEqual([r[1] for r in db.get_imported_messages("k1")], ["user", "assistant"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import io
+import json
+import unittest
+
+from utils.jsonstream import iter_array, iter_array_items, iter_array_raw
+
+
+class TestJsonStream(unittest.TestCase):
+    def test_elements_split_across_tiny_chunks(self):
+        data = [
+            {"title": 'quote " and brackets ]}[{', "n": 1},
+            {"escaped": "back\\\\slash\\\"", "nested": [[{"a": []}], {}]},
+            [1, 2, {"x": "ü"}],
+        ]
+        text = json.dumps(data, indent=1)
+        for chunk_size in (1, 2, 5, 64):
+            self.assertEqual(list(iter_array(io.StringIO(text), chunk_size)), data)
+
+    def test_raw_text_round_trips(self):
+        raw = list(iter_array_raw(io.StringIO('[ {"a": 1} ,{"b": [2]} ]'), 3))
+        self.assertEqual(raw, ['{"a": 1}', '{"b": [2]}'])
+        items = list(iter_array_items(io.StringIO('[ {"a": 1} ,{"b": [2]} ]'), 3))
+        self.assertEqual(items, [({"a": 1}, '{"a": 1}'), ({"b": [2]}, '{"b": [2]}')])
+
+    def test_raw_boundaries_ignore_brackets_in_strings(self):
+        data = [
+            {"t": "]}", "u": "\\", "v": "\\\"[{", "w": [[], {}]},
+            "a string ] with [ brackets",
+            -12.5e3,
+            None,
+            [True, {"x": "\u00fc}"}],
+        ]
+        text = json.dumps(data)
+        for chunk_size in (1, 2, 3, 7, 1 << 20):
+            raw = list(iter_array_raw(io.StringIO(text), chunk_size))
+            self.assertEqual([json.loads(r) for r in raw], data)
+        with self.assertRaises(ValueError):
+            list(iter_array_raw(io.StringIO('[{"a": "]}"'), 2))
+
+    def test_empty_and_invalid(self):
+        self.assertEqual(list(iter_array(io.StringIO("  [ ] "))), [])
+        with self.assertRaises(ValueError):
+            list(iter_array(io.StringIO('{"not": "an array"}')))
+        with self.assertRaises(ValueError):
+            list(iter_array(io.StringIO('[{"a": 1}, {"b": ')))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from utils import locks
+
+
+class TestLocks(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = os.path.join(self.tmp.name, "locks")
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_lock_wait_is_bounded(self):
+        with locks.lock(self.dir, "thread-1", timeout=1):
+            with self.assertRaises(locks.LockTimeout):
+                with locks.lock(self.dir, "thread-1", timeout=0.1):
+                    pass
+        with locks.lock(self.dir, "thread-1", timeout=0.1):
+            pass
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_keys_do_not_block_each_other(self):
+        with locks.lock(self.dir, "thread-1", timeout=1):
+            for n in range(2, 200):
+                with locks.lock(self.dir, f"thread-{n}", timeout=0):
+                    pass
+
+    def test_waiter_relocks_a_file_its_holder_deleted(self):
+        held, order = threading.Event(), []
+
+        def holder():
+            with locks.lock(self.dir, "thread-1", timeout=1):
+                held.set()
+                time.sleep(0.2)
+                order.append("holder")
+
+        t = threading.Thread(target=holder)
+        t.start()
+        held.wait()
+        with locks.lock(self.dir, "thread-1", timeout=2):
+            order.append("waiter")
+            # Exclusive against newcomers, although the file it first waited on is gone
+            with self.assertRaises(locks.LockTimeout):
+                with locks.lock(self.dir, "thread-1", timeout=0.1):
+                    pass
+        t.join()
+        self.assertEqual(order, ["holder", "waiter"])
+
+    def test_stale_lock_files_are_swept(self):
+        os.makedirs(self.dir)
+        stale = os.path.join(self.dir, "lock-0123456789abcdef.lock")
+        open(stale, "w").close()
+        old = time.time() - locks.STALE_S - 1
+        os.utime(stale, (old, old))
+        with locks.lock(self.dir, "thread-1", timeout=1):
+            pass
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_singleflight_shares_the_in_flight_result(self):
+        started = threading.Event()
+        calls = []
+
+        def leader():
+            with locks.singleflight(self.dir, "q", timeout=5) as flight:
+                self.assertTrue(flight.leader)
+                started.set()
+                time.sleep(0.2)
+                calls.append("provider")
+                flight.publish({"output": "answer"})
+
+        t = threading.Thread(target=leader)
+        t.start()
+        started.wait()
+        with locks.singleflight(self.dir, "q", timeout=5) as flight:
+            self.assertFalse(flight.leader)
+            self.assertEqual(flight.result, {"output": "answer"})
+        t.join()
+        self.assertEqual(calls, ["provider"])
+        # Once nothing is in flight, the same key gets a fresh call
+        with locks.singleflight(self.dir, "q", timeout=5) as flight:
+            self.assertTrue(flight.leader)
+
+    def test_waiter_leads_when_leader_fails(self):
+        started = threading.Event()
+
+        def failing_leader():
+            try:
+                with locks.singleflight(self.dir, "q", timeout=5):
+                    started.set()
+                    time.sleep(0.1)
+                    raise RuntimeError("provider down")
+            except RuntimeError:
+                pass
+
+        t = threading.Thread(target=failing_leader)
+        t.start()
+        started.wait()
+        with locks.singleflight(self.dir, "q", timeout=5) as flight:
+            self.assertTrue(flight.leader)
+        t.join()
+
+
+if __name__ == "__main__":
+    unittest.main()
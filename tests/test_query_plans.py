@@ -0,0 +1,166 @@
+import inspect
+import os
+import re
+import tempfile
+import unittest
+
+import store as store_module
+from store import Store
+from utils import db
+
+# Statements allowed to scan, with the reason. Keep this list short: anything
+# on the interactive path (Alfred list/filter/reply) must be an index search.
+ALLOWED_SCANS = {
+    "FROM blobs WHERE created_at <": "gc_blobs is a maintenance pass over every blob",
+    "OR name LIKE": "archive and cross-profile search: substring match on names, an explicit command",
+    "SET meta = json_set(meta,": "one-off migration rewriting pre-normalisation usage meta",
+    "FROM main.usage_rollup WHERE +profile": "shard split: one-off move of a profile's rollup rows",
+    "shard.sqlite_sequence": "shard split: reserving ids, one row per AUTOINCREMENT table",
+    "'messages_fts_config'": "FTS5's own read of its config table when an attached index is first opened",
+    "SET uid = 't' || id": "one-off migration giving existing threads a uid",
+    "SET uid = 'm' || id": "one-off migration giving existing messages a uid",
+    "INSERT INTO changes(kind, row_id) SELECT": "sync-export --all: an explicit first export of every row",
+}
+
+# Public methods with no SQL of their own (or covered by another method)
+NO_QUERIES = {"close", "read_blob", "thread_lock"}
+
+_NO_PLAN = re.compile(r"^\s*(PRAGMA|BEGIN|COMMIT|ROLLBACK|ANALYZE|VACUUM|ATTACH|CREATE|ALTER|DROP|--)", re.I)
+# A recursive CTE's seed and its queue of rows (not a table) show as scans
+_CTE = re.compile(r"WITH RECURSIVE (\w+)", re.I)
+
+
+class TestQueryPlans(unittest.TestCase):
+    """Every statement Store issues must be an index search, never a SCAN or a TEMP B-TREE sort."""
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = Store(os.path.join(self.tmp.name, "plans.db"))
+        # The shard split_profiles moves "work" into, created (migrated) here
+        # so the workload traces only the split itself
+        self.shard = Store(str(store_module.shard_path(self.store.db_path, "work")))
+        with self.shard._archive_conn():
+            pass
+
+    def tearDown(self) -> None:
+        db.close_all()
+        self.tmp.cleanup()
+
+    def _workload(self, called):
+        s = self.store
+
+        def call(name, *args, **kwargs):
+            called.add(name)
+            result = getattr(s, name)(*args, **kwargs)
+            return list(result) if inspect.isgenerator(result) else result
+
+        tid = call("create_thread", "openai", "gpt-4o", "plans")
+        other = call("create_thread", "anthropic", "claude", "other", profile="work")
+        call("add_message", tid, "user", "hello")
+        call("add_message", tid, "assistant", "negligence " * 1000, meta={"usage": {"prompt_tokens": 3}, "provider": "openai"})
+        blob = call("put_blob", "tool output")
+        call("add_blob_message", tid, "tool", "tool output")
+        call("iter_blob", blob)
+        with call("turn") as turn:
+            turn.new_thread("openai", "gpt-4o", None)
+            turn.add_message("user", "hi")
+            turn.add_blob_message("tool", "tool output")
+        with call("turn") as turn:
+            turn.use_thread(tid)
+            turn.add_message("user", "deferred")
+            turn.defer()
+        call("replay_journal")
+        call("update_thread_name", tid, "renamed")
+        call("touch_thread", other)
+        call("get_recent_threads")
+        call("get_recent_thread_summaries", profile="work")
+        call("data_version")
+        call("get_thread_summary", tid)
+        call("iter_thread_summaries")
+        call("iter_thread_summaries", profile="default", provider="openai", since="2020-01-01", before="2100-01-01")
+        call("get_thread", tid)
+        call("get_latest_thread", "openai")
+        call("get_latest_thread", "openai", "gpt-4o")
+        call("get_thread_messages", tid)
+        call("get_history", tid)
+        call("get_thread_messages", tid, limit=10, before_id=99)
+        call("get_thread_messages", tid, limit=10, after_id=1)
+        call("iter_thread_messages", tid)
+        branch = call("fork_thread", tid)
+        call("add_message", branch, "user", "retry")
+        twig = call("fork_thread", branch, None, "anthropic", "claude")
+        with call("turn") as turn:
+            turn.fork_thread(twig, None, "openai", "gpt-4o", None)
+            turn.add_message("user", "again")
+        call("get_thread_messages", turn.thread_id, limit=10, before_id=99)
+        call("get_thread_messages", turn.thread_id, limit=None, after_id=1)
+        call("get_history", turn.thread_id, before_id=99)
+        call("usage_by_day")
+        call("usage_by_day", since="2020-01-01", until="2100-01-01")
+        call("usage_rollup")
+        call("usage_rollup", since="2020-01-01", until="2100-01-01", profile="work")
+        call("recompress", "none")
+        conn = db.connect(s.db_path)
+        conn.execute("UPDATE threads SET updated_at = '2020-01-01T00:00:00+00:00' WHERE id = ?", (tid,))
+        conn.commit()
+        call("archive_threads", idle_days=30)
+        call("archive_threads", idle_days=30, profile="work")
+        call("search_archived_threads", "negligence")
+        call("search_archived_threads", "negligence", profile="default")
+        call("restore_thread", tid)
+        call("gc_blobs", min_age_seconds=0)
+        call("split_profiles")
+        call("search_all_profiles", "other")
+        folder = os.path.join(self.tmp.name, "sync")
+        call("sync_export", folder, device="a", everything=True)
+        call("sync_import", folder, device="b")
+        call("maintain")
+
+    def test_no_scans_or_temp_sorts(self):
+        statements, called = [], set()
+        # Trace every connection the store opens (maintain reopens its own)
+        connect = db.connect
+
+        def traced_connect(path):
+            conn = connect(path)
+            conn.set_trace_callback(statements.append)
+            return conn
+
+        db.connect = traced_connect
+        try:
+            self._workload(called)
+        finally:
+            db.connect = connect
+
+        public = {name for name, _ in inspect.getmembers(Store, inspect.isfunction) if not name.startswith("_")}
+        self.assertEqual(public - called - NO_QUERIES, set(), "add new Store methods to the query-plan workload")
+
+        # Trigger bodies are not traced; check their statement directly
+        statements.append(store_module._RECOMPUTE_SUMMARY_SQL.format(tid="1"))
+
+        # Plan as for a database never analysed: maintain's ANALYZE of this
+        # tiny fixture would (rightly) prefer scans over a handful of rows
+        with self.store._archive_conn() as conn:
+            for schema in ("main", "archive"):
+                conn.execute(f"DROP TABLE IF EXISTS {schema}.sqlite_stat1")
+            conn.commit()
+        self.store.close()
+
+        failures = []
+        with self.store._archive_conn() as conn:
+            # split_profiles' statements name the attached shard
+            conn.execute("ATTACH DATABASE ? AS shard", (str(self.shard.db_path),))
+            conn.execute("ATTACH DATABASE ? AS shard_archive", (str(self.shard.archive_path),))
+            for sql in dict.fromkeys(statements):
+                if _NO_PLAN.match(sql) or any(key in sql for key in ALLOWED_SCANS):
+                    continue
+                plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+                not_tables = {"SCAN CONSTANT ROW"} | {f"SCAN {name}" for name in _CTE.findall(sql)}
+                bad = [d for d in plan if "TEMP B-TREE" in d or (d.startswith("SCAN") and "VIRTUAL TABLE" not in d and d not in not_tables)]
+                if bad:
+                    failures.append(f"{sql}\n    -> {bad}")
+        self.assertEqual(failures, [], "\n".join(failures))
+
+
+if __name__ == "__main__":
+    unittest.main()
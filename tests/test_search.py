@@ -0,0 +1,107 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from aifred import AifredDB, fts_query
+
+
+def _chatgpt_conv(conv_id, title, texts, update_time=1_700_000_000):
+    mapping = {}
+    parent = None
+    for i, text in enumerate(texts):
+        node_id = f"{conv_id}-n{i}"
+        mapping[node_id] = {
+            "id": node_id,
+            "parent": parent,
+            "children": [],
+            "message": {
+                "author": {"role": "user" if i % 2 == 0 else "assistant"},
+                "content": {"content_type": "text", "parts": [text]},
+                "create_time": update_time + i,
+            },
+        }
+        if parent:
+            mapping[parent]["children"].append(node_id)
+        parent = node_id
+    return {
+        "id": conv_id,
+        "title": title,
+        "create_time": update_time,
+        "update_time": update_time,
+        "mapping": mapping,
+        "current_node": parent,
+    }
+
+
+class TestConversationSearch(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = AifredDB(os.path.join(self.tmp.name, "conversations.db"))
+        chatgpt = [
+            _chatgpt_conv("c1", "Negligence research", ["What is the duty of care?", "Donoghue v Stevenson sets it out."]),
+            _chatgpt_conv("c2", "Holiday plans", ["Suggest a trip to Tasmania", "Try the Overland Track."]),
+        ]
+        claude = [
+            {
+                "uuid": "k1",
+                "name": "Contract drafting",
+                "created_at": "2024-01-01T00:00:00",
+                "updated_at": "2024-01-02T00:00:00",
+                "chat_messages": [
+                    {"sender": "human", "text": "Draft an indemnity clause"},
+                    {"sender": "assistant", "content": [{"type": "text", "text": "Here is an indemnity clause about negligence."}]},
+                ],
+            }
+        ]
+        self._import("chatgpt", chatgpt)
+        self._import("claude", claude)
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def _import(self, platform, data):
+        path = os.path.join(self.tmp.name, f"{platform}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        with redirect_stdout(io.StringIO()):
+            if platform == "chatgpt":
+                self.db.import_chatgpt_export(path)
+            else:
+                self.db.import_claude_export(path)
+
+    def test_fts_query_quotes_terms_and_prefixes_last(self):
+        self.assertEqual(fts_query('duty "of care'), '"duty" "of" "care"*')
+        self.assertEqual(fts_query("negl* law"), '"negl"* "law"*')
+        self.assertIsNone(fts_query("  ?! "))
+
+    def test_ranked_search_with_snippet(self):
+        rows = self.db.search_conversations("negligence")
+        self.assertEqual([r[0] for r in rows], ["c1", "k1"])  # title match ranks first
+        self.assertIn("[negligence]", rows[1][5].lower())
+
+    def test_prefix_and_filters(self):
+        self.assertEqual([r[0] for r in self.db.search_conversations("tasm")], ["c2"])
+        rows = self.db.search_conversations("negligence", platform="claude")
+        self.assertEqual([r[0] for r in rows], ["k1"])
+        self.assertEqual(self.db.search_conversations("negligence", favourite=True), [])
+
+    def test_json_keys_are_not_indexed(self):
+        self.assertEqual(self.db.search_conversations("content_type"), [])
+
+    def test_reimport_updates_index_and_keeps_flags(self):
+        import sqlite3
+        conn = sqlite3.connect(self.db.db_path)
+        conn.execute("UPDATE conversations SET is_favourite = 1 WHERE id = 'c2'")
+        conn.commit()
+        conn.close()
+        self._import("chatgpt", [_chatgpt_conv("c2", "Holiday plans", ["Suggest a trip to Kyoto"])])
+        self.assertEqual(self.db.search_conversations("tasmania"), [])
+        rows = self.db.search_conversations("kyoto", favourite=True)
+        self.assertEqual([r[0] for r in rows], ["c2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
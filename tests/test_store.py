@@ -1,8 +1,13 @@
+import json
+import logging
 import os
 import tempfile
 import unittest
 
 from store import Store
+from utils import db, logger
+from utils.budget import trim_history
+from utils.usage import normalise
 
 
 class TestStore(unittest.TestCase):
@@ -10,8 +15,17 @@ class TestStore(unittest.TestCase):
         self.tmp = tempfile.TemporaryDirectory()
         os.environ["AIFRED_DB_PATH"] = os.path.join(self.tmp.name, "test.db")
         self.store = Store()
+        # The log goes to the temporary directory, not ./aifred.log
+        os.environ["AIFRED_LOG_PATH"] = os.path.join(self.tmp.name, "aifred.log")
+        logger._LOGGER = None
 
     def tearDown(self) -> None:
+        for handler in logging.getLogger("aifred").handlers[:]:
+            logging.getLogger("aifred").removeHandler(handler)
+            handler.close()
+        logger._LOGGER = None
+        os.environ.pop("AIFRED_LOG_PATH", None)
+        db.close_all()
         self.tmp.cleanup()
         os.environ.pop("AIFRED_DB_PATH", None)
 
@@ -31,6 +45,579 @@ class TestStore(unittest.TestCase):
         threads = self.store.get_recent_threads()
         self.assertGreaterEqual(len(threads), 2)
 
+    def test_recent_thread_summaries(self):
+        t1 = self.store.create_thread("openai", "gpt-4o", "one")
+        self.store.add_message(t1, "user", "q1")
+        self.store.add_message(t1, "assistant", "a1")
+        self.store.add_message(t1, "assistant", "")
+        self.store.add_message(t1, "user", "q2")
+        t2 = self.store.create_thread("anthropic", "claude-3-7-sonnet", None)
+        summaries = {s.id: s for s in self.store.get_recent_thread_summaries()}
+        self.assertEqual(summaries[t1].preview, "a1")
+        self.assertEqual(summaries[t1].message_count, 4)
+        self.assertEqual(summaries[t2].preview, "")
+        self.assertEqual(summaries[t2].message_count, 0)
+
+    def test_keyset_pagination(self):
+        tid = self.store.create_thread("openai", "gpt-4o", None)
+        ids = [self.store.add_message(tid, "user", f"m{i}") for i in range(10)]
+        newest = self.store.get_thread_messages(tid, limit=3)
+        self.assertEqual([m.content for m in newest], ["m7", "m8", "m9"])
+        older = self.store.get_thread_messages(tid, limit=3, before_id=newest[0].id)
+        self.assertEqual([m.content for m in older], ["m4", "m5", "m6"])
+        after = self.store.get_thread_messages(tid, limit=2, after_id=ids[1])
+        self.assertEqual([m.content for m in after], ["m2", "m3"])
+        self.assertEqual(len(self.store.get_thread_messages(tid, limit=None)), 10)
+        streamed = list(self.store.iter_thread_messages(tid, batch_size=4))
+        self.assertEqual([m.id for m in streamed], ids)
+
+    def test_summary_columns_follow_messages(self):
+        tid = self.store.create_thread("openai", "gpt-4o", None)
+        self.store.add_message(tid, "user", "q")
+        self.store.add_message(tid, "assistant", "a" * 3000, meta={"usage": {"prompt_tokens": 10, "completion_tokens": 5}})
+        last = self.store.add_message(tid, "assistant", "b", meta={"usage": {"input_tokens": 7, "output_tokens": 3}})
+        s = self.store.get_thread_summary(tid)
+        self.assertEqual((s.message_count, s.last_message_id), (3, last))
+        self.assertEqual((s.total_prompt_tokens, s.total_completion_tokens), (17, 8))
+        self.assertEqual(s.preview, "b")
+        with self.store._conn() as conn:
+            conn.execute("DELETE FROM messages WHERE id = ?", (last,))
+            conn.commit()
+        s = self.store.get_thread_summary(tid)
+        self.assertEqual((s.message_count, s.total_prompt_tokens), (2, 10))
+        self.assertEqual(len(s.preview), 2000)
+
+    def test_summary_backfill_for_existing_db(self):
+        import sqlite3
+        path = os.path.join(self.tmp.name, "old.db")
+        conn = sqlite3.connect(path)
+        conn.executescript(
+            """
+            CREATE TABLE threads (id INTEGER PRIMARY KEY AUTOINCREMENT, profile TEXT NOT NULL DEFAULT 'default',
+              provider TEXT NOT NULL, model TEXT NOT NULL, name TEXT, created_at TEXT NOT NULL, updated_at TEXT NOT NULL);
+            CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, thread_id INTEGER NOT NULL, role TEXT NOT NULL,
+              content TEXT NOT NULL, meta JSON, created_at TEXT NOT NULL);
+            INSERT INTO threads VALUES (1, 'default', 'openai', 'gpt-4o', NULL, 't', 't');
+            INSERT INTO messages VALUES (1, 1, 'user', 'hi', NULL, 't');
+            INSERT INTO messages VALUES (2, 1, 'assistant', 'hello', '{"usage": {"prompt_tokens": 4}}', 't');
+            """
+        )
+        conn.commit()
+        conn.close()
+        s = Store(path).get_thread_summary(1)
+        self.assertEqual((s.message_count, s.last_message_id, s.preview, s.total_prompt_tokens), (2, 2, "hello", 4))
+
+    def test_usage_normalised_and_aggregated(self):
+        self.assertEqual(normalise({"promptTokenCount": 5, "candidatesTokenCount": 2, "totalTokenCount": 7}),
+                         {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7})
+        self.assertEqual(normalise({"input_tokens": 4}), {"prompt_tokens": 4})
+        t1 = self.store.create_thread("anthropic", "claude", None)
+        self.store.add_message(t1, "user", "q")
+        self.store.add_message(t1, "assistant", "a", meta={
+            "usage": {"input_tokens": 10, "output_tokens": 4}, "provider": "anthropic", "model": "claude", "latency_ms": 100,
+        })
+        self.store.add_message(t1, "assistant", "b", meta={
+            "usage": {"input_tokens": 6, "output_tokens": 2}, "provider": "anthropic", "model": "claude", "latency_ms": 300,
+        })
+        # A reply written before normalisation: the migration rewrites its meta
+        conn = db.connect(self.store.db_path)
+        conn.execute(
+            "INSERT INTO messages(thread_id, role, content, meta, created_at) VALUES (?, 'assistant', 'c', ?, '2020-05-01T10:00:00')",
+            (t1, '{"usage": {"promptTokenCount": 3, "candidatesTokenCount": 1}}'),
+        )
+        conn.execute("PRAGMA user_version = 8")
+        conn.commit()
+        Store()
+        meta = json.loads(conn.execute("SELECT meta FROM messages WHERE content = 'c'").fetchone()[0])
+        self.assertEqual(meta, {"usage": {"prompt_tokens": 3, "completion_tokens": 1}, "provider": "anthropic", "model": "claude"})
+        self.assertEqual(self.store.get_thread_summary(t1).total_prompt_tokens, 19)
+        days = self.store.usage_by_day()
+        self.assertEqual([(u.day, u.provider, u.model, u.replies, u.prompt_tokens, u.completion_tokens) for u in days], [
+            ("2020-05-01", "anthropic", "claude", 1, 3, 1),
+            (days[1].day, "anthropic", "claude", 2, 16, 6),
+        ])
+        self.assertEqual((days[0].avg_latency_ms, days[1].avg_latency_ms), (None, 200))
+        self.assertEqual(len(self.store.usage_by_day(since="2021-01-01")), 1)
+
+    def test_usage_rollup_maintained_on_write(self):
+        import store as store_module
+        from utils.stats import report
+        work = self.store.create_thread("openai", "gpt-4o", None, profile="work")
+        for latency, error in ((400, False), (2500, False), (45000, True)):
+            self.store.add_message(work, "user", "q")
+            self.store.add_message(work, "assistant", "a", meta={
+                "usage": {"prompt_tokens": 10, "completion_tokens": 5}, "provider": "openai", "model": "gpt-4o",
+                "latency_ms": latency, "error": error,
+            })
+        [row] = self.store.usage_rollup(profile="work")
+        self.assertEqual((row.profile, row.provider, row.model, row.requests, row.errors), ("work", "openai", "gpt-4o", 3, 1))
+        self.assertEqual((row.prompt_tokens, row.latency_ms_sum, row.latency_buckets), (30, 47900, (1, 1, 0, 0, 1)))
+        self.assertEqual(self.store.usage_rollup(profile="default"), [])
+        # Archiving keeps the history; restoring doesn't count the replies twice
+        conn = db.connect(self.store.db_path)
+        conn.execute("UPDATE threads SET updated_at = '2020-01-01T00:00:00+00:00'")
+        conn.commit()
+        self.assertEqual(self.store.archive_threads(idle_days=30), 1)
+        self.store.restore_thread(work)
+        self.assertEqual(self.store.usage_rollup(), [row])
+        # The migration backfills existing replies
+        conn.execute("DELETE FROM usage_rollup")
+        conn.execute("PRAGMA user_version = %d" % store_module._MIGRATIONS.index(store_module._create_usage_rollup))
+        conn.commit()
+        Store()
+        self.assertEqual(self.store.usage_rollup(), [row])
+        lines = report(self.store, profile="work")
+        self.assertTrue(lines[0].startswith("today    3 requests, 1 errors, 30 in / 15 out tokens"), lines[0])
+        self.assertIn("p50 ≤3s, p95 >30s", lines[0])
+        self.assertEqual(lines[-1].split(":")[0], "  openai gpt-4o")
+
+    def test_messages_fts_backfilled(self):
+        import store as store_module
+        tid = self.store.create_thread("openai", "gpt-4o", "notes")
+        self.store.add_message(tid, "user", "zebra " * 200)
+        self.store.add_blob_message(tid, "tool", "okapi report " * 50)
+        conn = db.connect(self.store.db_path)
+        conn.execute("DROP TABLE messages_fts")
+        conn.execute("PRAGMA user_version = %d" % store_module._MIGRATIONS.index(store_module._create_messages_fts))
+        conn.commit()
+        Store()
+        for word in ("zebra", "okapi"):
+            self.assertEqual([t.id for _, t in self.store.search_all_profiles(word)], [tid])
+
+    def test_split_profiles_into_shards(self):
+        import store as store_module
+        from store import shard_path
+        home = self.store.create_thread("openai", "gpt-4o", "home")
+        self.store.add_message(home, "user", "home question")
+        live = self.store.create_thread("openai", "gpt-4o", "contract review", profile="work")
+        question = self.store.add_message(live, "user", "q")
+        self.store.add_message(live, "assistant", "indemnity clause", meta={"usage": {"prompt_tokens": 9}, "provider": "openai"})
+        branch = self.store.fork_thread(live, question, name="retry")
+        self.store.add_message(branch, "user", "q again")
+        old = self.store.create_thread("anthropic", "claude", "old matter", profile="work")
+        self.store.add_blob_message(old, "tool", "negligence report " * 50)
+        conn = db.connect(self.store.db_path)
+        conn.execute("UPDATE threads SET updated_at = '2020-01-01T00:00:00+00:00' WHERE id = ?", (old,))
+        conn.commit()
+        self.assertEqual(self.store.archive_threads(idle_days=30), 1)
+        summary = self.store.get_thread_summary(live)
+
+        self.assertEqual(self.store.split_profiles(), {"work": 3})
+        self.assertEqual(self.store.split_profiles(), {})
+        self.assertIsNone(self.store.get_thread(live))
+        self.assertEqual(self.store.usage_rollup(), [])
+        self.assertEqual([t.id for t in self.store.get_recent_threads()], [home])
+        work = Store(str(shard_path(self.store.db_path, "work")))
+        self.assertEqual(work.db_path.name, "test.work.db")
+        # The shard numbers the rows itself; the branch still shares its history
+        moved = {t.name: t for t in work.get_recent_thread_summaries(profile="work")}
+        self.assertEqual(
+            (moved["contract review"].preview, moved["contract review"].message_count, moved["contract review"].total_prompt_tokens),
+            (summary.preview, summary.message_count, summary.total_prompt_tokens),
+        )
+        self.assertEqual([m.content for m in work.get_thread_messages(moved["retry"].id)], ["q", "q again"])
+        self.assertEqual(moved["contract review"].last_message_id, work.get_thread_messages(moved["contract review"].id)[-1].id)
+        self.assertEqual([r.requests for r in work.usage_rollup(profile="work")], [1])
+        [archived] = work.search_archived_threads("negligence")
+        work.restore_thread(archived.id)
+        self.assertEqual(work.get_thread_messages(archived.id)[0].content, "negligence report " * 50)
+        hits = self.store.search_all_profiles("INDEMNITY")
+        self.assertEqual([(p, t.id) for p, t in hits], [("work", moved["contract review"].id)])
+        # Message text, not only names: the index moves with the rows
+        self.assertEqual([(p, t.id) for p, t in self.store.search_all_profiles("negligence")], [("work", archived.id)])
+        self.assertEqual([(p, t.id) for p, t in self.store.search_all_profiles("question")], [("default", home)])
+
+        # A later split never overwrites the shard's own rows
+        own = work.create_thread("openai", "gpt-4o", "shard thread", profile="work")
+        work.add_message(own, "user", "written in the shard")
+        stray = self.store.create_thread("openai", "gpt-4o", "stray in base", profile="work")
+        self.store.add_message(stray, "user", "written in the base")
+        self.assertEqual(self.store.split_profiles(), {"work": 1})
+        self.assertEqual([m.content for m in work.get_thread_messages(own)], ["written in the shard"])
+        [copy] = [t for t in work.get_recent_threads(profile="work") if t.name == "stray in base"]
+        self.assertEqual([m.content for m in work.get_thread_messages(copy.id)], ["written in the base"])
+
+        # With sharding on, each profile opens its own file
+        store_module.SHARD_BY_PROFILE = True
+        try:
+            self.assertEqual(Store(profile="work").db_path, work.db_path)
+            self.assertEqual(Store(profile="default").db_path, self.store.db_path)
+        finally:
+            store_module.SHARD_BY_PROFILE = False
+
+    def test_sync_replicates_changes_between_databases(self):
+        folder = os.path.join(self.tmp.name, "shared")
+        os.makedirs(os.path.join(self.tmp.name, "b"))
+        a, b = self.store, Store(os.path.join(self.tmp.name, "b", "test.db"))
+        plan = a.create_thread("openai", "gpt-4o", "plan")
+        q1 = a.add_message(plan, "user", "q1")
+        shared = a.add_message(plan, "assistant", "Negligence is a breach of duty. " * 200)
+        a.add_blob_message(plan, "tool", "page body")
+        branch = a.fork_thread(plan, shared, "anthropic", "claude", "retry")
+        a.add_message(branch, "user", "q2")
+        notes = b.create_thread("openai", "gpt-4o", "notes")
+        b.add_message(notes, "user", "from b")
+
+        # Nothing is logged before a database first syncs; the first export sends it all
+        with a._conn() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM changes").fetchone()[0], 0)
+        self.assertEqual(a.sync_export(folder, device="mac-a"), 6)
+        self.assertEqual(b.sync_export(folder, device="mac-b"), 2)
+        self.assertEqual(b.sync_import(folder, device="mac-b"), {"mac-a": 6})
+        self.assertEqual(a.sync_import(folder, device="mac-a"), {"mac-b": 2})
+        by_name = {t.name: t for t in b.get_recent_thread_summaries(limit=10)}
+        self.assertEqual(set(by_name), {"plan", "retry", "notes"})
+        self.assertEqual(by_name["plan"].message_count, 3)
+        copied = [m.content for m in b.get_thread_messages(by_name["plan"].id)]
+        self.assertEqual(copied, ["q1", "Negligence is a breach of duty. " * 200, "page body"])
+        # The branch still shares its history by reference
+        self.assertEqual([m.content for m in b.get_thread_messages(by_name["retry"].id)], copied[:2] + ["q2"])
+        self.assertEqual(by_name["retry"].message_count, 1)
+        self.assertEqual([m.content for m in a.get_thread_messages(a.get_recent_threads()[0].id)], ["from b"])
+
+        # Nothing echoes back, and applying a batch again changes nothing
+        self.assertEqual((a.sync_export(folder, device="mac-a"), b.sync_export(folder, device="mac-b")), (0, 0))
+        with b._conn() as conn:
+            conn.execute("DELETE FROM sync_state WHERE key = 'applied:mac-a'")
+            conn.commit()
+        self.assertEqual(b.sync_import(folder, device="mac-b"), {"mac-a": 0})
+
+        # Only what changed is exported; the later edit of a thread's name wins
+        a.add_message(plan, "assistant", "a2")
+        a.update_thread_name(plan, "plan v2")
+        self.assertEqual(a.sync_export(folder, device="mac-a"), 2)
+        b.update_thread_name(by_name["plan"].id, "older edit")
+        with b._conn() as conn:
+            conn.execute("UPDATE threads SET meta_updated_at = '2020-01-01T00:00:00+00:00' WHERE id = ?", (by_name["plan"].id,))
+            conn.commit()
+        self.assertEqual(b.sync_import(folder, device="mac-b"), {"mac-a": 2})
+        summary = b.get_thread_summary(by_name["plan"].id)
+        self.assertEqual((summary.name, summary.message_count, summary.preview), ("plan v2", 4, "a2"))
+        self.assertEqual(b.maintain()[0], "pruned 2 exported change log entries")
+
+        # A rename still wins over newer messages on the other device
+        b.update_thread_name(by_name["plan"].id, "renamed on b")
+        a.add_message(plan, "user", "q3")
+        a.sync_export(folder, device="mac-a")
+        b.sync_export(folder, device="mac-b")
+        a.sync_import(folder, device="mac-a")
+        b.sync_import(folder, device="mac-b")
+        names = (a.get_thread_summary(plan).name, b.get_thread_summary(by_name["plan"].id).name)
+        self.assertEqual(names, ("renamed on b", "renamed on b"))
+
+        # A message edited on both devices: the later edit wins on both
+        with a._conn() as conn:
+            conn.execute("UPDATE messages SET content = 'q1 edited on a' WHERE id = ?", (q1,))
+            conn.commit()
+            uid = conn.execute("SELECT uid FROM messages WHERE id = ?", (q1,)).fetchone()[0]
+        with b._conn() as conn:
+            conn.execute("UPDATE messages SET content = 'q1 edited on b' WHERE uid = ?", (uid,))
+            conn.commit()
+        # Each message goes with its (unchanged) thread
+        self.assertEqual((a.sync_export(folder, device="mac-a"), b.sync_export(folder, device="mac-b")), (2, 2))
+        self.assertEqual(a.sync_import(folder, device="mac-a"), {"mac-b": 1})
+        self.assertEqual(b.sync_import(folder, device="mac-b"), {"mac-a": 0})
+        contents = [s.get_thread_messages(t)[0].content for s, t in ((a, plan), (b, by_name["plan"].id))]
+        self.assertEqual(contents, ["q1 edited on b", "q1 edited on b"])
+
+        # A thread the change log never recorded still reaches the peer with its messages
+        old = a.create_thread("openai", "gpt-4o", "unlogged")
+        with a._conn() as conn:
+            conn.execute("DELETE FROM changes WHERE kind = 'thread'")
+            conn.commit()
+        a.add_message(old, "user", "late message")
+        a.sync_export(folder, device="mac-a")
+        self.assertEqual(b.sync_import(folder, device="mac-b"), {"mac-a": 2})
+        unlogged = [t for t in b.get_recent_threads(limit=10) if t.name == "unlogged"]
+        self.assertEqual([m.content for m in b.get_thread_messages(unlogged[0].id)], ["late message"])
+
+    def test_sync_routes_profiles_to_shards(self):
+        import store as store_module
+        from store import shard_path
+        folder = os.path.join(self.tmp.name, "shared")
+        os.makedirs(os.path.join(self.tmp.name, "a"))
+        peer = Store(os.path.join(self.tmp.name, "a", "test.db"))
+        home = peer.create_thread("openai", "gpt-4o", "home")
+        peer.add_message(home, "user", "home question")
+        work = peer.create_thread("openai", "gpt-4o", "contract", profile="work")
+        peer.add_message(work, "user", "indemnity")
+        peer.sync_export(folder, device="mac-a")
+        # The peer doesn't shard; this machine does
+        store_module.SHARD_BY_PROFILE = True
+        try:
+            self.assertEqual(self.store.sync_import(folder, device="mac-b"), {"mac-a": 4})
+            # A later batch's message finds its thread in the shard
+            peer.add_message(work, "assistant", "clause 7")
+            peer.sync_export(folder, device="mac-a")
+            self.assertEqual(self.store.sync_import(folder, device="mac-b"), {"mac-a": 1})
+            shard = Store(profile="work")
+        finally:
+            store_module.SHARD_BY_PROFILE = False
+        self.assertEqual(shard.db_path, shard_path(self.store.db_path, "work"))
+        self.assertEqual([t.name for t in self.store.get_recent_threads()], ["home"])
+        self.assertEqual(self.store.get_recent_threads(profile="work"), [])
+        [thread] = shard.get_recent_threads(profile="work")
+        self.assertEqual([m.content for m in shard.get_thread_messages(thread.id)], ["indemnity", "clause 7"])
+
+    def test_migrations_run_once(self):
+        import store as store_module
+        conn = db.connect(self.store.db_path)
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], len(store_module._MIGRATIONS))
+        traced = []
+        conn.set_trace_callback(traced.append)
+        try:
+            Store()
+        finally:
+            conn.set_trace_callback(None)
+        self.assertEqual(traced, ["PRAGMA main.user_version"])
+
+    def test_large_messages_compressed_transparently(self):
+        tid = self.store.create_thread("openai", "gpt-4o", "long")
+        big = "The court held that the duty of care was breached. " * 200
+        self.store.add_message(tid, "user", "short question")
+        self.store.add_message(tid, "assistant", big)
+        conn = db.connect(self.store.db_path)
+        rows = conn.execute("SELECT typeof(content), content_encoding FROM messages ORDER BY id").fetchall()
+        self.assertEqual(rows, [("text", None), ("blob", "zlib")])
+        self.assertEqual([m.content for m in self.store.get_thread_messages(tid)], ["short question", big])
+        summary = self.store.get_thread_summary(tid)
+        self.assertTrue(summary.preview.startswith("The court held"))
+        # Decompress everything, then compress again; text and summary are unchanged
+        self.assertEqual(self.store.recompress("none")[0], 1)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM messages WHERE content_encoding IS NOT NULL").fetchone()[0], 0)
+        rewritten, before, after = self.store.recompress("zlib")
+        self.assertEqual(rewritten, 1)
+        self.assertLess(after, before)
+        self.assertEqual(self.store.get_thread_messages(tid)[-1].content, big)
+        self.assertEqual(self.store.get_thread_summary(tid), summary)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM messages WHERE edited_at IS NOT NULL").fetchone()[0], 0)
+        # An edit that changes the text and its encoding together updates the
+        # summary, is stamped as an edit and is logged for sync
+        conn.execute("INSERT INTO sync_state(key, value) VALUES ('exported', 0)")
+        conn.execute("UPDATE messages SET content = 'revised', content_encoding = NULL WHERE thread_id = ? AND role = 'assistant'", (tid,))
+        conn.commit()
+        self.assertEqual(self.store.get_thread_summary(tid).preview, "revised")
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM messages WHERE edited_at IS NOT NULL").fetchone()[0], 1)
+        self.assertEqual(conn.execute("SELECT kind FROM changes").fetchall(), [("message",)])
+
+    def test_history_rows_are_compact_mappings(self):
+        tid = self.store.create_thread("openai", "gpt-4o", "history")
+        big = "The court held that the duty of care was breached. " * 200
+        self.store.add_message(tid, "user", "question", meta={"directives": {}})
+        self.store.add_message(tid, "assistant", big)
+        self.store.add_blob_message(tid, "tool", "tool output")
+        history = self.store.get_history(tid, limit=2)
+        self.assertEqual([(m.role, m.content) for m in history], [("assistant", big), ("tool", "tool output")])
+        for row in (history[0], self.store.get_thread_messages(tid)[0], self.store.get_thread(tid)):
+            self.assertFalse(hasattr(row, "__dict__"))
+        # Rows stand in for the {"role", "content"} dicts providers take
+        m = history[1]
+        self.assertEqual((m["role"], m.get("content"), m.get("meta", "-")), ("tool", "tool output", "-"))
+        with self.assertRaises(KeyError):
+            m["meta"]
+        kept, _ = trim_history(history, None, max_input_tokens=50, reserve_for_completion=0)
+        self.assertEqual(kept, [m])
+
+    def test_branches_share_history_by_reference(self):
+        root = self.store.create_thread("openai", "gpt-4o", "plan")
+        q1 = self.store.add_message(root, "user", "q1")
+        a1 = self.store.add_message(root, "assistant", "a1")
+        self.store.add_message(root, "user", "q2")
+        self.store.add_message(root, "assistant", "a2 on gpt-4o")
+        # Retry q2 on another model: branch before it
+        branch = self.store.fork_thread(root, a1, "anthropic", "claude-3-7-sonnet")
+        self.store.add_message(branch, "user", "q2")
+        self.store.add_message(branch, "assistant", "a2 on claude")
+        conn = db.connect(self.store.db_path)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0], 6)
+        self.assertEqual([m.content for m in self.store.get_thread_messages(branch)], ["q1", "a1", "q2", "a2 on claude"])
+        self.assertEqual([m.content for m in self.store.get_thread_messages(root)][-1], "a2 on gpt-4o")
+        summary = self.store.get_thread_summary(branch)
+        self.assertEqual((summary.provider, summary.name, summary.message_count, summary.preview), ("anthropic", "plan", 2, "a2 on claude"))
+
+        # A branch of a branch at a shared message points at the thread that stores it
+        twig = self.store.fork_thread(branch, q1)
+        self.assertEqual(conn.execute("SELECT parent_id, fork_message_id FROM threads WHERE id = ?", (twig,)).fetchone(), (root, q1))
+        with self.store.turn() as turn:
+            turn.fork_thread(branch, None, "openai", "gpt-4o", "leaf")
+            turn.add_message("user", "q3")
+        leaf = turn.thread_id
+        self.assertEqual([m.content for m in self.store.get_history(leaf)], ["q1", "a1", "q2", "a2 on claude", "q3"])
+        self.assertEqual([m.content for m in self.store.get_history(leaf, limit=2, before_id=a1 + 1)], ["q1", "a1"])
+        pages = [m.content for m in self.store.iter_thread_messages(leaf, batch_size=2)]
+        self.assertEqual(pages, ["q1", "a1", "q2", "a2 on claude", "q3"])
+        self.assertEqual([m.content for m in self.store.get_thread_messages(leaf, limit=2)], ["a2 on claude", "q3"])
+        with self.assertRaises(ValueError):
+            self.store.fork_thread(twig, a1)
+
+        # Parents stay live while a branch is; restoring a branch brings them back
+        conn.execute("UPDATE threads SET updated_at = '2020-01-01T00:00:00+00:00' WHERE id IN (?, ?)", (root, branch))
+        conn.commit()
+        self.assertEqual(self.store.archive_threads(idle_days=30), 0)
+        conn.execute("UPDATE threads SET updated_at = '2020-01-01T00:00:00+00:00'")
+        conn.commit()
+        self.assertEqual(self.store.archive_threads(idle_days=30), 4)
+        self.store.restore_thread(leaf)
+        self.assertEqual({t.id for t in self.store.get_recent_threads()}, {leaf, branch, root})
+        self.assertEqual(len(self.store.get_thread_messages(leaf)), 5)
+
+    def test_archive_search_and_restore(self):
+        old = self.store.create_thread("openai", "gpt-4o", "tort notes")
+        self.store.add_message(old, "user", "what is negligence")
+        self.store.add_message(old, "assistant", "Negligence is a breach of duty. " * 200)
+        fresh = self.store.create_thread("openai", "gpt-4o", "today")
+        self.store.add_message(fresh, "user", "hello")
+        conn = db.connect(self.store.db_path)
+        conn.execute("UPDATE threads SET updated_at = '2020-01-01T00:00:00+00:00' WHERE id = ?", (old,))
+        conn.commit()
+        before = self.store.get_thread_summary(old)
+        logged = conn.execute("SELECT COUNT(*) FROM changes").fetchone()[0]
+
+        self.assertEqual(self.store.archive_threads(idle_days=30), 1)
+        self.assertIsNone(self.store.get_thread(old))
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM main.messages WHERE thread_id = ?", (old,)).fetchone()[0], 0)
+        self.assertEqual([t.name for t in self.store.get_recent_thread_summaries()], ["today"])
+        # Searchable by message text (including compressed bodies) and by name
+        self.assertEqual([t.id for t in self.store.search_archived_threads("breach")], [old])
+        self.assertEqual([t.id for t in self.store.search_archived_threads("tort")], [old])
+        self.assertEqual(self.store.search_archived_threads("hello"), [])
+
+        self.assertEqual(self.store.restore_thread(old), before)
+        self.assertEqual(self.store.get_thread_messages(old)[-1].content, "Negligence is a breach of duty. " * 200)
+        self.assertEqual(self.store.search_archived_threads("breach"), [])
+        # The restored rows aren't logged as changes for sync to send again
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM changes").fetchone()[0], logged)
+        self.assertIsNone(self.store.restore_thread(old))
+
+    def test_turn_writes_in_one_transaction(self):
+        conn = db.connect(self.store.db_path)
+        traced = []
+        conn.set_trace_callback(traced.append)
+        try:
+            with self.store.turn() as turn:
+                turn.new_thread("openai", "gpt-4o", "turn", profile="work")
+                turn.add_message("user", "question")
+                turn.add_blob_message("tool", '{"name": "browse", "result": "page"}')
+                turn.add_message("assistant", "answer", meta={"usage": {"prompt_tokens": 7}})
+                self.assertIsNone(turn.thread_id)
+        finally:
+            conn.set_trace_callback(None)
+        self.assertEqual(sum(1 for sql in traced if sql == "COMMIT"), 1)
+        summary = self.store.get_thread_summary(turn.thread_id)
+        self.assertEqual((summary.name, summary.message_count, summary.preview, summary.total_prompt_tokens), ("turn", 3, "answer", 7))
+        self.assertEqual(self.store.get_latest_thread("openai", profile="work").id, turn.thread_id)
+
+        # A turn that fails part-way writes nothing
+        with self.assertRaises(RuntimeError):
+            with self.store.turn() as failed:
+                failed.use_thread(turn.thread_id)
+                failed.add_message("user", "lost")
+                raise RuntimeError("provider error")
+        self.assertEqual(self.store.get_thread_summary(turn.thread_id).message_count, 3)
+
+    def test_journal_replay_is_idempotent(self):
+        with self.store.turn() as turn:
+            turn.new_thread("openai", "gpt-4o", "later")
+            turn.add_message("user", "question")
+            turn.add_blob_message("tool", "result")
+            turn.defer(effects={"notify": ["t", "m"]})
+        with open(self.store.journal_path, "rb") as f:
+            journaled = f.read()
+        seen = []
+        self.assertEqual(self.store.replay_journal(seen.append), 1)
+        self.assertEqual(seen[0]["effects"], {"notify": ["t", "m"]})
+        # A crash after the commit but before the journal was emptied replays it
+        with open(self.store.journal_path, "ab") as f:
+            f.write(journaled + b'{"torn')
+        self.assertEqual(self.store.replay_journal(), 1)
+        self.assertEqual([(t.name, t.message_count) for t in self.store.get_recent_thread_summaries()], [("later", 2)])
+        self.assertEqual(self.store.replay_journal(), 0)
+
+    def test_journal_replay_skips_and_quarantines_failing_entries(self):
+        from utils import journal
+        tid = self.store.create_thread("openai", "gpt-4o", "parent")
+        mid = self.store.add_message(tid, "user", "fork here")
+        with self.store.turn() as turn:
+            turn.fork_thread(tid, mid, "openai", "gpt-4o", "branch")
+            turn.add_message("user", "lost fork")
+            turn.defer()
+        with self.store.turn() as turn:
+            turn.new_thread("openai", "gpt-4o", "later")
+            turn.add_message("user", "still applied")
+            turn.defer()
+        with self.store._conn() as conn:
+            conn.execute("DELETE FROM threads WHERE id = ?", (tid,))
+            conn.commit()
+        # The vanished fork point doesn't block the entry after it
+        self.assertEqual(self.store.replay_journal(), 1)
+        self.assertEqual([t.name for t in self.store.get_recent_threads()], ["later"])
+        for _ in range(journal.MAX_ATTEMPTS - 1):
+            self.assertTrue(journal.pending(self.store.journal_path))
+            self.assertEqual(self.store.replay_journal(), 0)
+        self.assertFalse(journal.pending(self.store.journal_path))
+        with open(str(self.store.journal_path) + ".failed") as f:
+            failed = [json.loads(line) for line in f]
+        self.assertEqual([e["attempts"] for e in failed], [journal.MAX_ATTEMPTS])
+
+    def test_blobs_deduplicated_streamed_and_collected(self):
+        tid = self.store.create_thread("openai", "gpt-4o", "tools")
+        page = '{"name": "fetch", "result": "' + "page body " * 20000 + '"}'
+        first = self.store.add_blob_message(tid, "tool", page)
+        self.store.add_blob_message(tid, "tool", page)
+        self.store.add_blob_message(tid, "assistant", "small reply")
+        conn = db.connect(self.store.db_path)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0], 2)
+        stored = conn.execute("SELECT length(data) FROM blobs ORDER BY size DESC").fetchone()[0]
+        self.assertLess(stored, len(page) // 10)
+        self.assertEqual([m.content for m in self.store.get_thread_messages(tid)], [page, page, "small reply"])
+        self.assertEqual(self.store.get_thread_summary(tid).preview, "small reply")
+        blob_id = conn.execute("SELECT blob_id FROM messages WHERE id = ?", (first,)).fetchone()[0]
+        chunks = list(self.store.iter_blob(blob_id, chunk_size=64))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(b"".join(chunks).decode("utf-8"), page)
+
+        # Archived threads keep their blobs alive and searchable
+        conn.execute("UPDATE threads SET updated_at = '2020-01-01T00:00:00+00:00' WHERE id = ?", (tid,))
+        conn.commit()
+        self.assertEqual(self.store.archive_threads(idle_days=30), 1)
+        self.assertEqual(self.store.gc_blobs(min_age_seconds=0)[0], 0)
+        self.assertEqual([t.id for t in self.store.search_archived_threads("fetch")], [tid])
+        self.store.restore_thread(tid)
+        self.assertEqual(self.store.get_thread_messages(tid)[0].content, page)
+
+        conn.execute("DELETE FROM messages WHERE thread_id = ?", (tid,))
+        conn.commit()
+        self.assertEqual(self.store.gc_blobs()[0], 0)  # too young
+        self.assertEqual(self.store.gc_blobs(min_age_seconds=0)[0], 2)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0], 0)
+
+    def test_maintain_enables_incremental_vacuum(self):
+        conn = db.connect(self.store.db_path)
+        conn.execute("PRAGMA auto_vacuum = NONE")
+        conn.execute("VACUUM")
+        steps = self.store.maintain()
+        self.assertTrue(any("main: converted" in step for step in steps))
+        conn = db.connect(self.store.db_path)
+        self.assertEqual(conn.execute("PRAGMA main.auto_vacuum").fetchone()[0], 2)
+        tid = self.store.create_thread("openai", "gpt-4o", None)
+        for _ in range(50):
+            self.store.add_message(tid, "user", "x" * 3000)
+        conn.execute("DELETE FROM messages")
+        conn.commit()
+        self.assertGreater(conn.execute("PRAGMA freelist_count").fetchone()[0], 10)
+        self.assertTrue(any("released" in step for step in self.store.maintain()))
+        conn = db.connect(self.store.db_path)
+        self.assertEqual(conn.execute("PRAGMA freelist_count").fetchone()[0], 0)
+
+    def test_connection_reused_and_tuned(self):
+        with self.store._conn() as c1:
+            mode = c1.execute("PRAGMA journal_mode").fetchone()[0]
+            sync = c1.execute("PRAGMA synchronous").fetchone()[0]
+        with Store()._conn() as c2:
+            self.assertIs(c1, c2)
+        self.assertEqual(mode, "wal")
+        self.assertEqual(sync, 1)  # NORMAL
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,5 +1,6 @@
 import io
 import json
+import logging
 import os
 import tempfile
 import unittest
@@ -7,6 +8,7 @@ from contextlib import redirect_stdout
 
 import alfred_action as action
 from store import Store
+from utils import logger
 
 
 class TestToolExec(unittest.TestCase):
@@ -15,9 +17,17 @@ class TestToolExec(unittest.TestCase):
         os.environ["AIFRED_DB_PATH"] = os.path.join(self.tmp.name, "test.db")
         os.environ["AIFRED_DRY_RUN"] = "1"
         os.environ["AIFRED_TOOL_EXEC"] = "1"
+        # The log goes to the temporary directory, not ./aifred.log
+        os.environ["AIFRED_LOG_PATH"] = os.path.join(self.tmp.name, "aifred.log")
+        logger._LOGGER = None
         self.store = Store()
 
     def tearDown(self) -> None:
+        for handler in logging.getLogger("aifred").handlers[:]:
+            logging.getLogger("aifred").removeHandler(handler)
+            handler.close()
+        logger._LOGGER = None
+        os.environ.pop("AIFRED_LOG_PATH", None)
         self.tmp.cleanup()
         os.environ.pop("AIFRED_DB_PATH", None)
         os.environ.pop("AIFRED_DRY_RUN", None)
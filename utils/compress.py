@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import os
+import zlib
+from typing import Optional, Tuple, Union
+
+# Message bodies at least this many characters long are stored compressed.
+# Smaller ones stay plain TEXT, so the common case never touches a codec.
+ALGORITHM = os.getenv("AIFRED_COMPRESSION", "zlib").lower()  # zlib | zstd | none
+MIN_CHARS = int(os.getenv("AIFRED_COMPRESS_MIN_CHARS", "4096"))
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+_ZSTD = None
+
+
+def _zstd():
+    global _ZSTD
+    if _ZSTD is None:
+        try:
+            import zstandard  # type: ignore
+            _ZSTD = zstandard
+        except Exception:
+            _ZSTD = False
+    return _ZSTD or None
+
+
+def compress(text: str, algorithm: Optional[str] = None, min_chars: Optional[int] = None) -> Tuple[Union[str, bytes], Optional[str]]:
+    """Return (stored value, encoding) for a message body.
+
+    The encoding is None when the text is kept as is: below the threshold,
+    compression disabled, or a saving of less than 10%. zstd falls back to
+    zlib when the ``zstandard`` package is not installed.
+    """
+    algorithm = (algorithm or ALGORITHM).lower()
+    if algorithm == "none" or len(text) < (MIN_CHARS if min_chars is None else min_chars):
+        return text, None
+    packed, encoding = pack(text.encode("utf-8"), algorithm, 0)
+    return (packed, encoding) if encoding else (text, None)
+
+
+def pack(data: bytes, algorithm: Optional[str] = None, min_size: Optional[int] = None) -> Tuple[bytes, Optional[str]]:
+    """Like compress, for bytes: (possibly compressed bytes, encoding or None)."""
+    algorithm = (algorithm or ALGORITHM).lower()
+    if algorithm == "none" or len(data) < (MIN_CHARS if min_size is None else min_size):
+        return data, None
+    if algorithm == "zstd" and _zstd():
+        packed = _zstd().ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    else:
+        algorithm = "zlib"
+        packed = zlib.compress(data, ZLIB_LEVEL)
+    if len(packed) > len(data) * 0.9:
+        return data, None
+    return packed, algorithm
+
+
+class _Identity:
+    def decompress(self, chunk: bytes) -> bytes:
+        return chunk
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def decompressor(encoding: Optional[str]):
+    """An incremental decompressor (``decompress(chunk)``/``flush()``) for streamed reads."""
+    if encoding is None:
+        return _Identity()
+    if encoding == "zlib":
+        return zlib.decompressobj()
+    if encoding == "zstd":
+        zstd = _zstd()
+        if zstd is None:
+            raise RuntimeError("Blob is zstd-compressed but the zstandard package is not installed")
+        return zstd.ZstdDecompressor().decompressobj()
+    raise ValueError(f"Unknown content encoding: {encoding}")
+
+
+def decompress(value: Union[str, bytes], encoding: Optional[str]) -> str:
+    """Inverse of compress: the original text for a stored (value, encoding)."""
+    if encoding is None:
+        return value  # type: ignore[return-value]
+    if encoding == "zlib":
+        return zlib.decompress(value).decode("utf-8")
+    if encoding == "zstd":
+        zstd = _zstd()
+        if zstd is None:
+            raise RuntimeError("Message is zstd-compressed but the zstandard package is not installed")
+        return zstd.ZstdDecompressor().decompress(value).decode("utf-8")
+    raise ValueError(f"Unknown content encoding: {encoding}")
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Tuple, Union
+
+# Connection tuning. WAL lets readers proceed while another Alfred invocation
+# writes; NORMAL sync is durable across application crashes in WAL mode.
+BUSY_TIMEOUT_MS = int(os.getenv("AIFRED_DB_BUSY_TIMEOUT_MS", "5000"))
+MMAP_SIZE = int(os.getenv("AIFRED_DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+CACHED_STATEMENTS = 256
+
+_CONNECTIONS: Dict[Tuple[str, int, int], sqlite3.Connection] = {}
+_LOCK = threading.Lock()
+
+
+def _key(path: Union[str, Path]) -> Tuple[str, int, int]:
+    return (os.path.abspath(str(path)), os.getpid(), threading.get_ident())
+
+
+def _configure(conn: sqlite3.Connection) -> None:
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    # Must precede the first write (even the WAL switch) to take effect on a
+    # new file. Only for an empty file: on an existing one it is a no-op that
+    # still waits for the write lock (`maintain` converts those).
+    if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+    except sqlite3.DatabaseError:
+        # e.g. network filesystems without shared memory; keep the default journal
+        pass
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+
+def connect(path: Union[str, Path]) -> sqlite3.Connection:
+    """Return the shared connection for ``path`` in this process/thread.
+
+    Connections are opened once, tuned (WAL, busy timeout, mmap) and then
+    reused, so sqlite3's prepared statement cache survives across calls.
+    A forked child gets its own connection because the pid is part of the key.
+    """
+    key = _key(path)
+    conn = _CONNECTIONS.get(key)
+    if conn is not None:
+        return conn
+    with _LOCK:
+        conn = _CONNECTIONS.get(key)
+        if conn is None:
+            conn = sqlite3.connect(
+                key[0],
+                timeout=BUSY_TIMEOUT_MS / 1000,
+                cached_statements=CACHED_STATEMENTS,
+            )
+            _configure(conn)
+            _CONNECTIONS[key] = conn
+    return conn
+
+
+def vacuum(conn: sqlite3.Connection, schema: str = "main") -> str:
+    """Return ``schema``'s free pages to the filesystem; returns a line for a maintain report.
+
+    A database created before auto_vacuum was enabled is converted with a
+    one-off full VACUUM, which needs the database to itself; otherwise an
+    incremental vacuum frees every page on the freelist.
+    """
+    if conn.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0] != 2:
+        conn.execute(f"PRAGMA {schema}.auto_vacuum = INCREMENTAL")
+        conn.execute(f"VACUUM {schema}")
+        return "converted to incremental auto-vacuum (full VACUUM)"
+    free = conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+    # executescript: sqlite3 steps a row-less PRAGMA only once, freeing one page
+    conn.executescript(f"PRAGMA {schema}.incremental_vacuum")
+    return f"incremental vacuum released {free} pages"
+
+
+def close(path: Union[str, Path]) -> None:
+    """Close the shared connection for ``path`` in this process/thread, if any."""
+    conn = _CONNECTIONS.pop(_key(path), None)
+    if conn is not None:
+        conn.close()
+
+
+def close_all() -> None:
+    """Close every shared connection owned by this process."""
+    pid = os.getpid()
+    with _LOCK:
+        for key in [k for k in _CONNECTIONS if k[1] == pid]:
+            _CONNECTIONS.pop(key).close()
@@ -29,6 +29,7 @@ class Directives:
     name: Optional[str] = None
     cont: bool = False
     new: bool = False
+    fork: bool = False
     tools: List[str] = field(default_factory=list)
     sys: Optional[str] = None
     pplx: Dict[str, str] = field(default_factory=dict)
@@ -42,6 +43,7 @@ class Directives:
             "name": self.name,
             "cont": self.cont,
             "new": self.new,
+            "fork": self.fork,
             "tools": self.tools or [],
             "sys": self.sys,
         }
@@ -56,7 +58,7 @@ def parse_directives(text: str) -> Tuple[str, Directives]:
     Supports:
     - @gpt-4o / @claude-3-7-sonnet (model tokens)
     - @temp:0.7, @max:1200, @provider:openai, @name:research
-    - @new, @cont
+    - @new, @cont, @fork
     - @tools:browse,code,python
     - @sys:"quoted string with spaces"
 
@@ -82,11 +84,13 @@ def parse_directives(text: str) -> Tuple[str, Directives]:
             continue
 
         # Bare flags
-        if val is None and key_l in {"new", "cont"}:
+        if val is None and key_l in {"new", "cont", "fork"}:
             if key_l == "new":
                 directives.new = True
             elif key_l == "cont":
                 directives.cont = True
+            elif key_l == "fork":
+                directives.fork = True
             remove_spans.append(m.span())
             continue
 
@@ -192,4 +196,6 @@ def summarise_directives(d: Directives) -> str:
         parts.append("new")
     if d.cont:
         parts.append("cont")
+    if d.fork:
+        parts.append("fork")
     return " | ".join(parts) if parts else "defaults"
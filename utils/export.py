@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import html
+import json
+import os
+import re
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, Iterable, Iterator, Optional
+
+FORMATS = ("jsonl", "md", "html")
+# Deflate level for zipped exports. Level 1 is ~7x faster than the default 6
+# on chat text for ~15% larger output, and compression runs in the parent,
+# so it bounds pooled throughput.
+ZIP_COMPRESSLEVEL = 1
+
+
+def iter_markdown(thread, messages: Iterable) -> Iterator[str]:
+    """Render a thread as Markdown, one chunk per message."""
+    yield (
+        f"# {thread.name or '(untitled)'}\n\nProvider: {thread.provider}  \n"
+        f"Model: {thread.model}  \nMessages: {thread.message_count}\n\n"
+    )
+    for m in messages:
+        yield f"**{m.role}**: {m.content}\n\n"
+
+
+def iter_html(thread, messages: Iterable) -> Iterator[str]:
+    """Render a thread as a standalone HTML page, one chunk per message."""
+    esc = html.escape
+    yield (
+        f"<html><body><h1>{esc(thread.name or '(untitled)')}</h1>"
+        f"<p><b>Provider:</b> {esc(thread.provider)} <b>Model:</b> {esc(thread.model)}</p>"
+    )
+    for m in messages:
+        yield f"<p><b>{esc(m.role)}</b>: {esc(m.content)}</p>"
+    yield "</body></html>"
+
+
+def iter_jsonl(thread, messages: Iterable) -> Iterator[str]:
+    """One JSON line for the thread, then one per message."""
+    yield json.dumps({
+        "type": "thread",
+        "id": thread.id,
+        "provider": thread.provider,
+        "model": thread.model,
+        "name": thread.name,
+        "created_at": thread.created_at,
+        "updated_at": thread.updated_at,
+        "message_count": thread.message_count,
+        "total_prompt_tokens": thread.total_prompt_tokens,
+        "total_completion_tokens": thread.total_completion_tokens,
+    }, ensure_ascii=False) + "\n"
+    for m in messages:
+        yield json.dumps({
+            "type": "message",
+            "id": m.id,
+            "thread_id": m.thread_id,
+            "role": m.role,
+            "content": m.content,
+            "meta": json.loads(m.meta) if m.meta else None,
+            "created_at": m.created_at,
+        }, ensure_ascii=False) + "\n"
+
+
+RENDERERS = {"jsonl": iter_jsonl, "md": iter_markdown, "html": iter_html}
+
+
+def entry_name(thread, fmt: str) -> str:
+    """Zip entry name for a thread: zero-padded id plus a filesystem-safe slug."""
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", thread.name or "").strip("-")[:60].lower()
+    return f"{thread.id:06d}-{slug or 'untitled'}.{fmt}"
+
+
+# Store of a render worker process, opened once by the pool initializer
+_STORE = None
+
+
+def _init_worker(db_path: str) -> None:
+    global _STORE
+    from store import Store
+
+    _STORE = Store(db_path)
+
+
+def _render(thread, fmt: str) -> str:
+    # Worker side: page through the thread's messages and render them
+    return "".join(RENDERERS[fmt](thread, _STORE.iter_thread_messages(thread.id)))
+
+
+def export_threads(
+    store,
+    out: IO,
+    fmt: str = "jsonl",
+    workers: int = 1,
+    profile: Optional[str] = None,
+    provider: Optional[str] = None,
+    since: Optional[str] = None,
+    before: Optional[str] = None,
+) -> int:
+    """Export every matching thread of ``store`` to ``out``; returns the thread count.
+
+    ``jsonl`` writes a single stream to ``out`` (a text file). ``md`` and
+    ``html`` write one zip entry per thread to ``out`` (a binary file).
+    Threads and messages are read in keyset pages and each rendered thread is
+    written as soon as it is ready, so memory is bounded by the in-flight
+    window (2 * ``workers`` threads), not the size of the archive. With
+    ``workers`` > 1 rendering (and its message reads, which WAL lets run
+    concurrently) happens in a process pool; output keeps thread id order.
+    """
+    if fmt not in RENDERERS:
+        raise ValueError(f"Unsupported format {fmt!r}; use one of {', '.join(FORMATS)}")
+    threads = store.iter_thread_summaries(profile=profile, provider=provider, since=since, before=before)
+    archive = zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED, compresslevel=ZIP_COMPRESSLEVEL) if fmt != "jsonl" else None
+
+    def write(thread, text: str) -> None:
+        if archive is None:
+            out.write(text)
+        else:
+            archive.writestr(entry_name(thread, fmt), text)
+
+    count = 0
+    try:
+        if workers <= 1:
+            for thread in threads:
+                if archive is None:
+                    # No pool: stream chunk by chunk, even within a thread
+                    for chunk in RENDERERS[fmt](thread, store.iter_thread_messages(thread.id)):
+                        out.write(chunk)
+                else:
+                    with archive.open(entry_name(thread, fmt), "w") as entry:
+                        for chunk in RENDERERS[fmt](thread, store.iter_thread_messages(thread.id)):
+                            entry.write(chunk.encode("utf-8"))
+                count += 1
+            return count
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(os.fspath(store.db_path),)) as pool:
+            in_flight: deque = deque()
+            for thread in threads:
+                if len(in_flight) >= workers * 2:
+                    done_thread, future = in_flight.popleft()
+                    write(done_thread, future.result())
+                    count += 1
+                in_flight.append((thread, pool.submit(_render, thread, fmt)))
+            while in_flight:
+                done_thread, future = in_flight.popleft()
+                write(done_thread, future.result())
+                count += 1
+        return count
+    finally:
+        if archive is not None:
+            archive.close()
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import fcntl
+import os
+import socket
+from typing import Callable
+
+# Resident Script Filter (AIFRED_FILTER_DAEMON=1). Alfred starts a Python
+# process per keystroke; the daemon keeps the imported modules, the config
+# and the SQLite connection of one such process alive and answers later
+# keystrokes over a Unix socket. The client side is alfred_filter_client.py.
+# One connection per query: the client sends the query and shuts down its
+# write side; the daemon replies with the Script Filter JSON and closes.
+
+IDLE_S = float(os.getenv("AIFRED_FILTER_DAEMON_IDLE", "600"))
+REPLY_TIMEOUT_S = 2.0
+
+
+def serve(path: str, handler: Callable[[str], str], idle: float = IDLE_S) -> None:
+    """Answer queries at ``path`` with ``handler`` until none arrives for ``idle`` seconds.
+
+    A flock on ``<path>.lock`` held for the daemon's lifetime makes it the
+    only one: when two keystrokes both spawn one, the second returns at once.
+    A handler error closes that connection without a reply, so the client
+    falls back to running in-process.
+    """
+    lock_fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        # Left behind by a daemon that was killed
+        _unlink(path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o077)
+        try:
+            sock.bind(path)
+        finally:
+            os.umask(umask)
+        with sock:
+            sock.listen(16)
+            sock.settimeout(idle)
+            try:
+                while True:
+                    try:
+                        conn, _ = sock.accept()
+                    except socket.timeout:
+                        break
+                    with conn:
+                        try:
+                            conn.settimeout(REPLY_TIMEOUT_S)
+                            query = _read_all(conn).decode("utf-8")
+                            conn.sendall(handler(query).encode("utf-8"))
+                        except Exception:
+                            pass
+            finally:
+                _unlink(path)
+    finally:
+        os.close(lock_fd)  # releases the lock
+
+
+def _read_all(conn: socket.socket) -> bytes:
+    chunks = []
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
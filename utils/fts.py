@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+import re
+from typing import Optional
+
+_FTS_TOKEN = re.compile(r'\w+\*?', re.UNICODE)
+
+
+def fts_query(query: str) -> Optional[str]:
+    """Turn free text into a safe FTS5 MATCH expression.
+
+    Every word becomes a quoted term (so punctuation cannot break the query
+    syntax). ``word*`` is a prefix query, and the last word is always matched as
+    a prefix so partially typed input still finds results.
+    """
+    tokens = _FTS_TOKEN.findall(query or '')
+    if not tokens:
+        return None
+    terms = []
+    for i, token in enumerate(tokens):
+        word = token.rstrip('*')
+        prefix = token.endswith('*') or i == len(tokens) - 1
+        terms.append(f'"{word}"' + ('*' if prefix else ''))
+    return ' '.join(terms)
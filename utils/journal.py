@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+# Failed applies before an entry is moved aside (see drain)
+MAX_ATTEMPTS = 3
+
+
+def _encode(entry: dict) -> bytes:
+    return (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _append(path: str, data: bytes) -> None:
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        os.write(fd, data)
+        os.fsync(fd)
+    finally:
+        os.close(fd)  # releases the lock
+
+
+def append(path: Union[str, Path], entry: dict) -> str:
+    """Durably append ``entry`` to the journal at ``path``; returns its id.
+
+    The line is written and fsynced under an exclusive lock, so once this
+    returns the entry survives a crash and is never interleaved with another
+    writer's line.
+    """
+    entry = dict(entry, id=uuid.uuid4().hex, created=time.time())
+    _append(str(path), _encode(entry))
+    return entry["id"]
+
+
+def pending(path: Union[str, Path]) -> bool:
+    """True if the journal has entries (a single stat when it doesn't)."""
+    try:
+        return os.stat(path).st_size > 0
+    except FileNotFoundError:
+        return False
+
+
+def drain(
+    path: Union[str, Path],
+    apply: Callable[[dict], None],
+    on_error: Optional[Callable[[dict, Exception], None]] = None,
+    max_attempts: int = MAX_ATTEMPTS,
+) -> int:
+    """Apply every journal entry in order, then empty the journal; returns the count applied.
+
+    Holds the journal lock throughout, so appends wait and two drainers never
+    interleave. ``apply`` must be idempotent on the entry ``id``: a crash after
+    applying but before the truncate replays those entries next time. A torn
+    final line (a crash mid-append) is skipped. An entry whose ``apply``
+    raises is reported to ``on_error`` and kept for the next drain, so it
+    never blocks the entries after it; after ``max_attempts`` failures it is
+    moved to ``<path>.failed``.
+    """
+    try:
+        fd = os.open(str(path), os.O_RDWR)
+    except FileNotFoundError:
+        return 0
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        with os.fdopen(os.dup(fd), "rb") as f:
+            data = f.read()
+        count = 0
+        kept, failed = [], []
+        for line in data.splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            try:
+                apply(entry)
+            except Exception as exc:
+                if on_error is not None:
+                    on_error(entry, exc)
+                entry["attempts"] = entry.get("attempts", 0) + 1
+                (failed if entry["attempts"] >= max_attempts else kept).append(_encode(entry))
+                continue
+            count += 1
+        if failed:
+            _append(str(path) + ".failed", b"".join(failed))
+        # Rewritten in place: appenders wait on this file's lock, so it must
+        # stay the same file
+        os.ftruncate(fd, 0)
+        if kept:
+            os.pwrite(fd, b"".join(kept), 0)
+        os.fsync(fd)
+        return count
+    finally:
+        os.close(fd)
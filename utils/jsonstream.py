@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Callable, IO, Iterator, Tuple
+
+_WS = " \t\r\n"
+_DECODER = json.JSONDecoder()
+
+# Everything up to the next bracket outside a string, strings included, in
+# one C-level match: the scanner's Python loop runs once per bracket, not
+# per character or token. Written unrolled ("normal* (special normal*)*") so
+# a string cut at the end of the buffer fails in linear time.
+_SKIP = re.compile(r'[^"\[\]{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"\[\]{}]*)*', re.S)
+_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_SCALAR = re.compile(r'[^\s,\]]*')
+
+
+class _Incomplete(Exception):
+    """The element may continue past the end of the buffer."""
+
+
+def _decode(buf: str, pos: int, eof: bool) -> Tuple[Any, int]:
+    # The element's value and end
+    try:
+        value, end = _DECODER.raw_decode(buf, pos)
+    except json.JSONDecodeError:
+        if eof:
+            raise ValueError("Unexpected end of JSON array")
+        raise _Incomplete
+    # A number cut by the chunk boundary decodes short, so only trust the
+    # end once a delimiter (or end of input) follows it
+    if not eof and (end >= len(buf) or buf[end] not in _WS + ",]"):
+        raise _Incomplete
+    return value, end
+
+
+def _scan(buf: str, pos: int, eof: bool) -> Tuple[None, int]:
+    # The element's end, found by matching brackets outside strings without
+    # building its value
+    if buf[pos] in "[{":
+        depth, i = 0, pos
+        while True:
+            i = _SKIP.match(buf, i).end()
+            if i == len(buf) or buf[i] == '"':
+                # Out of input, or inside a string cut by the boundary
+                break
+            depth += 1 if buf[i] in "[{" else -1
+            i += 1
+            if depth == 0:
+                return None, i
+    else:
+        m = (_STRING if buf[pos] == '"' else _SCALAR).match(buf, pos)
+        if m and (m.end() < len(buf) or eof) and m.end() > pos:
+            return None, m.end()
+    if eof:
+        raise ValueError("Unexpected end of JSON array")
+    raise _Incomplete
+
+
+def _iter_elements(fp: IO[str], chunk_size: int, read: Callable[[str, int, bool], Tuple[Any, int]]) -> Iterator[Tuple[Any, str]]:
+    buf = fp.read(chunk_size)
+    pos = 0
+    eof = not buf
+
+    def _more() -> None:
+        # Drop consumed text and append the next chunk. Reads grow with the
+        # pending element so re-parsing a huge element stays amortised linear.
+        nonlocal buf, pos, eof
+        chunk = fp.read(max(chunk_size, len(buf) - pos))
+        eof = not chunk
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def _skip_ws() -> bool:
+        # Advance to the next significant character; False at end of input
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in _WS:
+                pos += 1
+            if pos < len(buf):
+                return True
+            if eof:
+                return False
+            _more()
+
+    if not _skip_ws() or buf[pos] != "[":
+        raise ValueError("Expected a JSON array at top level")
+    pos += 1
+
+    first = True
+    while True:
+        if not _skip_ws():
+            raise ValueError("Unexpected end of JSON array")
+        if buf[pos] == "]":
+            return
+        if not first:
+            if buf[pos] != ",":
+                raise ValueError(f"Expected ',' in JSON array, found {buf[pos]!r}")
+            pos += 1
+            if not _skip_ws():
+                raise ValueError("Unexpected end of JSON array")
+        first = False
+
+        while True:
+            try:
+                value, end = read(buf, pos, eof)
+                break
+            except _Incomplete:
+                _more()
+        yield value, buf[pos:end]
+        pos = end
+
+
+def iter_array(fp: IO[str], chunk_size: int = 1 << 20) -> Iterator[Any]:
+    """Yield each parsed element of a top-level JSON array, streaming from ``fp``.
+
+    Reads ``fp`` in chunks, so memory is bounded by the largest single element
+    rather than the whole document (a multi-GB ChatGPT export is held one
+    conversation at a time).
+    """
+    for value, _ in _iter_elements(fp, chunk_size, _decode):
+        yield value
+
+
+def iter_array_items(fp: IO[str], chunk_size: int = 1 << 20) -> Iterator[Tuple[Any, str]]:
+    """Like iter_array, but yield (parsed element, its JSON text exactly as in the file).
+
+    Each element is decoded once; the text comes from the same pass, for
+    callers that hash it but still need the value.
+    """
+    return _iter_elements(fp, chunk_size, _decode)
+
+
+def iter_array_raw(fp: IO[str], chunk_size: int = 1 << 20) -> Iterator[str]:
+    """Like iter_array, but yield each element's JSON text exactly as in the file.
+
+    Elements are delimited by matching brackets outside strings, not parsed,
+    so the text can be hashed or handed to another process at a fraction of
+    the cost of decoding it. The text is not validated: a malformed element
+    fails only when its consumer parses it.
+    """
+    for _, raw in _iter_elements(fp, chunk_size, _scan):
+        yield raw
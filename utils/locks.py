@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional, Tuple, Union
+
+# One lock file per key, named after a hash of it, so unrelated keys never
+# wait on each other. The holder deletes the file on release, and a file
+# left by a crashed holder is swept once it is STALE_S old, so the lock
+# directory holds only the locks in use.
+POLL_S = 0.05
+STALE_S = 3600.0
+
+
+class LockTimeout(TimeoutError):
+    pass
+
+
+def _digest(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+def _acquire(fd: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                raise LockTimeout(f"Lock still held after {timeout:g}s")
+            time.sleep(POLL_S)
+
+
+def _open(lock_dir: Union[str, Path], name: str) -> int:
+    Path(lock_dir).mkdir(parents=True, exist_ok=True)
+    return os.open(os.path.join(str(lock_dir), name), os.O_RDWR | os.O_CREAT, 0o600)
+
+
+def _is_current(fd: int, path: str) -> bool:
+    # False once the file we locked was deleted (or replaced) by its last holder
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    own = os.fstat(fd)
+    return (st.st_dev, st.st_ino) == (own.st_dev, own.st_ino)
+
+
+def _lock_file(lock_dir: Union[str, Path], name: str, timeout: float) -> Tuple[int, bool]:
+    """Lock the file ``name``: (its fd, whether we had to wait).
+
+    A holder deletes the file before releasing it, so a waiter can wake up
+    holding a lock on a deleted file; it then locks the path's new file.
+    """
+    path = os.path.join(str(lock_dir), name)
+    deadline = time.monotonic() + timeout
+    waited = False
+    while True:
+        fd = _open(lock_dir, name)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                waited = True
+                _acquire(fd, max(0.0, deadline - time.monotonic()))
+            if _is_current(fd, path):
+                return fd, waited
+        except BaseException:
+            os.close(fd)
+            raise
+        os.close(fd)
+
+
+def _release(lock_dir: Union[str, Path], name: str, fd: int) -> None:
+    # Delete while still holding the lock: see _lock_file
+    try:
+        os.unlink(os.path.join(str(lock_dir), name))
+    except FileNotFoundError:
+        pass
+    os.close(fd)
+    _sweep(lock_dir)
+
+
+def _sweep(lock_dir: Union[str, Path]) -> None:
+    # Lock files left by holders that died are deleted once stale, under
+    # their own lock so a live holder (or a waiter) is never disturbed
+    now = time.time()
+    for path in glob.glob(os.path.join(str(lock_dir), "*.lock")):
+        try:
+            if now - os.stat(path).st_mtime < STALE_S:
+                continue
+            fd = os.open(path, os.O_RDWR)
+        except OSError:
+            continue
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            if _is_current(fd, path):
+                os.unlink(path)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+@contextmanager
+def lock(lock_dir: Union[str, Path], key: str, timeout: float) -> Iterator[None]:
+    """Hold the advisory lock for ``key`` (across processes), waiting at most ``timeout`` seconds.
+
+    Raises LockTimeout if it can't be had in time. The lock is released when
+    the block exits or the process dies, so a crash never leaves it stuck.
+    """
+    name = f"lock-{_digest(key)}.lock"
+    fd, _ = _lock_file(lock_dir, name, timeout)
+    try:
+        yield
+    finally:
+        _release(lock_dir, name, fd)
+
+
+class Flight:
+    """One caller's view of a singleflight call (see singleflight)."""
+
+    def __init__(self, key: str, result_path: str, result: Optional[dict] = None) -> None:
+        self.key = key
+        self.result = result
+        self._result_path = result_path
+
+    @property
+    def leader(self) -> bool:
+        return self.result is None
+
+    def publish(self, result: dict) -> None:
+        """Hand ``result`` to the callers waiting on this flight (leader only)."""
+        tmp = f"{self._result_path}.{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"key": self.key, "result": result}, f)
+        os.replace(tmp, self._result_path)
+
+
+@contextmanager
+def singleflight(lock_dir: Union[str, Path], key: str, timeout: float, ttl: float = 60.0) -> Iterator[Flight]:
+    """Deduplicate identical in-flight work across processes.
+
+    The first caller for ``key`` is the leader (``flight.leader``): it does the
+    work and calls ``flight.publish(result)`` before leaving the block.
+    Callers arriving while it is in flight wait (at most ``timeout``) and get
+    ``flight.result`` instead. A key that is not in flight always gets a new
+    leader, so results are shared only between overlapping calls. If the
+    leader fails without publishing, the waiter becomes the leader.
+    """
+    name = f"flight-{_digest(key)}"
+    result_path = os.path.join(str(lock_dir), f"{name}.json")
+    fd, waited = _lock_file(lock_dir, f"{name}.lock", timeout)
+    try:
+        result = _read_result(result_path, key, ttl) if waited else None
+        if result is None:
+            _remove_expired(lock_dir, result_path, ttl)
+        yield Flight(key, result_path, result)
+    finally:
+        _release(lock_dir, f"{name}.lock", fd)
+
+
+def _remove_expired(lock_dir: Union[str, Path], own: str, ttl: float) -> None:
+    # A new leader drops its key's previous result and any that have expired
+    now = time.time()
+    for path in glob.glob(os.path.join(str(lock_dir), "flight-*.json")):
+        try:
+            if path == own or now - os.stat(path).st_mtime > ttl:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _read_result(path: str, key: str, ttl: float) -> Optional[dict]:
+    try:
+        if time.time() - os.stat(path).st_mtime > ttl:
+            return None
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data["result"] if data.get("key") == key else None
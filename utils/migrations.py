@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import sqlite3
+from typing import Callable, Iterator, Sequence
+
+Migration = Callable[[sqlite3.Connection], None]
+
+
+def statements(script: str) -> Iterator[str]:
+    """Split an SQL script into complete statements (trigger bodies stay whole).
+
+    Lets a migration run a multi-statement script inside its own transaction;
+    ``executescript`` would commit first.
+    """
+    buf = ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            if buf.strip():
+                yield buf.strip()
+            buf = ""
+    if buf.strip():
+        raise ValueError(f"Incomplete SQL statement: {buf.strip()[:60]!r}")
+
+
+def migrate(conn: sqlite3.Connection, migrations: Sequence[Migration], schema: str = "main") -> int:
+    """Bring ``schema`` up to ``len(migrations)``, recorded in PRAGMA user_version.
+
+    Migration ``i`` (0-based) moves the schema from version ``i`` to ``i + 1``.
+    An up-to-date database costs a single pragma read. Otherwise each pending
+    step runs in its own BEGIN IMMEDIATE transaction together with the
+    version bump, so a crash leaves a consistent version and concurrent
+    openers apply each step exactly once. Returns the number of steps applied.
+    """
+    target = len(migrations)
+    version = conn.execute(f"PRAGMA {schema}.user_version").fetchone()[0]
+    if version >= target:
+        return 0
+    applied = 0
+    if conn.in_transaction:
+        conn.commit()
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-read under the write lock: another process may have migrated
+            version = conn.execute(f"PRAGMA {schema}.user_version").fetchone()[0]
+            if version >= target:
+                conn.rollback()
+                return applied
+            migrations[version](conn)
+            conn.execute(f"PRAGMA {schema}.user_version = {version + 1}")
+            conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        applied += 1
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from store import LATENCY_BUCKETS_MS
+
+# Reporting windows, in days back from today (inclusive)
+WINDOWS = (("today", 1), ("7 days", 7), ("30 days", 30))
+
+
+class Totals:
+    """Usage summed over usage_rollup rows (see Store.usage_rollup)."""
+
+    __slots__ = ("requests", "errors", "prompt_tokens", "completion_tokens", "latency_ms_sum", "latency_count", "buckets")
+
+    def __init__(self, n_buckets: int) -> None:
+        self.requests = self.errors = self.prompt_tokens = self.completion_tokens = 0
+        self.latency_ms_sum = self.latency_count = 0
+        self.buckets = [0] * n_buckets
+
+    def add(self, row) -> None:
+        self.requests += row.requests
+        self.errors += row.errors
+        self.prompt_tokens += row.prompt_tokens
+        self.completion_tokens += row.completion_tokens
+        self.latency_ms_sum += row.latency_ms_sum
+        self.latency_count += row.latency_count
+        for i, n in enumerate(row.latency_buckets):
+            self.buckets[i] += n
+
+    @property
+    def avg_latency_ms(self) -> Optional[float]:
+        return self.latency_ms_sum / self.latency_count if self.latency_count else None
+
+    def percentile_bound(self, q: float, bounds: Sequence[int]) -> Optional[str]:
+        """The histogram bucket holding the ``q`` quantile, as a label ("≤3s", ">30s")."""
+        if not self.latency_count:
+            return None
+        rank, seen = q * self.latency_count, 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return f"≤{bounds[i] / 1000:g}s" if i < len(bounds) else f">{bounds[-1] / 1000:g}s"
+        return None
+
+
+def summarise(rows: Iterable, n_buckets: int) -> Tuple[Totals, Dict[Tuple[str, str], Totals]]:
+    """Overall totals and totals per (provider, model)."""
+    total = Totals(n_buckets)
+    per_model: Dict[Tuple[str, str], Totals] = {}
+    for row in rows:
+        total.add(row)
+        key = (row.provider, row.model)
+        if key not in per_model:
+            per_model[key] = Totals(n_buckets)
+        per_model[key].add(row)
+    return total, per_model
+
+
+def window_start(days: int, today: Optional[date] = None) -> str:
+    """First day (``YYYY-MM-DD``, UTC) of a window of ``days`` days ending today."""
+    today = today or datetime.now(timezone.utc).date()
+    return (today - timedelta(days=days - 1)).isoformat()
+
+
+def describe(t: Totals, bounds: Sequence[int]) -> str:
+    """One line: requests, errors, tokens and latency."""
+    line = f"{t.requests} requests"
+    if t.errors:
+        line += f", {t.errors} errors"
+    line += f", {t.prompt_tokens:,} in / {t.completion_tokens:,} out tokens"
+    if t.avg_latency_ms is not None:
+        line += f", avg {t.avg_latency_ms / 1000:.1f}s, p50 {t.percentile_bound(0.5, bounds)}, p95 {t.percentile_bound(0.95, bounds)}"
+    return line
+
+
+def report(store, days: int = 30, profile: Optional[str] = None, today: Optional[date] = None) -> List[str]:
+    """Text report: one line per window, then per model over the last ``days`` days."""
+    n_buckets = len(LATENCY_BUCKETS_MS) + 1
+    span = max([days] + [d for _, d in WINDOWS])
+    rows = store.usage_rollup(since=window_start(span, today), profile=profile)
+    lines = []
+    for label, window in WINDOWS:
+        start = window_start(window, today)
+        total, _ = summarise((r for r in rows if r.day >= start), n_buckets)
+        lines.append(f"{label:<8} {describe(total, LATENCY_BUCKETS_MS)}")
+    start = window_start(days, today)
+    _, per_model = summarise((r for r in rows if r.day >= start), n_buckets)
+    if per_model:
+        lines.append(f"By model, last {days} days:")
+        for (provider, model), t in sorted(per_model.items(), key=lambda kv: -kv[1].requests):
+            lines.append(f"  {provider} {model or '(unknown)'}: {describe(t, LATENCY_BUCKETS_MS)}")
+    return lines
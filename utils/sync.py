@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import socket
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple, Union
+
+# Change batches in a shared folder (iCloud Drive, Dropbox, a network share):
+#   <folder>/<database>/<device>/<last seq>.jsonl
+# Each device writes only its own directory and reads everyone else's, so
+# nothing is ever written by two machines. A batch file is a header line,
+# then one {"thread": ...} or {"message": ...} record per line.
+
+
+def device_name() -> str:
+    """This machine's directory name: AIFRED_SYNC_DEVICE, else the host name."""
+    name = os.getenv("AIFRED_SYNC_DEVICE") or socket.gethostname().split(".")[0]
+    return re.sub(r"[^A-Za-z0-9_-]", "_", name) or "device"
+
+
+def write_batch(folder: Union[str, Path], database: str, device: str, first: int, last: int, records: Iterable[dict]) -> int:
+    """Write the batch of changes (``first``, ``last``] and return its record count.
+
+    Written under a temporary name and renamed, so a reader (or a sync
+    client uploading the folder) never sees a partial batch.
+    """
+    directory = Path(folder) / database / device
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{last:012d}.jsonl"
+    tmp = directory / f".{path.name}.tmp"
+    count = 0
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"device": device, "first": first, "last": last}) + "\n")
+        for record in records:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+            count += 1
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return count
+
+
+def peers(folder: Union[str, Path], database: str, device: str) -> List[str]:
+    """Other devices that have written batches of ``database``."""
+    root = Path(folder) / database
+    if not root.is_dir():
+        return []
+    return sorted(p.name for p in root.iterdir() if p.is_dir() and p.name != device)
+
+
+def batches(folder: Union[str, Path], database: str, device: str, after: int) -> Iterator[Tuple[int, Path]]:
+    """``device``'s batches ending after sequence ``after``, oldest first, as (last seq, path)."""
+    found = []
+    for path in (Path(folder) / database / device).glob("*.jsonl"):
+        if path.stem.isdigit() and int(path.stem) > after:
+            found.append((int(path.stem), path))
+    yield from sorted(found)
+
+
+def read_batch(path: Union[str, Path]) -> Tuple[dict, List[dict]]:
+    """A batch's header and records."""
+    with open(path, encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        return header, [json.loads(line) for line in f if line.strip()]
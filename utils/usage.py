@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from typing import Dict, Optional
+
+# Provider usage shapes, mapped onto the canonical keys stored in
+# messages.meta (and read back by the generated columns in store.py)
+_ALIASES = {
+    "prompt_tokens": ("prompt_tokens", "input_tokens", "promptTokenCount"),
+    "completion_tokens": ("completion_tokens", "output_tokens", "candidatesTokenCount"),
+    "total_tokens": ("total_tokens", "totalTokenCount"),
+}
+
+
+def normalise(usage: Optional[dict]) -> Dict[str, int]:
+    """Canonical ``prompt_tokens``/``completion_tokens``/``total_tokens`` from any provider's usage dict.
+
+    OpenAI, OpenRouter and Perplexity report ``prompt_tokens``, Anthropic
+    ``input_tokens``, Gemini ``promptTokenCount``. Counts a provider didn't
+    report are left out rather than stored as 0; ``total_tokens`` is derived
+    when both parts are known. Already-canonical input comes back unchanged.
+    """
+    out: Dict[str, int] = {}
+    if not isinstance(usage, dict):
+        return out
+    for key, aliases in _ALIASES.items():
+        for alias in aliases:
+            value = usage.get(alias)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                out[key] = int(value)
+                break
+    if "total_tokens" not in out and "prompt_tokens" in out and "completion_tokens" in out:
+        out["total_tokens"] = out["prompt_tokens"] + out["completion_tokens"]
+    return out